@@ -0,0 +1,186 @@
+"""
+Correlation Engine - 睡眠・体表温・栄養・カロリー収支と体脂肪変化のラグ相関
+全指標ペア × ラグ0〜14日の相関を、欠損を考慮した FFT 相互相関で一括計算する。
+結果はデータバージョン（入力値のハッシュ）が変わるまで reports/correlation_cache.json を再利用
+"""
+
+import argparse
+import hashlib
+import json
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+
+class LaggedCorrelationEngine:
+    """全指標ペアのラグ相関（x が y に lag 日先行: corr(x[t], y[t+lag])）"""
+
+    DEFAULT_METRICS = [
+        '睡眠時間_hours', '体表温偏差_celsius', 'タンパク質_g', '糖質_g', '脂質_g', '食物繊維_g',
+        '摂取カロリー_kcal', 'カロリー収支_kcal', '活動カロリー_kcal', '歩数',
+        '体重変化_kg', '体脂肪量変化_kg',
+    ]
+
+    # 日次変化として派生させる指標（7日移動平均の前日差）
+    DERIVED_CHANGES = {
+        '体重変化_kg': '体重_kg_ma7',
+        '体脂肪量変化_kg': '体脂肪量_kg_ma7',
+    }
+
+    def __init__(self, reports_dir: str = "reports", metrics: list = None,
+                 max_lag: int = 14, min_pairs: int = 10):
+        self.reports_dir = Path(reports_dir)
+        self.cache_file = self.reports_dir / "correlation_cache.json"
+        self.metrics = metrics or self.DEFAULT_METRICS
+        self.max_lag = max_lag
+        self.min_pairs = min_pairs
+
+    # ===== 入力 =====
+
+    def _matrix(self, df: pd.DataFrame):
+        """暦日で連続化した (指標名, 値行列 M×T)。派生列は移動平均の前日差"""
+        frame = df.copy()
+        frame['date'] = pd.to_datetime(frame['date'])
+        frame = frame.drop_duplicates('date', keep='last').set_index('date').sort_index()
+        frame = frame.reindex(pd.date_range(frame.index.min(), frame.index.max(), freq='D'))
+
+        for name, source in self.DERIVED_CHANGES.items():
+            if name in self.metrics and source in frame.columns:
+                frame[name] = pd.to_numeric(frame[source], errors='coerce').diff()
+
+        metrics = [m for m in self.metrics if m in frame.columns]
+        values = frame[metrics].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float).T
+        return metrics, values, frame.index
+
+    def data_version(self, df: pd.DataFrame) -> str:
+        """入力値（日付＋対象指標）のハッシュ"""
+        metrics, values, dates = self._matrix(df)
+        digest = hashlib.sha1()
+        digest.update(json.dumps([metrics, self.max_lag, self.min_pairs], ensure_ascii=False).encode('utf-8'))
+        digest.update(dates.to_numpy(dtype='datetime64[D]').tobytes())
+        digest.update(np.nan_to_num(values, nan=np.inf).tobytes())
+        return digest.hexdigest()
+
+    # ===== 計算 =====
+
+    def _cross_sums(self, a: np.ndarray, b: np.ndarray, length: int) -> np.ndarray:
+        """全ペアの相互和 Σ_t a_i[t]·b_j[t+k]（k=0..max_lag）を FFT で一括計算 → M×M×(L+1)"""
+        fa = np.fft.rfft(a, n=length, axis=1)
+        fb = np.fft.rfft(b, n=length, axis=1)
+        sums = np.fft.irfft(np.conj(fa)[:, None, :] * fb[None, :, :], n=length, axis=2)
+        return sums[:, :, :self.max_lag + 1]
+
+    def compute(self, values: np.ndarray) -> dict:
+        """欠損を除いたペアごとのピアソン相関（全ペア・全ラグ）
+
+        Returns:
+            {'correlation': M×M×(L+1), 'pairs': M×M×(L+1)（有効ペア数）}
+        """
+        mask = ~np.isnan(values)
+        # 数値誤差を抑えるため指標ごとに中心化
+        with np.errstate(invalid='ignore'):
+            centered = values - np.nanmean(np.where(mask, values, np.nan), axis=1, keepdims=True)
+        x = np.where(mask, centered, 0.0)
+        m = mask.astype(float)
+
+        length = 1 << int(np.ceil(np.log2(values.shape[1] + self.max_lag + 1)))
+        n = np.rint(self._cross_sums(m, m, length))
+        sx = self._cross_sums(x, m, length)
+        sy = self._cross_sums(m, x, length)
+        sxx = self._cross_sums(x * x, m, length)
+        syy = self._cross_sums(m, x * x, length)
+        sxy = self._cross_sums(x, x, length)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cov = n * sxy - sx * sy
+            var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+            r = cov / np.sqrt(np.where(var > 1e-12, var, np.nan))
+        r = np.where(n >= self.min_pairs, np.clip(r, -1.0, 1.0), np.nan)
+        return {'correlation': r, 'pairs': n.astype(int)}
+
+    # ===== キャッシュ付き公開API =====
+
+    def _load_cache(self) -> dict:
+        if not self.cache_file.exists():
+            return {}
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[ERROR] 相関キャッシュ読み込みエラー: {e}")
+            return {}
+
+    def _save_cache(self, cache: dict):
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False)
+        except Exception as e:
+            print(f"[ERROR] 相関キャッシュ保存エラー: {e}")
+
+    def get_correlations(self, df: pd.DataFrame) -> dict:
+        """ラグ相関（データバージョンが前回と同じならキャッシュを返す）
+
+        Returns:
+            {'data_version', 'metrics', 'lags', 'correlation', 'pairs'}
+        """
+        if df.empty:
+            return {}
+
+        version = self.data_version(df)
+        cache = self._load_cache()
+        if cache.get('data_version') == version:
+            return cache
+
+        metrics, values, _ = self._matrix(df)
+        result = self.compute(values)
+        cache = {
+            'data_version': version,
+            'metrics': metrics,
+            'lags': list(range(self.max_lag + 1)),
+            'correlation': np.round(result['correlation'], 4).tolist(),
+            'pairs': result['pairs'].tolist(),
+        }
+        # NaN は JSON 非対応のため None で保存
+        cache['correlation'] = [[[None if pd.isna(v) else v for v in lags] for lags in row]
+                                for row in cache['correlation']]
+        self._save_cache(cache)
+        print(f"[INFO] ラグ相関計算完了: {len(metrics)}指標 × ラグ0〜{self.max_lag}日")
+        return cache
+
+    def top_relationships(self, df: pd.DataFrame, target: str = '体脂肪量変化_kg', limit: int = 10) -> list:
+        """target に先行する指標との相関を絶対値の大きい順に返す（ラグは各指標で最大のもの）"""
+        result = self.get_correlations(df)
+        if not result or target not in result['metrics']:
+            return []
+
+        j = result['metrics'].index(target)
+        relationships = []
+        for i, metric in enumerate(result['metrics']):
+            if metric == target:
+                continue
+            lags = [(lag, r, result['pairs'][i][j][lag])
+                    for lag, r in enumerate(result['correlation'][i][j]) if r is not None]
+            if not lags:
+                continue
+            lag, r, pairs = max(lags, key=lambda item: abs(item[1]))
+            relationships.append({'metric': metric, 'target': target, 'lag_days': lag,
+                                  'correlation': r, 'pairs': pairs})
+
+        return sorted(relationships, key=lambda item: abs(item['correlation']), reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='指標間のラグ相関を計算')
+    parser.add_argument('--reports-dir', default=str(Path(__file__).parent / "reports"))
+    parser.add_argument('--target', default='体脂肪量変化_kg')
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    engine = LaggedCorrelationEngine(args.reports_dir)
+    ma_df = pd.read_csv(Path(args.reports_dir) / "7日移動平均データ.csv", encoding='utf-8-sig')
+    for item in engine.top_relationships(ma_df, args.target, args.limit):
+        print(f"{item['metric']:<16} ラグ{item['lag_days']:>2}日  r={item['correlation']:+.3f}  (n={item['pairs']})")
+
+
+if __name__ == "__main__":
+    main()
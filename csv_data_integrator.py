@@ -9,6 +9,14 @@ from datetime import datetime, date
 from pathlib import Path
 import os
 from hae_data_converter import HAEDataConverter
+from kalman_smoother import KalmanSmoother
+from plateau_detector import PlateauDetector
+from outlier_detector import OutlierDetector
+from tdee_estimator import TDEEEstimator
+from seasonality import WeekdaySeasonality
+from rollup_tables import RollupTables
+from workout_store import WorkoutStore
+from training_load import TrainingLoadModel
 
 class CSVDataIntegrator:
     """HAEデータを既存CSVに統合するクラス"""
@@ -16,6 +24,14 @@ class CSVDataIntegrator:
     def __init__(self, reports_dir: str = "reports"):
         self.reports_dir = Path(reports_dir)
         self.converter = HAEDataConverter()
+        self.smoother = KalmanSmoother(str(self.reports_dir))
+        self.plateau_detector = PlateauDetector(str(self.reports_dir))
+        self.outlier_detector = OutlierDetector(str(self.reports_dir))
+        self.tdee_estimator = TDEEEstimator()
+        self.seasonality = WeekdaySeasonality()
+        self.rollups = RollupTables(str(self.reports_dir))
+        self.workout_store = WorkoutStore(str(self.reports_dir))
+        self.training_load = TrainingLoadModel(str(self.reports_dir))
         
         # CSVファイルパス
         self.daily_csv = self.reports_dir / "日次データ.csv"
@@ -65,17 +81,38 @@ class CSVDataIntegrator:
         Returns:
             成功: True, 失敗: False
         """
-        target_date = hae_row.get('date')
-        if not target_date:
+        if not hae_row.get('date'):
             print("[ERROR] 日付データが見つかりません")
             return False
-            
-        print(f"[INFO] データ追加開始: {target_date}")
+        return self.add_hae_rows_to_csv([hae_row], include_oura)
+
+    def add_hae_rows_to_csv(self, hae_rows: list, include_oura: bool = True) -> bool:
+        """複数日分のHAEデータを既存CSVに一括追加（上書き）し、移動平均は1回だけ再計算
         
-        # データ境界チェック
-        if not self.is_data_boundary_date(target_date):
-            print(f"[WARNING] {target_date}はXMLデータ期間です（8/9以前）")
+        Args:
+            hae_rows: 変換済みHAEデータ（日付ごとの行）
+            include_oura: Oura体表温データを取得するか
+            
+        Returns:
+            成功: True, 失敗: False
+        """
+        rows = []
+        for hae_row in hae_rows:
+            target_date = hae_row.get('date')
+            if not target_date:
+                print("[ERROR] 日付データが見つかりません")
+                continue
+            # データ境界チェック
+            if not self.is_data_boundary_date(target_date):
+                print(f"[WARNING] {target_date}はXMLデータ期間です（8/9以前）")
+                continue
+            rows.append(dict(hae_row))
+
+        if not rows:
             return False
+
+        target_dates = [row['date'] for row in rows]
+        print(f"[INFO] データ追加開始: {len(rows)}日分 ({min(target_dates)} 〜 {max(target_dates)})")
             
         # 既存データ読み込み
         daily_df = self.load_existing_csv(self.daily_csv)
@@ -84,21 +121,22 @@ class CSVDataIntegrator:
             print("[ERROR] 既存の日次データが見つかりません")
             return False
             
-        # 重複チェック
-        if self.check_data_exists(daily_df, target_date):
-            print(f"[WARNING] {target_date}のデータは既に存在します。上書きします。")
-            # 既存行を削除
-            daily_df = daily_df[daily_df['date'] != target_date]
+        # 重複チェック（既存行は削除して上書き）
+        overwritten = daily_df['date'].isin(target_dates)
+        if overwritten.any():
+            print(f"[WARNING] {int(overwritten.sum())}日分のデータは既に存在します。上書きします。")
+            daily_df = daily_df[~overwritten]
             
         # Oura体表温データを統合（オプション）
         if include_oura:
-            oura_data = self.get_oura_temperature_data(target_date)
-            if oura_data:
-                hae_row.update(oura_data)
+            for row in rows:
+                oura_data = self.get_oura_temperature_data(row['date'])
+                if oura_data:
+                    row.update(oura_data)
                 
-        # 新しい行を追加
-        new_row = pd.DataFrame([hae_row])
-        updated_df = pd.concat([daily_df, new_row], ignore_index=True)
+        # 新しい行を追加（同一日付は後の行を優先）
+        new_rows = pd.DataFrame(rows).drop_duplicates('date', keep='last')
+        updated_df = pd.concat([daily_df, new_rows], ignore_index=True)
         
         # 日付でソート
         updated_df['date'] = pd.to_datetime(updated_df['date'])
@@ -124,7 +162,12 @@ class CSVDataIntegrator:
         print("[INFO] 7日移動平均再計算開始...")
         
         try:
-            ma_df = daily_df.copy()
+            # 外れ値判定（隔離した値は移動平均・分析の入力から除外）
+            self.outlier_detector.screen(daily_df)
+            ma_df = self.outlier_detector.apply(daily_df)
+
+            # 週次・月次集計（変更のあった期間のみ再集計）
+            self.rollups.update(ma_df)
             
             # 数値カラムのみ対象
             numeric_cols = [col for col in daily_df.columns 
@@ -147,6 +190,26 @@ class CSVDataIntegrator:
                     window=28, min_periods=1, center=False
                 ).mean().round(2)
                 
+            # カルマン平滑化（体重・体脂肪率・筋肉量のレベルと傾き）
+            previous_ma_df = self.load_existing_csv(self.ma7_csv)
+            ma_df = self.smoother.add_columns(ma_df, previous_ma_df)
+
+            # 実消費カロリー推定（摂取量と平滑化体重の変化から逆算）
+            ma_df = self.tdee_estimator.add_columns(ma_df, previous_ma_df)
+
+            # 曜日効果の季節調整列
+            ma_df = self.seasonality.add_columns(ma_df, previous_ma_df)
+
+            # 停滞期のオンライン検出（CUSUM）
+            plateau = self.plateau_detector.update_online(ma_df)
+            if plateau.get('alarm'):
+                print(f"[WARNING] 体脂肪量の減少停滞を検出: {plateau['run_start']}〜")
+
+            # トレーニング負荷（ATL/CTL）の逐次更新
+            load = self.training_load.update_online(ma_df, self.workout_store.daily_energy())
+            if load.get('status') == 'overreaching':
+                print(f"[WARNING] トレーニング負荷が過大です: ACWR {load['acwr']}")
+                
             # 移動平均CSV保存
             ma_df.to_csv(self.ma7_csv, index=False, encoding='utf-8-sig')
             print(f"[SUCCESS] 移動平均データ更新完了（7日・14日・28日）: {len(ma_df)}行")
@@ -254,17 +317,19 @@ class CSVDataIntegrator:
         """最新のHAEデータを処理して統合"""
         print("=== 最新HAEデータ統合処理 ===")
         
-        # HAEデータ変換
-        hae_row = self.converter.convert_hae_to_csv_row(
-            self.converter.get_latest_hae_file()
-        )
+        # HAEデータ変換（複数日分は日付ごとの行に分割）
+        latest_file = self.converter.get_latest_hae_file()
+        hae_rows = self.converter.convert_hae_to_daily_rows(latest_file) if latest_file else []
         
-        if not hae_row:
+        if not hae_rows:
             print("[ERROR] HAEデータ変換に失敗しました")
             return False
             
+        # ワークアウト保存（再送分は重複除去）
+        self.workout_store.append(self.converter.extract_workouts(latest_file))
+            
         # CSV統合
-        return self.add_hae_data_to_csv(hae_row)
+        return self.add_hae_rows_to_csv(hae_rows)
         
     def test_integration(self):
         """統合機能のテスト"""
@@ -0,0 +1,287 @@
+"""
+Day Bucketing - タイムゾーン・夏時間を考慮した日付振り分け（全変換処理共通）
+HAE・XMLの時刻 "2025-07-31 23:30:00 -0700" は記録した端末の現地時刻とオフセットを持つため、
+日付部分をそのまま切り出すと旅行中・夏時間切替時の記録が別の日に入る。
+全時刻をいったんUTCに直し、ホームタイムゾーン（夏時間込み）の現地時刻へ変換したうえで、
+1日の開始時刻（既定 0時）を境に日付キーを決める
+
+- 固定書式（"YYYY-MM-DD HH:MM:SS ±HHMM"）は全件を N×25 のバイト行列として一括変換
+- それ以外の書式はユニークな文字列のみ正規表現で解釈（結果はキャッシュ）
+- ホームタイムゾーンのオフセットは対象期間の日ごとに求め、夏時間の切替日のみ
+  切替時刻を15分単位で特定して区間ごとに割り当てる（1件ずつの変換は15分区切りでキャッシュ）
+
+設定は環境変数 HEALTH_HOME_TIMEZONE（既定 Asia/Tokyo）・HEALTH_DAY_START_HOUR（既定 0）。
+HAEの日次集計形式（各日 00:00 の1点）を使う場合、開始時刻は 0 のままにする
+"""
+
+import os
+import re
+from functools import lru_cache
+from datetime import datetime, date
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+import numpy as np
+import pandas as pd
+
+DAY_SECONDS = 86400
+OFFSET_BUCKET_SECONDS = 900  # タイムゾーンの切替は UTC の15分単位
+
+# 固定書式 "2025-07-31 00:00:00 +0900" の各フィールド位置
+FIXED_WIDTH = 25
+FIXED_SEPARATORS = {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':', 19: ' '}
+FIXED_FIELDS = {'year': (0, 4), 'month': (5, 7), 'day': (8, 10), 'hour': (11, 13),
+                'minute': (14, 16), 'second': (17, 19), 'offset_hour': (21, 23), 'offset_minute': (23, 25)}
+SIGN_COLUMN = 20
+
+# 固定書式以外（"2025-07-31"・"2025-07-31T23:30:00Z"・"+09:00" 等）
+DATE_PATTERN = re.compile(
+    r'^\s*(\d{4})-(\d{2})-(\d{2})'
+    r'(?:[ T](\d{2}):(\d{2})(?::(\d{2}))?(?:\.\d+)?)?'
+    r'\s*(Z|[+-]\d{2}:?\d{2})?\s*$'
+)
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+
+@lru_cache(maxsize=65536)
+def _parse_one(date_str: str) -> Optional[tuple]:
+    """日付文字列 → (現地時刻の秒, オフセット秒 or None)。解釈できなければ None"""
+    match = DATE_PATTERN.match(date_str)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, offset = match.groups()
+    try:
+        wall = datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0))
+    except ValueError:
+        return None
+    wall_seconds = int((wall - EPOCH).total_seconds())
+    if offset is None:
+        return wall_seconds, None
+    if offset == 'Z':
+        return wall_seconds, 0
+    digits = offset[1:].replace(':', '')
+    offset_seconds = int(digits[:2]) * 3600 + int(digits[2:]) * 60
+    return wall_seconds, offset_seconds if offset[0] == '+' else -offset_seconds
+
+
+def _field_weights() -> np.ndarray:
+    """25桁の文字列 → 各フィールドの整数値 を1回の行列積で求めるための重み（25×フィールド数）"""
+    weights = np.zeros((FIXED_WIDTH, len(FIXED_FIELDS)), dtype=np.float32)
+    for k, (start, end) in enumerate(FIXED_FIELDS.values()):
+        weights[start:end, k] = 10.0 ** np.arange(end - start - 1, -1, -1)
+    return weights
+
+
+FIELD_WEIGHTS = _field_weights()
+DIGIT_POSITIONS = [i for start, end in FIXED_FIELDS.values() for i in range(start, end)]
+
+
+def _days_from_civil(year: np.ndarray, month: np.ndarray, day: np.ndarray) -> tuple:
+    """年・月・日の配列 → (1970-01-01 からの日数, 実在する日付か)
+
+    対象期間の月は数十〜数百種類なので、月初の日数・月の日数を範囲分だけ表にして引く
+    """
+    month_index = (year - 1970) * 12 + (month - 1)
+    first = int(month_index.min())
+    months = np.arange(first, int(month_index.max()) + 2).astype('datetime64[M]').astype('datetime64[D]')
+    month_start = months.astype(np.int64)
+    month_length = np.diff(month_start)
+    position = month_index - first
+    return month_start[position] + (day - 1), day <= month_length[position]
+
+
+def _civil_keys(days: np.ndarray) -> np.ndarray:
+    """1970-01-01 からの日数 → 日付キー（YYYYMMDD）。期間内の日付だけ表にして引く"""
+    first = int(days.min())
+    calendar = np.arange(first, int(days.max()) + 1).astype('datetime64[D]')
+    years = calendar.astype('datetime64[Y]')
+    months = calendar.astype('datetime64[M]')
+    keys = (years.astype(np.int64) + 1970) * 10000 \
+        + (months - years.astype('datetime64[M]')).astype(np.int64) * 100 + 100 \
+        + (calendar - months.astype('datetime64[D]')).astype(np.int64) + 1
+    return keys[days - first]
+
+
+class DayBucketer:
+    """時刻文字列の配列 → ホームタイムゾーンの現地時刻・日付キー"""
+
+    def __init__(self, home_timezone: str = 'Asia/Tokyo', day_start_hour: int = 0):
+        """
+        Args:
+            home_timezone: 日付を決めるタイムゾーン（IANA名）
+            day_start_hour: 1日の開始時刻（例: 4 なら 0〜4時の記録は前日扱い）
+        """
+        if not 0 <= day_start_hour < 24:
+            raise ValueError(f"1日の開始時刻は0〜23で指定してください: {day_start_hour}")
+        self.home_timezone = home_timezone
+        self.tz = ZoneInfo(home_timezone)
+        self.day_start_seconds = day_start_hour * 3600
+        self._offset_cache = {}  # UTCの15分区切り → ホームタイムゾーンのオフセット秒（1件ずつの変換用）
+
+    @classmethod
+    def from_env(cls) -> 'DayBucketer':
+        return cls(os.environ.get('HEALTH_HOME_TIMEZONE', 'Asia/Tokyo'),
+                   int(os.environ.get('HEALTH_DAY_START_HOUR', 0)))
+
+    # ===== 解釈 =====
+
+    def parse(self, date_strs) -> tuple:
+        """時刻文字列の配列を一括で解釈
+
+        Returns:
+            (現地時刻の秒, オフセット秒, オフセット有無, 有効フラグ) の配列
+        """
+        date_strs = list(date_strs)
+        n = len(date_strs)
+        if n == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)
+
+        fixed = self._parse_fixed(date_strs)
+        if fixed is not None:
+            return fixed
+
+        # 書式が揃わない場合はユニークな文字列のみ解釈
+        inverse, unique_strs = pd.factorize(pd.Series(date_strs, dtype=object).fillna('').astype(str))
+        parsed = [_parse_one(value) for value in unique_strs]
+        valid_u = np.array([p is not None for p in parsed], dtype=bool)
+        wall_u = np.array([p[0] if p else 0 for p in parsed], dtype=np.int64)
+        has_offset_u = np.array([p is not None and p[1] is not None for p in parsed], dtype=bool)
+        offset_u = np.array([p[1] if p and p[1] is not None else 0 for p in parsed], dtype=np.int64)
+        return wall_u[inverse], offset_u[inverse], has_offset_u[inverse], valid_u[inverse]
+
+    def _parse_fixed(self, date_strs: List[str]) -> Optional[tuple]:
+        """固定書式のみの配列をバイト行列で変換（1件でも書式外があれば None）"""
+        try:
+            joined = ''.join(date_strs)
+        except TypeError:
+            return None
+        if len(joined) != len(date_strs) * FIXED_WIDTH or not joined.isascii():
+            return None
+
+        codes = np.frombuffer(joined.encode('ascii'), dtype=np.uint8).reshape(len(date_strs), FIXED_WIDTH)
+        separators = np.array([ord(c) for c in FIXED_SEPARATORS.values()], dtype=np.uint8)
+        sign = codes[:, SIGN_COLUMN]
+        valid = (codes[:, list(FIXED_SEPARATORS)] == separators).all(axis=1) \
+            & ((sign == ord('+')) | (sign == ord('-')))
+
+        # 数字以外は桁あふれで10以上になる。各フィールドの値は1回の行列積で取り出す（float32で厳密）
+        digits = codes - np.uint8(ord('0'))
+        valid &= (digits[:, DIGIT_POSITIONS] <= 9).all(axis=1)
+        values = (digits.astype(np.float32) @ FIELD_WEIGHTS).astype(np.int64)
+        fields = dict(zip(FIXED_FIELDS, values.T))
+        valid &= (fields['month'] >= 1) & (fields['month'] <= 12) & (fields['day'] >= 1) & (fields['day'] <= 31) \
+            & (fields['hour'] <= 23) & (fields['minute'] <= 59) & (fields['second'] <= 60)
+        if not valid.all():
+            return None
+
+        days, exists = _days_from_civil(fields['year'], fields['month'], fields['day'])
+        if not exists.all():  # 2月30日等
+            return None
+
+        wall = days * DAY_SECONDS + fields['hour'] * 3600 + fields['minute'] * 60 + fields['second']
+        offset = fields['offset_hour'] * 3600 + fields['offset_minute'] * 60
+        offset = np.where(sign == ord('-'), -offset, offset)
+        return wall, offset, np.ones(len(wall), dtype=bool), valid
+
+    # ===== ホームタイムゾーンへの変換 =====
+
+    def _offsets_at(self, utc_seconds: np.ndarray) -> np.ndarray:
+        """UTC秒 → ホームタイムゾーンのオフセット秒（夏時間込み）"""
+        utc = pd.to_datetime(utc_seconds, unit='s', utc=True)
+        local = utc.tz_convert(self.tz).tz_localize(None)
+        return (local - utc.tz_localize(None)).total_seconds().to_numpy().astype(np.int64)
+
+    def home_offsets(self, utc_seconds: np.ndarray) -> np.ndarray:
+        """各時刻のホームタイムゾーンのオフセット秒
+
+        対象期間の毎日0時UTCのオフセットを求め、値が変わる日（夏時間の切替日）だけ
+        15分刻みで切替時刻を特定する。各時刻には切替時刻の二分探索で区間のオフセットを割り当てる
+        """
+        if len(utc_seconds) == 0:
+            return np.zeros(0, dtype=np.int64)
+        first_day, last_day = int(utc_seconds.min()) // DAY_SECONDS, int(utc_seconds.max()) // DAY_SECONDS
+        midnights = np.arange(first_day, last_day + 2, dtype=np.int64) * DAY_SECONDS
+        daily = self._offsets_at(midnights)
+        changed = np.flatnonzero(daily[1:] != daily[:-1])
+        if len(changed) == 0:
+            return np.full(len(utc_seconds), daily[0], dtype=np.int64)
+
+        transitions = []
+        for i in changed.tolist():
+            quarters = midnights[i] + np.arange(1, DAY_SECONDS // OFFSET_BUCKET_SECONDS + 1) * OFFSET_BUCKET_SECONDS
+            offsets = self._offsets_at(quarters)
+            transitions.append(quarters[np.argmax(offsets != daily[i])])
+        values = np.concatenate([daily[:1], daily[changed + 1]])
+        return values[np.searchsorted(np.array(transitions), utc_seconds, side='right')]
+
+    def local_seconds(self, date_strs) -> tuple:
+        """時刻文字列の配列 → ホームタイムゾーンの現地時刻（1970-01-01 からの秒）
+
+        オフセットのない時刻はホームタイムゾーンの現地時刻とみなす
+
+        Returns:
+            (現地時刻の秒 int64, 有効フラグ)
+        """
+        return self.localize(*self.parse(date_strs))
+
+    def localize(self, wall: np.ndarray, offset: np.ndarray, has_offset: np.ndarray, valid: np.ndarray) -> tuple:
+        """parse() の結果 → (ホームタイムゾーンの現地時刻の秒, 有効フラグ)（解釈済みの配列を保存して再利用する経路用）"""
+        local = wall.copy()
+        converted = has_offset & valid
+        if converted.any():
+            utc = wall[converted] - offset[converted]
+            local[converted] = utc + self.home_offsets(utc)
+        return np.where(valid, local, 0), valid
+
+    def day_keys(self, date_strs) -> tuple:
+        """時刻文字列の配列 → 日付キー（YYYYMMDD の整数、1日の開始時刻を反映）
+
+        Returns:
+            (日付キー配列 int64, 有効フラグ配列)
+        """
+        return self.keys_from_local(*self.local_seconds(date_strs))
+
+    def keys_from_local(self, local: np.ndarray, valid: np.ndarray) -> tuple:
+        """現地時刻の秒 → (日付キー配列, 有効フラグ)"""
+        if not valid.any():
+            return np.zeros(len(local), dtype=np.int64), valid
+        days = (local - self.day_start_seconds) // DAY_SECONDS
+        keys = _civil_keys(np.where(valid, days, days[valid][0]))
+        return np.where(valid, keys, 0), valid
+
+    # ===== 単一値 =====
+
+    def _offset_at(self, utc_seconds: int) -> int:
+        """UTC秒 → ホームタイムゾーンのオフセット秒（15分区切りでキャッシュ）"""
+        bucket = utc_seconds // OFFSET_BUCKET_SECONDS
+        offset = self._offset_cache.get(bucket)
+        if offset is None:
+            moment = datetime.fromtimestamp(bucket * OFFSET_BUCKET_SECONDS, self.tz)
+            offset = self._offset_cache[bucket] = int(moment.utcoffset().total_seconds())
+        return offset
+
+    def local_date(self, date_str: str) -> Optional[date]:
+        """時刻文字列 → ホームタイムゾーンの日付（1件ずつ処理する経路用、解釈できなければ None）"""
+        parsed = _parse_one(date_str) if isinstance(date_str, str) else None
+        if parsed is None:
+            return None
+        wall, offset = parsed
+        local = wall if offset is None else wall - offset + self._offset_at(wall - offset)
+        return date.fromordinal(EPOCH_ORDINAL + (local - self.day_start_seconds) // DAY_SECONDS)
+
+    def local_day(self, date_str: str) -> Optional[str]:
+        """時刻文字列 → "YYYY-MM-DD"（解釈できなければ None）"""
+        day = self.local_date(date_str)
+        return day.isoformat() if day is not None else None
+
+    def local_timestamps(self, date_strs) -> pd.Series:
+        """時刻文字列の配列 → ホームタイムゾーンの現地時刻（タイムゾーンなし、無効は NaT）"""
+        local, valid = self.local_seconds(date_strs)
+        stamps = local.astype('datetime64[s]')
+        stamps[~valid] = np.datetime64('NaT')
+        return pd.Series(stamps)
+
+
+DEFAULT_BUCKETER = DayBucketer.from_env()
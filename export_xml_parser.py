@@ -0,0 +1,734 @@
+"""
+Export XML Parser - Apple Health export.xml の並列解析
+数年分の分単位データを含む export.xml は単一スレッドの iterparse では数分かかるため、
+ファイルを Record 要素の境界にそろえたバイト範囲に分割し、プロセスプールで並列に解析する。
+各プロセスは (日付, 指標, ソース) ごとの部分集計（合計・件数・最初/最後の値と出現位置）を返し、
+ファイル順に結合してから日次の値を決める（単一スレッドの結果と一致）
+
+- 範囲の境界は最上位の <Record の直前のみ（Correlation 内の入れ子の Record では区切らない）
+- 既定の解析は対象 type の開始タグだけをバイト列の正規表現で取り出す高速スキャナ、
+  ElementTree（iterparse）は engine='etree' で選択でき、スキャナが失敗した場合も使う
+- 日付はホームタイムゾーン基準（day_bucketing）
+- (日付, 指標) ごとに記録ハッシュの要約を持ち、差分取り込み（incremental_import）で変更日の検出に使う
+- 記録は範囲（ブロック）ごとに型付きの列（record_cache.RecordColumns）にまとめ、並べ替えによる一括集計で部分集計にする
+- 日次の値は DAILY_RULES（体重・体脂肪率・筋肉量・体温は最後の値、歩数・活動カロリー・基礎代謝はソース優先順位、
+  それ以外は合計）を (日付, 指標) の group-by で一括適用する（DailyPartials.daily_frame）
+"""
+
+import io
+import os
+import math
+import html
+import re
+import sys
+import mmap
+import time
+import shutil
+import zlib
+import zipfile
+import tempfile
+import datetime as dt
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+from source_priority import SourcePriority
+from day_bucketing import DEFAULT_BUCKETER
+from record_cache import RecordBuffer, RecordColumns
+
+EXPORT_MEMBER = "apple_health_export/export.xml"
+SLEEP_TYPE = 'HKCategoryTypeIdentifierSleepAnalysis'
+
+# 日次の値の決め方（処理内の指標名 → ルール、記載のない指標は DEFAULT_DAILY_RULE）
+# 'last': 最後の記録 / 'sum': 合計 / ('priority', ルール名): SourcePriority のソース優先順位
+#   （歩数・活動カロリーは Oura > Apple Watch > iPhone の合計、基礎代謝は RENPHO の最初の値 > iPhone の合計）
+DAILY_RULES = {
+    'weight': 'last',
+    'bf_rate': 'last',
+    'muscle': 'last',
+    'body_temp': 'last',
+    'steps': ('priority', '歩数'),
+    'active_cal': ('priority', '活動カロリー_kcal'),
+    'basal_cal': ('priority', '基礎代謝_kcal'),
+}
+DEFAULT_DAILY_RULE = 'sum'
+STATS_COLUMNS = ['date', 'metric', 'source', 'sum', 'compensation', 'count', 'first', 'first_pos', 'last', 'last_pos']
+SEAL_ROWS = 1 << 20  # 列形式に変換して集計するまでに蓄積する記録数（ElementTree 版のメモリ上限）
+
+RECORD_TAG = b'<Record '
+ROOT_OPEN = re.compile(rb'<HealthData[\s>][^>]*>')
+ROOT_CLOSE = b'</HealthData>'
+CORRELATION_OPEN = b'<Correlation '
+CORRELATION_CLOSE = b'</Correlation>'
+ALIGN_WINDOW = 1 << 20  # Correlation の開始を探す範囲（1要素は数KB）
+POSITION_BITS = 40  # 出現位置 = (範囲番号 << 40) + 範囲内の記録番号
+DIGEST_MASK = (1 << 64) - 1
+
+
+def record_hash(typ: str, source: str, start: str, end: str, value: str) -> int:
+    """記録の安定ハッシュ（解析方式・プロセスによらず同じ値）"""
+    return zlib.crc32(f'{typ}|{source}|{start}|{end}|{value}'.encode('utf-8'))
+
+
+def _compensated_add(stat: list, value: float):
+    """補正付き加算（Neumaier）。stat[0] が合計、stat[1] が丸め誤差の補正で、加算順によらず合計が一致する"""
+    total = stat[0] + value
+    if abs(stat[0]) >= abs(value):
+        stat[1] += (stat[0] - total) + value
+    else:
+        stat[1] += (value - total) + stat[0]
+    stat[0] = total
+
+
+class DailyPartials:
+    """(日付, 指標, ソース) ごとの部分集計。ファイル順に merge して日次の値を求める
+
+    記録は範囲（またはブロック）ごとに列形式（record_cache.RecordColumns）へ変換し、
+    (日付, type, ソース) の並べ替えによる一括集計で部分集計に加える（記録ごとの辞書は作らない）
+    """
+
+    def __init__(self, chunk_index: int = 0, collect_records: bool = False):
+        # (日付, 指標, ソース) → [合計, 合計の補正, 件数, 最初の値, 最初の位置, 最後の値, 最後の位置]
+        self.stats = {}
+        self.sleep_records = []
+        # (日付, 指標) → [記録ハッシュの合計 mod 2^64, 件数]（順序によらない内容の要約。差分検出用）
+        self.digests = {}
+        self.count = 0
+        self.skipped = 0
+        self.already = 0  # 前回までに取り込み済みとして読み飛ばした件数
+        # 読み飛ばした記録の (日付, 指標) ごとの記録ハッシュの要約（前回の要約と比べて遅れて同期された記録を検出）
+        self.seen_digests = {}
+        self._position = chunk_index << POSITION_BITS
+        self.record_buffer = RecordBuffer()
+        # 記録キャッシュ用に列形式の記録も保持する場合（record_cache）
+        self.collect_records = collect_records
+        self.record_parts = []
+
+    def seal_records(self, target_metrics: Dict[str, str]) -> 'DailyPartials':
+        """蓄積中の記録を列形式に変換して一括集計し、部分集計に加える"""
+        if self.record_buffer.rows:
+            columns = self.record_buffer.to_columns(SLEEP_TYPE)
+            self.record_buffer = RecordBuffer()
+            self.merge(DailyPartials.from_columns(columns, target_metrics, position_base=self._position))
+            self._position += len(columns)
+            if self.collect_records:
+                self.record_parts.append(columns)
+        return self
+
+    def record_columns(self) -> RecordColumns:
+        return RecordColumns.concat(self.record_parts)
+
+    @staticmethod
+    def _add_digest(digests: dict, key: tuple, record_hash: int, count: int = 1):
+        digest = digests.get(key)
+        if digest is None:
+            digests[key] = [record_hash, count]
+        else:
+            digest[0] = (digest[0] + record_hash) & DIGEST_MASK
+            digest[1] += count
+
+    def add_seen(self, date: dt.date, metric: str, record_hash: int):
+        self._add_digest(self.seen_digests, (date, metric), record_hash)
+
+    def merge(self, other: 'DailyPartials') -> 'DailyPartials':
+        """ファイル上で後ろに続く範囲の部分集計を結合"""
+        for key, stat in other.stats.items():
+            mine = self.stats.get(key)
+            if mine is None:
+                self.stats[key] = list(stat)
+            else:
+                _compensated_add(mine, stat[0])
+                mine[1] += stat[1]
+                mine[2] += stat[2]
+                mine[5] = stat[5]
+                mine[6] = stat[6]
+        for key, (record_hash, count) in other.digests.items():
+            self._add_digest(self.digests, key, record_hash, count)
+        for key, (record_hash, count) in other.seen_digests.items():
+            self._add_digest(self.seen_digests, key, record_hash, count)
+        self.sleep_records.extend(other.sleep_records)
+        self.count += other.count
+        self.skipped += other.skipped
+        self.already += other.already
+        if self.collect_records:
+            self.record_parts.extend(other.record_parts)
+        return self
+
+    # ===== 取り込み済み状態（チェックポイント）との結合 =====
+
+    def drop_from(self, reopen: Dict[str, dt.date], days: set = frozenset()) -> 'DailyPartials':
+        """指標ごとに reopen の日付以降と days の (日付, 指標) の集計を破棄（再解析した結果で置き換えるため）"""
+        def reopened(date, metric):
+            return (metric in reopen and date >= reopen[metric]) or (date, metric) in days
+
+        self.stats = {key: stat for key, stat in self.stats.items() if not reopened(key[0], key[1])}
+        self.digests = {key: digest for key, digest in self.digests.items() if not reopened(*key)}
+        sleep_days = {date_key(date) for date, metric in days if metric == 'sleep'}
+        if ('sleep' in reopen or sleep_days) and self.sleep_records:
+            keys, valid = DEFAULT_BUCKETER.day_keys([record['start'] for record in self.sleep_records])
+            kept = ~np.isin(keys, list(sleep_days))
+            if 'sleep' in reopen:
+                kept &= keys < date_key(reopen['sleep'])
+            kept |= ~valid
+            self.sleep_records = [record for record, keep in zip(self.sleep_records, kept.tolist()) if keep]
+        return self
+
+    def last_dates(self) -> Dict[str, dt.date]:
+        """指標ごとの最後の記録日"""
+        last = {}
+        for date, metric in self.digests:
+            if metric not in last or date > last[metric]:
+                last[metric] = date
+        return last
+
+    def to_state(self) -> dict:
+        """JSON 保存用の辞書"""
+        return {
+            'stats': [[date.isoformat(), metric, source] + stat for (date, metric, source), stat in self.stats.items()],
+            'digests': [[date.isoformat(), metric] + digest for (date, metric), digest in self.digests.items()],
+            'seen_digests': [[date.isoformat(), metric] + digest
+                             for (date, metric), digest in self.seen_digests.items()],
+            'sleep_records': self.sleep_records,
+            'count': self.count,
+            'skipped': self.skipped,
+            'already': self.already,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'DailyPartials':
+        partials = cls()
+        partials.stats = {(dt.date.fromisoformat(row[0]), row[1], row[2]): row[3:] for row in state.get('stats', [])}
+        partials.digests = {(dt.date.fromisoformat(row[0]), row[1]): row[2:] for row in state.get('digests', [])}
+        partials.seen_digests = {(dt.date.fromisoformat(row[0]), row[1]): row[2:]
+                                 for row in state.get('seen_digests', [])}
+        partials.sleep_records = state.get('sleep_records', [])
+        partials.count = state.get('count', 0)
+        partials.skipped = state.get('skipped', 0)
+        partials.already = state.get('already', 0)
+        return partials
+
+    @classmethod
+    def from_columns(cls, columns: RecordColumns, target_metrics: Dict[str, str],
+                     cutoff_date: dt.date = None, position_base: int = 0) -> 'DailyPartials':
+        """列形式の記録（解析中の範囲・記録キャッシュ）から部分集計を作成。(日付, type, ソース) の並べ替えで一括集計する
+
+        position_base: 最初の記録の出現位置（ファイル順に merge するため）
+        """
+        partials = cls()
+        if len(columns) == 0:
+            return partials
+        metric_names = [target_metrics.get(typ) for typ in columns.types]
+        keys, valid = columns.day_keys()
+        targeted = np.array([name is not None for name in metric_names], dtype=bool)[columns.type_code]
+        keep = targeted & valid
+        if cutoff_date is not None:
+            keep &= keys >= date_key(cutoff_date)
+        dates = {key: dt.date(key // 10000, key // 100 % 100, key % 100) for key in np.unique(keys[keep]).tolist()}
+        is_sleep = np.array([typ == SLEEP_TYPE for typ in columns.types], dtype=bool)[columns.type_code]
+
+        # 記録ハッシュの要約（取り込んだ全記録）
+        rows = np.flatnonzero(keep)
+        order = rows[np.lexsort((columns.type_code[rows], keys[rows]))]
+        if len(order):
+            group_keys, group_types = keys[order], columns.type_code[order]
+            starts = np.flatnonzero(np.r_[True, (group_keys[1:] != group_keys[:-1]) | (group_types[1:] != group_types[:-1])])
+            sums = np.add.reduceat(columns.record_hash[order].astype(np.uint64), starts)
+            counts = np.diff(np.r_[starts, len(order)])
+            for key, code, total, count in zip(group_keys[starts].tolist(), group_types[starts].tolist(),
+                                               sums.tolist(), counts.tolist()):
+                partials.digests[(dates[key], metric_names[code])] = [total, count]
+
+        # (日付, type, ソース) ごとの合計・件数・最初/最後の値と位置（ファイル順）
+        rows = np.flatnonzero(keep & ~is_sleep & ~np.isnan(columns.value))
+        order = rows[np.lexsort((rows, columns.source_code[rows], columns.type_code[rows], keys[rows]))]
+        if len(order):
+            group_keys, group_types, group_sources = keys[order], columns.type_code[order], columns.source_code[order]
+            changed = (group_keys[1:] != group_keys[:-1]) | (group_types[1:] != group_types[:-1]) \
+                | (group_sources[1:] != group_sources[:-1])
+            starts = np.flatnonzero(np.r_[True, changed])
+            ends = np.r_[starts[1:], len(order)]
+            values = columns.value[order].tolist()
+            for begin, end, key, code, source in zip(starts.tolist(), ends.tolist(), group_keys[starts].tolist(),
+                                                     group_types[starts].tolist(), group_sources[starts].tolist()):
+                # 合計と丸め誤差の補正（ソース間の合計も解析時と同じく誤差なく求めるため）
+                total = math.fsum(values[begin:end])
+                partials.stats[(dates[key], metric_names[code], columns.sources[source])] = [
+                    total, math.fsum(values[begin:end] + [-total]), end - begin,
+                    values[begin], position_base + int(order[begin]),
+                    values[end - 1], position_base + int(order[end - 1])]
+
+        # 睡眠ステージ記録（終了時刻のあるもの、ファイル順）
+        rows = np.flatnonzero(keep & is_sleep & columns.end_valid)
+        partials.sleep_records = [
+            {'start': start, 'end': end, 'stage': columns.stages[stage] if stage >= 0 else "",
+             'source': columns.sources[source]}
+            for start, end, stage, source in zip(columns.start_strings(rows), columns.end_strings(rows),
+                                                 columns.stage_code[rows].tolist(), columns.source_code[rows].tolist())]
+        partials.count = int(keep.sum())
+        return partials
+
+    # ===== 日次の値 =====
+
+    def stats_frame(self) -> pd.DataFrame:
+        """部分集計の列形式（1行 = (日付, 指標, ソース)）"""
+        return pd.DataFrame([key + tuple(stat) for key, stat in self.stats.items()], columns=STATS_COLUMNS)
+
+    def daily_frame(self, source_priority: SourcePriority = None, metrics: List[str] = None) -> pd.DataFrame:
+        """日付 × 指標の日次の値。DAILY_RULES を (日付, 指標) の group-by で一括適用する
+
+        metrics: 記録がなくても列として含める指標（値は NaN）
+        """
+        source_priority = source_priority or SourcePriority()
+        frame = self.stats_frame().sort_values('first_pos', kind='stable')
+        rules = {metric: DAILY_RULES.get(metric, DEFAULT_DAILY_RULE) for metric in frame['metric'].unique()}
+        kind = frame['metric'].map({metric: rule if isinstance(rule, str) else rule[0] for metric, rule in rules.items()})
+        parts = []
+
+        # 最後の値: 最後の記録の位置が最も後ろのソースの値
+        last = frame[kind == 'last'].sort_values('last_pos').drop_duplicates(['date', 'metric'], keep='last')
+        parts.append(last[['date', 'metric', 'last']].rename(columns={'last': 'value'}))
+
+        # 合計: 全ソースの合計と補正をまとめて誤差なく合計
+        summed = frame[kind == 'sum']
+        stacked = pd.concat([summed[['date', 'metric', 'sum']].rename(columns={'sum': 'value'}),
+                             summed[['date', 'metric', 'compensation']].rename(columns={'compensation': 'value'})])
+        if len(stacked):
+            codes = stacked.groupby(['date', 'metric'], sort=False).ngroup().to_numpy()
+            order = np.argsort(codes, kind='stable')
+            starts = np.flatnonzero(np.r_[True, codes[order][1:] != codes[order][:-1]])
+            values = stacked['value'].to_numpy()[order].tolist()
+            totals = [math.fsum(values[begin:end]) for begin, end in zip(starts.tolist(), np.r_[starts[1:], len(order)].tolist())]
+            parts.append(stacked.iloc[order[starts]][['date', 'metric']].assign(value=totals))
+
+        # ソース優先順位: 指標ごとに (日付, ソース) の部分集計を最初の記録の出現順で選択
+        for metric, rows in frame[kind == 'priority'].groupby('metric', sort=False):
+            selected = source_priority.select_by_date(
+                rows['date'].tolist(), rows['source'].tolist(), (rows['sum'] + rows['compensation']).to_numpy(),
+                rules[metric][1], first_values=rows['first'].to_numpy())
+            parts.append(pd.DataFrame({'date': list(selected), 'metric': metric, 'value': list(selected.values())}))
+
+        parts = [part for part in parts if len(part)]
+        if parts:
+            daily = pd.concat(parts, ignore_index=True).pivot(index='date', columns='metric', values='value')
+            daily = daily.sort_index().astype(float)
+        else:
+            daily = pd.DataFrame(index=pd.Index([], dtype=object), dtype=float)
+        if metrics is not None:
+            daily = daily.reindex(columns=list(daily.columns) + [m for m in metrics if m not in daily.columns])
+        daily.index.name = 'date'
+        daily.columns.name = None
+        return daily
+
+    def daily_values(self, source_priority: SourcePriority = None) -> Dict[dt.date, Dict[str, float]]:
+        """{日付: {指標: 日次の値}}"""
+        daily = self.daily_frame(source_priority)
+        return {date: {metric: value for metric, value in row.items() if not pd.isna(value)}
+                for date, row in zip(daily.index, daily.to_dict('records'))}
+
+
+# ===== 解析 =====
+
+def _ingest(partials: DailyPartials, typ: str, date: dt.date, start_date_str: str, end_date_str: str,
+            value: str, source: str, target_metrics: Dict[str, str], cutoff_date: dt.date,
+            reopen: Dict[str, dt.date] = None):
+    """解釈済みの記録1件を部分集計に追加（ElementTree・スキャナ共通）
+
+    reopen: type ごとの再解析開始日。これより前の記録は取り込み済みとして集計せず、
+            記録ハッシュの要約（seen_digests）だけを取る
+    """
+    if date < cutoff_date:
+        partials.skipped += 1
+        return
+    if reopen is not None and typ in reopen and date < reopen[typ]:
+        partials.already += 1
+        partials.add_seen(date, target_metrics[typ], record_hash(typ, source, start_date_str, end_date_str, value))
+        return
+    # 集計は範囲（ブロック）ごとに列形式で一括して行う（DailyPartials.seal_records）
+    partials.record_buffer.append(typ, source, start_date_str, end_date_str, value,
+                               record_hash(typ, source, start_date_str, end_date_str, value))
+
+
+def parse_records(stream, target_metrics: Dict[str, str], cutoff_date: dt.date,
+                  partials: DailyPartials, reopen: Dict[str, dt.date] = None,
+                  backfill: Dict[str, set] = None) -> DailyPartials:
+    """Record 要素を iterparse で読み、対象指標を部分集計に追加（ElementTree 版）
+
+    backfill: {type: 日付の集合}。指定した場合はその日の記録だけを集計し直す（reopen は使わない）
+    """
+    for _, elem in ET.iterparse(stream, events=('end',)):
+        if elem.tag != "Record":
+            continue
+
+        typ = elem.attrib.get("type")
+        start_date_str = elem.attrib.get("startDate")
+        if typ in target_metrics and start_date_str:
+            # オフセット付き時刻をホームタイムゾーンの日付に変換（旅行中・夏時間の記録も正しい日へ）
+            date = DEFAULT_BUCKETER.local_date(start_date_str)
+            if date is not None and (backfill is None or date in backfill.get(typ, ())):
+                _ingest(partials, typ, date, start_date_str, elem.attrib.get("endDate"), elem.attrib.get("value"),
+                        elem.attrib.get("sourceName", "Unknown"), target_metrics, cutoff_date, reopen)
+                if len(partials.record_buffer.rows) >= SEAL_ROWS:
+                    partials.seal_records(target_metrics)
+        elem.clear()
+    return partials.seal_records(target_metrics)
+
+
+# ===== 高速スキャナ（バイト列の正規表現） =====
+
+# 取り出す属性（startDate・endDate・value・sourceName）
+ATTRIBUTE_PATTERN = re.compile(rb'\s(endDate|value|sourceName)="([^"]*)"')
+TYPE_FIRST_TAG = b'<Record type="'
+
+
+@lru_cache(maxsize=16)
+def record_pattern(types: tuple, type_first: bool = True) -> re.Pattern:
+    """対象 type の Record 開始タグのみに一致する正規表現（対象外の記録は一致オブジェクトも作らない）
+
+    findall で (開始タグ全体, type, startDate) を返す。
+    type_first: Apple の書き出し形式（type が先頭の属性）専用の照合。False は属性順によらず照合
+    """
+    alternatives = b'|'.join(re.escape(t.encode('utf-8')) for t in sorted(types, key=len, reverse=True))
+    start_date = rb'(?=[^>]*?\sstartDate="([^"]*)")'
+    if type_first:
+        return re.compile(rb'(<Record type="(' + alternatives + rb')"' + start_date + rb'[^>]*>)')
+    return re.compile(rb'(<Record(?=[^>]*?\stype="(' + alternatives + rb')")' + start_date + rb'[^>]*>)')
+
+
+def _text(raw: bytes) -> str:
+    """属性値のバイト列 → 文字列（実体参照を含む場合のみ展開）"""
+    text = raw.decode('utf-8')
+    return html.unescape(text) if '&' in text else text
+
+
+def date_key(date: dt.date) -> int:
+    return date.year * 10000 + date.month * 100 + date.day
+
+
+def scan_records(data: bytes, target_metrics: Dict[str, str], cutoff_date: dt.date,
+                 partials: DailyPartials, reopen: Dict[str, dt.date] = None,
+                 backfill: Dict[str, set] = None) -> DailyPartials:
+    """バイト列から対象の Record 開始タグだけを取り出し、必要な属性のみ解釈して部分集計に追加
+
+    開始日時はブロック内の全件をまとめて日付キーに変換し（day_bucketing）、
+    基準日より前（backfill 指定時は対象日以外）の記録は残りの属性を解釈せずに読み飛ばす
+    """
+    type_first = data.count(b'<Record ') == data.count(TYPE_FIRST_TAG)
+    pattern = record_pattern(tuple(sorted(target_metrics)), type_first)
+    tags = [tag for tag in pattern.findall(data) if tag[2]]
+    starts = [start.decode('utf-8') for _, _, start in tags]
+
+    keys, valid = DEFAULT_BUCKETER.day_keys(starts)
+    cutoff_key = date_key(cutoff_date)
+    backfill_keys = {typ.encode('utf-8'): {date_key(date) for date in dates}
+                     for typ, dates in backfill.items()} if backfill is not None else None
+    dates = {}
+    for (tag, typ_raw, _), start, key, ok in zip(tags, starts, keys.tolist(), valid.tolist()):
+        if not ok:
+            continue
+        if key < cutoff_key:
+            partials.skipped += 1
+            continue
+        if backfill_keys is not None and key not in backfill_keys.get(typ_raw, ()):
+            continue
+        date = dates.get(key)
+        if date is None:
+            date = dates[key] = dt.date(key // 10000, key // 100 % 100, key % 100)
+        attributes = dict(ATTRIBUTE_PATTERN.findall(tag))
+        end_raw = attributes.get(b'endDate')
+        value_raw = attributes.get(b'value')
+        source_raw = attributes.get(b'sourceName')
+        _ingest(partials, typ_raw.decode('utf-8'), date, start,
+                _text(end_raw) if end_raw is not None else None,
+                _text(value_raw) if value_raw is not None else None,
+                _text(source_raw) if source_raw is not None else "Unknown",
+                target_metrics, cutoff_date, reopen)
+    return partials
+
+
+def scan_stream(stream, target_metrics: Dict[str, str], cutoff_date: dt.date, partials: DailyPartials,
+                reopen: Dict[str, dt.date] = None, block_size: int = 1 << 24) -> DailyPartials:
+    """ストリーム（zip 内の export.xml 等）をブロック単位でスキャン。
+
+    各ブロックは最後の <Record の手前で区切り、残りを次のブロックの先頭に回す（タグは分断しない）
+    """
+    carry = b''
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            break
+        buffer = carry + block
+        cut = buffer.rfind(b'<Record')
+        if cut < 0:
+            carry = buffer[-len(b'<Record'):]
+            continue
+        scan_records(buffer[:cut], target_metrics, cutoff_date, partials, reopen).seal_records(target_metrics)
+        carry = buffer[cut:]
+    return scan_records(carry, target_metrics, cutoff_date, partials, reopen).seal_records(target_metrics)
+
+
+def _align(mm, position: int, end: int) -> int:
+    """position 以降で最初の最上位 <Record の位置（Correlation 内なら閉じタグの後ろへ進める）"""
+    while True:
+        candidate = mm.find(RECORD_TAG, position, end)
+        if candidate < 0:
+            return end
+        window = max(0, candidate - ALIGN_WINDOW)
+        opened = mm.rfind(CORRELATION_OPEN, window, candidate)
+        closed = mm.rfind(CORRELATION_CLOSE, window, candidate)
+        if opened < 0 or closed > opened:
+            return candidate
+        position = mm.find(CORRELATION_CLOSE, candidate, end)
+        if position < 0:
+            return end
+
+
+def record_aligned_ranges(path: str, n_chunks: int) -> List[tuple]:
+    """export.xml をルート要素の内側で n_chunks 個のバイト範囲 [開始, 終了) に分割"""
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        root = ROOT_OPEN.search(mm)
+        if root is None:
+            raise ValueError("HealthData 要素が見つかりません")
+        body_start = root.end()
+        body_end = mm.rfind(ROOT_CLOSE)
+        if body_end < body_start:
+            body_end = len(mm)
+
+        step = max(1, (body_end - body_start) // max(1, n_chunks))
+        bounds = [body_start]
+        for k in range(1, n_chunks):
+            boundary = _align(mm, max(bounds[-1], body_start + k * step), body_end)
+            if boundary >= body_end:
+                break
+            if boundary > bounds[-1]:
+                bounds.append(boundary)
+        bounds.append(body_end)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+ENGINES = ('regex', 'etree')
+
+
+def parse_range(args: tuple) -> DailyPartials:
+    """1範囲の解析（プロセスプールのワーカー）
+
+    options: (記録キャッシュ用に列形式の記録も保持するか, backfill)
+    """
+    path, start, end, chunk_index, target_metrics, cutoff_date, engine, reopen, *options = args
+    collect_records = bool(options and options[0])
+    backfill = options[1] if len(options) > 1 else None
+    with open(path, 'rb') as f:
+        f.seek(start)
+        body = f.read(end - start)
+    partials = DailyPartials(chunk_index, collect_records)
+    if engine == 'regex':
+        return scan_records(body, target_metrics, cutoff_date, partials, reopen, backfill).seal_records(target_metrics)
+    stream = io.BytesIO(b'<HealthData>' + body + ROOT_CLOSE)
+    return parse_records(stream, target_metrics, cutoff_date, partials, reopen, backfill)
+
+
+def _parse_stream(stream, target_metrics: Dict[str, str], cutoff_date: dt.date, engine: str,
+                  reopen: Dict[str, dt.date] = None) -> DailyPartials:
+    if engine == 'regex':
+        return scan_stream(stream, target_metrics, cutoff_date, DailyPartials(), reopen)
+    return parse_records(stream, target_metrics, cutoff_date, DailyPartials(), reopen)
+
+
+def parse_export_file(path: str, target_metrics: Dict[str, str], cutoff_date: dt.date,
+                      workers: int = None, engine: str = 'regex',
+                      reopen: Dict[str, dt.date] = None) -> DailyPartials:
+    """展開済みの export.xml を解析（workers=1 は単一プロセス）
+
+    engine: 'regex' = 高速スキャナ / 'etree' = ElementTree（スキャナで解釈できない書式向け）
+    reopen: type ごとの解析開始日（差分取り込み用。None は全期間）
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"未対応の解析方式です: {engine}")
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        with open(path, 'rb') as f:
+            return _parse_stream(f, target_metrics, cutoff_date, engine, reopen)
+
+    # 範囲ごとの処理量の偏りを均すため、ワーカー数より多めに分割
+    ranges = record_aligned_ranges(path, workers * 4)
+    tasks = [(path, start, end, k, target_metrics, cutoff_date, engine, reopen)
+             for k, (start, end) in enumerate(ranges)]
+    merged = DailyPartials()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for partials in executor.map(parse_range, tasks):
+            merged.merge(partials)
+    return merged
+
+
+def parse_export(zip_path: str, target_metrics: Dict[str, str], cutoff_date: dt.date,
+                 workers: int = None, engine: str = 'regex', reopen: Dict[str, dt.date] = None) -> DailyPartials:
+    """書き出したデータ.zip の export.xml を解析
+
+    workers=1 は zip から直接ストリーム解析、2以上は一時ディレクトリに展開して並列解析。
+    高速スキャナが失敗した場合は ElementTree で解析し直す
+    """
+    workers = workers or os.cpu_count() or 1
+    try:
+        with zipfile.ZipFile(zip_path) as zf:
+            if workers == 1:
+                with zf.open(EXPORT_MEMBER) as xml_file:
+                    return _parse_stream(xml_file, target_metrics, cutoff_date, engine, reopen)
+
+            with tempfile.TemporaryDirectory() as temp_dir:
+                path = os.path.join(temp_dir, 'export.xml')
+                with zf.open(EXPORT_MEMBER) as src, open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, length=1 << 24)
+                return parse_export_file(path, target_metrics, cutoff_date, workers, engine, reopen)
+    except (UnicodeDecodeError, re.error) as e:
+        if engine != 'regex':
+            raise
+        print(f"[WARNING] 高速スキャナで解析できないため ElementTree で再解析します: {e}")
+        return parse_export(zip_path, target_metrics, cutoff_date, workers, engine='etree', reopen=reopen)
+
+
+# ===== ベンチマーク =====
+
+BENCHMARK_TARGETS = {
+    'HKQuantityTypeIdentifierBodyMass': 'weight',
+    'HKQuantityTypeIdentifierBodyFatPercentage': 'bf_rate',
+    'HKQuantityTypeIdentifierLeanBodyMass': 'muscle',
+    'HKQuantityTypeIdentifierDietaryEnergyConsumed': 'intake_cal',
+    'HKQuantityTypeIdentifierActiveEnergyBurned': 'active_cal',
+    'HKQuantityTypeIdentifierBasalEnergyBurned': 'basal_cal',
+    'HKQuantityTypeIdentifierStepCount': 'steps',
+    SLEEP_TYPE: 'sleep',
+    'HKQuantityTypeIdentifierDietaryProtein': 'protein',
+    'HKQuantityTypeIdentifierDietarySugar': 'carbs',
+    'HKQuantityTypeIdentifierDietaryFiber': 'fiber',
+    'HKQuantityTypeIdentifierDietaryFatTotal': 'fat',
+    'HKQuantityTypeIdentifierBodyTemperature': 'body_temp',
+}
+
+# 合成データの記録種別と出現比率（対象外の心拍数を含む）
+BENCHMARK_MIX = {
+    'HKQuantityTypeIdentifierStepCount': 0.28,
+    'HKQuantityTypeIdentifierActiveEnergyBurned': 0.2,
+    'HKQuantityTypeIdentifierBasalEnergyBurned': 0.1,
+    'HKQuantityTypeIdentifierHeartRate': 0.3,
+    SLEEP_TYPE: 0.05,
+    'HKQuantityTypeIdentifierBodyMass': 0.005,
+    'HKQuantityTypeIdentifierBodyFatPercentage': 0.005,
+    'HKQuantityTypeIdentifierLeanBodyMass': 0.005,
+    'HKQuantityTypeIdentifierBodyTemperature': 0.005,
+    'HKQuantityTypeIdentifierDietaryEnergyConsumed': 0.01,
+    'HKQuantityTypeIdentifierDietaryProtein': 0.01,
+    'HKQuantityTypeIdentifierDietarySugar': 0.01,
+    'HKQuantityTypeIdentifierDietaryFiber': 0.01,
+    'HKQuantityTypeIdentifierDietaryFatTotal': 0.01,
+}
+BENCHMARK_SLEEP_STAGES = ['HKCategoryValueSleepAnalysisAsleepCore', 'HKCategoryValueSleepAnalysisAsleepDeep',
+                          'HKCategoryValueSleepAnalysisAsleepREM', 'HKCategoryValueSleepAnalysisAwake']
+
+
+def make_benchmark_export(path: str, n_records: int = 1_000_000, days: int = 365, seed: int = 0,
+                          start_date: str = '2024-06-01'):
+    """分単位の歩数・活動カロリー・基礎代謝（複数ソース）、体組成、食事、睡眠、
+    対象外の心拍数、Correlation 内の Record を含む合成 export.xml"""
+    rng = np.random.default_rng(seed)
+    types = list(BENCHMARK_MIX)
+    weights = np.array(list(BENCHMARK_MIX.values()))
+    base = np.datetime64(f'{start_date}T00:00')
+    minutes = np.sort(rng.integers(0, days * 1440, size=n_records))
+    kinds = rng.choice(len(types), size=n_records, p=weights / weights.sum())
+    sources = np.array(['Apple Watch', 'iPhone', 'RENPHO', 'Oura'])[rng.integers(0, 4, size=n_records)]
+    values = np.round(rng.gamma(2.0, 5.0, size=n_records), 3)
+    stamps = (base + minutes.astype('timedelta64[m]')).astype(str)
+
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE HealthData [\n'
+                '<!ELEMENT HealthData (ExportDate,Me,(Record|Correlation|Workout)*)>\n'
+                '<!ATTLIST HealthData locale CDATA #REQUIRED>\n]>\n'
+                '<HealthData locale="ja_JP">\n <ExportDate value="2025-06-01 00:00:00 +0900"/>\n'
+                ' <Me HKCharacteristicTypeIdentifierSex="HKBiologicalSexMale"/>\n')
+        for i, (stamp, kind, source, value) in enumerate(zip(stamps, kinds.tolist(), sources, values.tolist())):
+            start = f"{stamp[:10]} {stamp[11:16]}:00 +0900"
+            end = f"{stamp[:10]} {stamp[11:13]}:{stamp[14:16]}:59 +0900"
+            typ = types[kind]
+            if typ == SLEEP_TYPE:
+                value = BENCHMARK_SLEEP_STAGES[i % len(BENCHMARK_SLEEP_STAGES)]
+            head = (f' <Record type="{typ}" sourceName="{source}" unit="count" creationDate="{start}" '
+                    f'startDate="{start}" endDate="{end}" value="{value}"')
+            if i % 10 == 0:
+                f.write(f'{head}>\n  <MetadataEntry key="HKWasUserEntered" value="0"/>\n </Record>\n')
+            else:
+                f.write(f'{head}/>\n')
+            if i % 5000 == 0:
+                f.write(f' <Correlation type="HKCorrelationTypeIdentifierFood" sourceName="{source}" '
+                        f'startDate="{start}" endDate="{start}">\n'
+                        f'  <Record type="HKQuantityTypeIdentifierDietaryProtein" sourceName="{source}" unit="g" '
+                        f'startDate="{start}" endDate="{start}" value="12.5"/>\n </Correlation>\n')
+        f.write('</HealthData>\n')
+
+
+def _same_result(a: DailyPartials, b: DailyPartials) -> bool:
+    """部分集計の結合結果（日次の値・睡眠記録・記録ハッシュ・件数）が一致するか"""
+    return a.daily_values() == b.daily_values() and a.sleep_records == b.sleep_records \
+        and a.digests == b.digests and (a.count, a.skipped) == (b.count, b.skipped)
+
+
+def benchmark(n_records: int = 1_000_000, worker_counts: List[int] = None, engine: str = 'regex') -> List[dict]:
+    """単一プロセスと並列解析の処理時間・一致の比較"""
+    worker_counts = worker_counts or sorted({1, 2, 4, os.cpu_count() or 1})
+    cutoff = dt.date(2024, 6, 1)
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'export.xml')
+        make_benchmark_export(path, n_records)
+        baseline = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            partials = parse_export_file(path, BENCHMARK_TARGETS, cutoff, workers, engine)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = (partials, elapsed)
+            results.append({
+                'workers': workers,
+                'seconds': round(elapsed, 2),
+                'speedup': round(baseline[1] / elapsed, 2),
+                'records': partials.count,
+                'identical': _same_result(baseline[0], partials),
+            })
+    return results
+
+
+def benchmark_engines(n_records: int = 1_000_000) -> List[dict]:
+    """ElementTree と高速スキャナの処理速度（全 Record 要素/秒）・一致の比較（単一プロセス）"""
+    cutoff = dt.date(2024, 6, 1)
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'export.xml')
+        make_benchmark_export(path, n_records)
+        with open(path, 'rb') as f:
+            total_records = f.read().count(b'<Record ')
+
+        baseline = None
+        for engine in ('etree', 'regex'):
+            start = time.perf_counter()
+            partials = parse_export_file(path, BENCHMARK_TARGETS, cutoff, 1, engine)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = (partials, elapsed)
+            results.append({
+                'engine': engine,
+                'seconds': round(elapsed, 2),
+                'records_per_sec': int(total_records / elapsed),
+                'speedup': round(baseline[1] / elapsed, 2),
+                'identical': _same_result(baseline[0], partials),
+            })
+    return results
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"=== 解析方式ベンチマーク（{n:,}レコード） ===")
+    for row in benchmark_engines(n):
+        print(row)
+    print(f"=== export.xml 並列解析ベンチマーク（{n:,}レコード） ===")
+    for row in benchmark(n):
+        print(row)
@@ -0,0 +1,235 @@
+"""
+HAE Aggregation - HAEメトリクスの日付別集計（サーバー・ローカル変換共通）
+各データポイントを自身の日付で振り分け、「日付 → {CSVカラム: 値}」を作る
+- 累積メトリクス（歩数・活動カロリー・栄養素等）: 日付ごとに合計
+- それ以外（体重・体脂肪率・睡眠等）: 日付ごとに最後の値
+- 歩数・活動カロリー・基礎代謝: ソース優先順位（source_priority の HAE_RULES）で日ごとに採用ソースを選択
+- 睡眠: 重なるステージ記録を統合したセッションの睡眠時間を起床日に集計（sleep_sessions）
+- 単位: メトリクスの units に応じて既定単位へ換算（unit_registry）。未知の単位のメトリクスは採用しない
+
+分単位の高解像度データ（1日数万点）に対応するため、qty・date を NumPy 配列に取り出し、
+日付はホームタイムゾーン基準の整数の日付キーに一括変換して、日別集計は bincount で一括計算する
+"""
+
+import time
+from operator import itemgetter
+from typing import Dict, List, Any, Optional
+import numpy as np
+import pandas as pd
+from source_priority import SourcePriority
+from sleep_sessions import SleepSessionEngine
+from unit_registry import UnitRegistry
+from day_bucketing import DEFAULT_BUCKETER
+
+# 分単位・記録単位のデータを日ごとに合計するメトリクス
+CUMULATIVE_METRICS = {
+    'step_count', 'active_energy', 'basal_energy_burned',
+    'dietary_energy', 'protein', 'carbohydrates', 'fiber', 'total_fat'
+}
+
+DEFAULT_SOURCE_PRIORITY = SourcePriority(SourcePriority.HAE_RULES)
+SLEEP_ENGINE = SleepSessionEngine()
+UNIT_REGISTRY = UnitRegistry()
+DAY_BUCKETER = DEFAULT_BUCKETER
+
+_get_qty = itemgetter('qty')
+_get_date = itemgetter('date')
+
+
+def parse_point_date(date_str: str) -> Optional[str]:
+    """HAE日付 "2025-07-31 00:00:00 +0900" → ホームタイムゾーンの "2025-07-31"（解釈できなければNone）"""
+    return DAY_BUCKETER.local_day(date_str)
+
+
+def date_keys(date_strs) -> tuple:
+    """HAE日付の配列を一括で日付キー（YYYYMMDD の整数）に変換
+
+    オフセット付きの時刻はホームタイムゾーン（夏時間込み）の現地時刻に直し、
+    1日の開始時刻を境に日付を決める（day_bucketing）
+
+    Returns:
+        (日付キー配列 int64, 有効フラグ配列)
+    """
+    return DAY_BUCKETER.day_keys(date_strs)
+
+
+def format_date_keys(keys) -> List[str]:
+    """日付キー（YYYYMMDD）→ "YYYY-MM-DD" の文字列リスト"""
+    return [f"{k // 10000:04d}-{k // 100 % 100:02d}-{k % 100:02d}" for k in np.asarray(keys).tolist()]
+
+
+def metric_arrays(metric: Dict[str, Any], with_sources: bool = False) -> tuple:
+    """1メトリクスのデータポイントを (日付キー配列, qty配列[, ソース配列]) に取り出す（無効な点は除外）"""
+    points = metric.get('data', [])
+    if not points:
+        empty = (np.zeros(0, dtype=np.int64), np.zeros(0))
+        return empty + (np.zeros(0, dtype=str),) if with_sources else empty
+
+    # 全点に qty・date がある数値データは itemgetter で一括取り出し、欠損・文字列を含む場合のみ個別に解釈
+    try:
+        values = np.fromiter(map(_get_qty, points), dtype=float, count=len(points))
+    except (KeyError, TypeError, ValueError):
+        qty = [point.get('qty') for point in points]
+        values = pd.to_numeric(pd.Series(qty, dtype=object), errors='coerce').to_numpy(dtype=float)
+
+    try:
+        dates = list(map(_get_date, points))
+    except KeyError:
+        dates = [point.get('date') for point in points]
+    keys, valid = date_keys(dates)
+
+    keep = valid & ~np.isnan(values)
+    if not with_sources:
+        return keys[keep], values[keep]
+
+    sources = np.array([point.get('source') or '' for point in points], dtype=str)
+    return keys[keep], values[keep], sources[keep]
+
+
+def aggregate_arrays(keys: np.ndarray, values: np.ndarray, cumulative: bool) -> tuple:
+    """日付キー配列・値配列を日別に集計
+
+    Returns:
+        (昇順のユニーク日付キー, 日別の値)。累積は合計、それ以外は入力順で最後の値
+    """
+    if len(keys) == 0:
+        return keys, values
+
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    if cumulative:
+        totals = np.bincount(inverse, weights=values, minlength=len(unique_keys))
+        return unique_keys, totals
+
+    # 日付ごとの最後の出現位置
+    last = np.full(len(unique_keys), -1)
+    np.maximum.at(last, inverse, np.arange(len(keys)))
+    return unique_keys, values[last]
+
+
+def aggregate_metric_by_date(metric: Dict[str, Any], column: str = None,
+                             source_priority: SourcePriority = None) -> Dict[str, float]:
+    """1メトリクスのデータポイントを日付別に集計 {日付: 値}
+
+    column に優先順位ルールがあり、データポイントにソース情報がある場合は
+    日ごとに最優先ソースのみを採用する（複数デバイスの二重計上を防ぐ）。
+    値は column の既定単位へ換算し、換算できない単位のメトリクスは空の結果とする
+    """
+    factor = UNIT_REGISTRY.factor(column, metric.get('units')) if column is not None else 1.0
+    if factor is None:
+        return {}
+
+    if metric.get('name', '') == 'sleep_analysis':
+        # 睡眠はステージ区間を統合したセッション単位で起床日に集計（集計済み形式の値のみ単位換算）
+        return SLEEP_ENGINE.daily_hours_from_hae(metric.get('data', []), summary_factor=factor)
+
+    source_priority = source_priority or DEFAULT_SOURCE_PRIORITY
+    if column is not None and source_priority.has_rule(column):
+        keys, values, sources = metric_arrays(metric, with_sources=True)
+        values = values * factor if factor != 1.0 else values
+        if len(sources) and (sources != '').any():
+            unique_keys, aggregated, _ = source_priority.select(keys, sources, values, column)
+            return dict(zip(format_date_keys(unique_keys), aggregated.tolist()))
+    else:
+        keys, values = metric_arrays(metric)
+        values = values * factor if factor != 1.0 else values
+
+    unique_keys, aggregated = aggregate_arrays(keys, values, metric.get('name', '') in CUMULATIVE_METRICS)
+    return dict(zip(format_date_keys(unique_keys), aggregated.tolist()))
+
+
+def find_unknown_units(metrics: List[Dict[str, Any]], metric_mapping: Dict[str, str]) -> List[Dict[str, str]]:
+    """既定単位へ換算できない単位のメトリクス一覧（取り込み結果の報告用）"""
+    return UNIT_REGISTRY.unknown_units(metrics, metric_mapping)
+
+
+def bucket_metrics_by_date(metrics: List[Dict[str, Any]], metric_mapping: Dict[str, str],
+                           source_priority: SourcePriority = None) -> Dict[str, Dict[str, float]]:
+    """全メトリクスを日付別に振り分け {日付: {CSVカラム: 値}}（日付昇順）"""
+    for unknown in find_unknown_units(metrics, metric_mapping):
+        print(f"[WARNING] 未対応の単位のためスキップ: {unknown['metric']} ({unknown['units']})")
+
+    buckets = {}
+    for metric in metrics:
+        column = metric_mapping.get(metric.get('name', ''))
+        if column is None:
+            continue
+        for day, value in aggregate_metric_by_date(metric, column, source_priority).items():
+            buckets.setdefault(day, {})[column] = value
+
+    return {day: buckets[day] for day in sorted(buckets)}
+
+
+# ===== ベンチマーク =====
+
+def _aggregate_metric_loop(metric: Dict[str, Any]) -> Dict[str, float]:
+    """比較用: データポイントごとのPythonループによる日別集計（従来方式）"""
+    cumulative = metric.get('name', '') in CUMULATIVE_METRICS
+    values = {}
+    for point in metric.get('data', []):
+        date_str = point.get('date', '')
+        qty = point.get('qty')
+        if not date_str or qty is None:
+            continue
+        day = date_str.split(' +')[0].split(' ')[0]
+        if cumulative:
+            values[day] = values.get(day, 0) + qty
+        else:
+            values[day] = qty
+    return values
+
+
+def make_benchmark_payload(n_points: int = 1_000_000, days: int = 30, seed: int = 0) -> List[Dict[str, Any]]:
+    """分単位の歩数・活動カロリーと日次の体重を模した合成メトリクス"""
+    rng = np.random.default_rng(seed)
+    per_metric = n_points // 2
+    minutes = np.sort(rng.integers(0, days * 1440, size=per_metric))
+    base = np.datetime64('2025-09-01T00:00')
+    stamps = (base + minutes.astype('timedelta64[m]')).astype(str)
+    dates = [f"{s[:10]} {s[11:16]}:00 +0900" for s in stamps]
+
+    steps = rng.poisson(12, size=per_metric)
+    energy = np.round(rng.gamma(2.0, 0.4, size=per_metric), 3)
+    return [
+        {'name': 'step_count', 'units': 'count',
+         'data': [{'date': d, 'qty': int(q), 'source': 'Apple Watch'} for d, q in zip(dates, steps)]},
+        {'name': 'active_energy', 'units': 'kcal',
+         'data': [{'date': d, 'qty': float(q), 'source': 'Apple Watch'} for d, q in zip(dates, energy)]},
+        {'name': 'weight_body_mass', 'units': 'kg',
+         'data': [{'date': f"{d} 07:00:00 +0900", 'qty': 70.0 - i * 0.05}
+                  for i, d in enumerate(np.arange(base, base + np.timedelta64(days, 'D'), np.timedelta64(1, 'D'))
+                                        .astype('datetime64[D]').astype(str))]},
+    ]
+
+
+def benchmark(n_points: int = 1_000_000, repeat: int = 3) -> dict:
+    """従来ループとNumPy集計の処理時間比較（結果の一致も検証）"""
+    metrics = make_benchmark_payload(n_points)
+    timings = {}
+    results = {}
+    for label, func in (('loop', _aggregate_metric_loop), ('numpy', aggregate_metric_by_date)):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results[label] = [func(metric) for metric in metrics]
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best
+
+    identical = all(
+        loop.keys() == vec.keys() and np.allclose([loop[d] for d in loop], [vec[d] for d in loop])
+        for loop, vec in zip(results['loop'], results['numpy'])
+    )
+    return {
+        'points': sum(len(m['data']) for m in metrics),
+        'loop_sec': round(timings['loop'], 3),
+        'numpy_sec': round(timings['numpy'], 3),
+        'speedup': round(timings['loop'] / timings['numpy'], 2),
+        'identical': identical,
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    print(f"=== HAE日別集計ベンチマーク（{n:,}点） ===")
+    for key, value in benchmark(n).items():
+        print(f"{key}: {value}")
@@ -5,10 +5,10 @@ HAE Data Converter - HAEデータをCSV形式に変換
 
 import json
 import pandas as pd
-from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import os
 from pathlib import Path
+from hae_aggregation import CUMULATIVE_METRICS, bucket_metrics_by_date, metric_arrays, format_date_keys, parse_point_date
 
 class HAEDataConverter:
     """HAEデータを既存CSV形式に変換するクラス"""
@@ -53,18 +53,16 @@ class HAEDataConverter:
         """HAE日付形式をCSV形式に変換
         
         Args:
-            date_str: "2025-07-31 00:00:00 +0900" 形式
+            date_str: "2025-07-31 00:00:00 +0900" 形式（オフセットは負の値・夏時間も可）
             
         Returns:
-            "2025-07-31" 形式
+            ホームタイムゾーンでの "2025-07-31" 形式
         """
-        try:
-            # タイムゾーン付き日付をパース
-            dt = datetime.strptime(date_str.split(' +')[0], "%Y-%m-%d %H:%M:%S")
-            return dt.strftime("%Y-%m-%d")
-        except Exception as e:
-            print(f"[ERROR] 日付変換エラー: {date_str} -> {e}")
-            return date_str.split()[0]  # フォールバック
+        day = parse_point_date(date_str)
+        if day is None:
+            print(f"[ERROR] 日付変換エラー: {date_str}")
+            return str(date_str).split()[0] if date_str else ''  # フォールバック
+        return day
             
     def extract_metric_value(self, metric: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """メトリクスから値を抽出（累積処理対応版）"""
@@ -75,29 +73,15 @@ class HAEDataConverter:
             return None
             
         # 累積処理が必要なメトリクス（分単位データを合計）
-        cumulative_metrics = {
-            'step_count', 'active_energy', 'basal_energy_burned',
-            'dietary_energy', 'protein', 'carbohydrates', 'fiber', 'total_fat'
-        }
-        
-        if name in cumulative_metrics:
-            # 全データポイントを累積
-            total_value = 0
-            sample_date = None
-            
-            for point in data_points:
-                qty = point.get('qty', 0)
-                if qty is not None:
-                    total_value += qty
-                if sample_date is None:
-                    sample_date = point.get('date', '')
-                    
-            print(f"[INFO] {name} 累積処理: {len(data_points)}個 → 合計 {total_value}")
+        if name in CUMULATIVE_METRICS:
+            # 全データポイントを配列で一括合計
+            keys, values = metric_arrays(metric)
+            total_value = float(values.sum())
             
             return {
                 'name': name,
                 'value': round(total_value, 1),
-                'date': self.parse_hae_date(sample_date) if sample_date else '',
+                'date': format_date_keys(keys[:1])[0] if len(keys) else '',
                 'units': metric.get('units', ''),
                 'source': f'HAE累積({len(data_points)}件)'
             }
@@ -113,86 +97,89 @@ class HAEDataConverter:
                 'source': latest_point.get('source', 'HAE')
             }
         
-    def convert_hae_to_csv_row(self, hae_file: Path) -> Optional[Dict[str, Any]]:
-        """HAE JSONファイルを1行のCSVデータに変換"""
+    CSV_COLUMNS = [
+        'date', '体重_kg', '筋肉量_kg', '体脂肪量_kg', '体脂肪率',
+        'カロリー収支_kcal', '摂取カロリー_kcal', '消費カロリー_kcal',
+        '基礎代謝_kcal', '活動カロリー_kcal', '歩数', '睡眠時間_hours',
+        '体表温度_celsius', '体表温変化_celsius', '体表温偏差_celsius', '体表温トレンド_celsius',
+        'タンパク質_g', '糖質_g', '食物繊維_g', '脂質_g'
+    ]
+
+    def build_csv_row(self, date_value: str, values: Dict[str, Any]) -> Dict[str, Any]:
+        """1日分のメトリクス値からCSV行を作成（計算項目を含む）"""
+        csv_row = {col: None for col in self.CSV_COLUMNS}
+        csv_row.update(values)
+        csv_row['date'] = date_value
+
+        # 累積メトリクスは小数1桁に丸める
+        for metric_name in CUMULATIVE_METRICS:
+            column = self.METRIC_MAPPING.get(metric_name)
+            if csv_row.get(column) is not None:
+                csv_row[column] = round(csv_row[column], 1)
+
+        weight_kg = csv_row['体重_kg']
+        body_fat_rate = csv_row['体脂肪率']
+        intake_cal = csv_row['摂取カロリー_kcal']
+        basal_cal = csv_row['基礎代謝_kcal']
+        active_cal = csv_row['活動カロリー_kcal']
+
+        # 計算項目
+        if weight_kg and body_fat_rate:
+            csv_row['体脂肪量_kg'] = round(weight_kg * (body_fat_rate / 100), 1)
+
+        if basal_cal and active_cal:
+            csv_row['消費カロリー_kcal'] = basal_cal + active_cal
+
+        if intake_cal and csv_row['消費カロリー_kcal']:
+            csv_row['カロリー収支_kcal'] = intake_cal - csv_row['消費カロリー_kcal']
+
+        # Oura体表温データは別途取得（既存ロジック使用）
+        return csv_row
+
+    def convert_hae_to_daily_rows(self, hae_file: Path) -> List[Dict[str, Any]]:
+        """HAE JSONファイルを日付ごとのCSV行に変換（複数日にまたがるペイロード対応）
+
+        各データポイントを自身の日付で振り分け、累積メトリクスは日ごとに合計、
+        それ以外は日ごとの最新値を使う
+
+        Returns:
+            日付昇順のCSV行リスト（変換できなければ空リスト）
+        """
         try:
             with open(hae_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                
+
             metrics = data.get('data', {}).get('metrics', [])
-            
+
             if not metrics:
                 print("[ERROR] メトリクスデータが見つかりません")
-                return None
-                
-            # CSVカラム初期化
-            csv_row = {col: None for col in [
-                'date', '体重_kg', '筋肉量_kg', '体脂肪量_kg', '体脂肪率',
-                'カロリー収支_kcal', '摂取カロリー_kcal', '消費カロリー_kcal',
-                '基礎代謝_kcal', '活動カロリー_kcal', '歩数', '睡眠時間_hours',
-                '体表温度_celsius', '体表温変化_celsius', '体表温偏差_celsius', '体表温トレンド_celsius',
-                'タンパク質_g', '糖質_g', '食物繊維_g', '脂質_g'
-            ]}
-            
-            # メトリクスデータを処理
-            date_value = None
-            weight_kg = None
-            body_fat_rate = None
-            intake_cal = None
-            basal_cal = None
-            active_cal = None
-            
-            for metric in metrics:
-                extracted = self.extract_metric_value(metric)
-                if not extracted:
-                    continue
-                    
-                metric_name = extracted['name']
-                value = extracted['value']
-                date_value = extracted['date']  # 全メトリクス共通の日付
-                
-                # マッピングされているメトリクスを変換
-                if metric_name in self.METRIC_MAPPING:
-                    csv_column = self.METRIC_MAPPING[metric_name]
-                    csv_row[csv_column] = value
-                    
-                    # 計算用に特別保存
-                    if metric_name == 'weight_body_mass':
-                        weight_kg = value
-                    elif metric_name == 'body_fat_percentage':
-                        body_fat_rate = value
-                    elif metric_name == 'dietary_energy':
-                        intake_cal = value
-                    elif metric_name == 'basal_energy_burned':
-                        basal_cal = value
-                    elif metric_name == 'active_energy':
-                        active_cal = value
-                        
-            # 日付設定
-            csv_row['date'] = date_value
-            
-            # 計算項目
-            if weight_kg and body_fat_rate:
-                csv_row['体脂肪量_kg'] = round(weight_kg * (body_fat_rate / 100), 1)
-                
-            if basal_cal and active_cal:
-                csv_row['消費カロリー_kcal'] = basal_cal + active_cal
-                
-            if intake_cal and csv_row['消費カロリー_kcal']:
-                csv_row['カロリー収支_kcal'] = intake_cal - csv_row['消費カロリー_kcal']
-                
-            # Oura体表温データは別途取得（既存ロジック使用）
-            csv_row['体表温度_celsius'] = None
-            csv_row['体表温変化_celsius'] = None  
-            csv_row['体表温偏差_celsius'] = None
-            csv_row['体表温トレンド_celsius'] = None
-            
-            print(f"[SUCCESS] HAEデータ変換完了: {date_value}")
-            return csv_row
-            
+                return []
+
+            buckets = bucket_metrics_by_date(metrics, self.METRIC_MAPPING)
+            rows = [self.build_csv_row(date_value, values) for date_value, values in buckets.items()]
+
+            if rows:
+                print(f"[SUCCESS] HAEデータ変換完了: {len(rows)}日分 ({rows[0]['date']} 〜 {rows[-1]['date']})")
+            return rows
+
         except Exception as e:
             print(f"[ERROR] HAEデータ変換エラー: {e}")
-            return None
+            return []
+
+    def convert_hae_to_csv_row(self, hae_file: Path) -> Optional[Dict[str, Any]]:
+        """HAE JSONファイルを1行のCSVデータに変換（最新日の行）"""
+        rows = self.convert_hae_to_daily_rows(hae_file)
+        return rows[-1] if rows else None
+
+    def extract_workouts(self, hae_file: Path) -> List[Dict[str, Any]]:
+        """HAE JSONファイルのワークアウト一覧"""
+        try:
+            with open(hae_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data.get('data', {}).get('workouts', []) or []
+        except Exception as e:
+            print(f"[ERROR] ワークアウト読み込みエラー: {e}")
+            return []
             
     def test_conversion(self):
         """変換機能のテスト"""
@@ -10,6 +10,12 @@ from datetime import datetime, date, timedelta
 from pathlib import Path
 import json
 from csv_data_integrator import CSVDataIntegrator
+from range_aggregate_index import RangeAggregateIndex
+from trend_regression import TrendRegressionEngine
+from plateau_detector import PlateauDetector
+from tdee_estimator import TDEEEstimator
+from seasonality import WeekdaySeasonality
+from training_load import TrainingLoadModel
 
 class HealthAnalyticsEngine:
     """健康指標分析エンジン - ボディリコンプ特化版"""
@@ -29,6 +35,23 @@ class HealthAnalyticsEngine:
         self.target_body_fat_rate = 12.0  # 目標体脂肪率12%
         self.target_weekly_calorie_deficit = -1000  # 週-1000kcal目標
         
+        # 体脂肪率トレンド推定（日次体脂肪率に28日窓の頑健回帰）
+        self.trend_engine = TrendRegressionEngine(window=28)
+        self.trend_column = '体脂肪率'
+        self.trend_method = 'theil_sen'
+
+        # 停滞期検出（体脂肪量の変化点検出＋取り込みごとのCUSUM）
+        self.plateau_detector = PlateauDetector(str(self.reports_dir))
+
+        # 実消費カロリー推定（摂取量と平滑化体重の変化から逆算）
+        self.tdee_estimator = TDEEEstimator(windows=(14, 28))
+
+        # 曜日効果の季節調整（週末の食べ過ぎ等による期間比較の偏りを除去）
+        self.seasonality = WeekdaySeasonality()
+
+        # トレーニング負荷（活動カロリー＋ワークアウトの ATL/CTL/TSB）
+        self.training_load = TrainingLoadModel(str(self.reports_dir))
+        
     def load_latest_data(self) -> pd.DataFrame:
         """最新の7日移動平均データを読み込み（KGI計算用）"""
         ma7_file = self.reports_dir / "7日移動平均データ.csv"
@@ -46,16 +69,24 @@ class HealthAnalyticsEngine:
         except Exception as e:
             print(f"[ERROR] データ読み込みエラー: {e}")
             return pd.DataFrame()
+
+    def build_range_index(self, df: pd.DataFrame) -> RangeAggregateIndex:
+        """読み込んだデータの範囲集計インデックス（季節調整列も含め1回だけ構築し、各集計で共有）"""
+        adjusted_col = self.seasonality.column_name('カロリー収支_kcal')
+        if not df.empty and adjusted_col not in df.columns:
+            df = df.join(self.seasonality.deseasonalize(df))
+        return RangeAggregateIndex(df)
     def analyze_metabolism_status(self, df: pd.DataFrame) -> dict:
         """代謝状況分析とチートデイ判定"""
         if df.empty:
             return {}
             
         try:
-            # 期間別脂肪減少ペース
-            fat_loss_28d = self._get_fat_loss_trend(df, 28)
-            fat_loss_14d = self._get_fat_loss_trend(df, 14)
-            fat_loss_7d = self._get_fat_loss_trend(df, 7)
+            # 期間別脂肪減少ペース（3期間を一括計算）
+            fat_loss = self._get_fat_loss_trends(df, [28, 14, 7])
+            fat_loss_28d = fat_loss[28]
+            fat_loss_14d = fat_loss[14]
+            fat_loss_7d = fat_loss[7]
             
             # 体表温変化（過去7日平均）
             temp_change = self._get_body_temp_change(df, 7)
@@ -64,9 +95,11 @@ class HealthAnalyticsEngine:
             is_fat_loss_stalled = fat_loss_14d is not None and fat_loss_7d is not None and fat_loss_14d <= 0 and fat_loss_7d <= 0
             is_temp_dropping = temp_change is not None and temp_change < -0.1
             
-            # チートデイ判定
-            days_stalled = self._count_stall_days(df)
+            # チートデイ判定（変化点検出による実際の停滞日数）
+            plateau = self.plateau_detector.detect_plateau(df)
+            days_stalled = plateau['plateau_days']
             cheat_day_recommended = (days_stalled >= 14 and is_temp_dropping)
+            online = self.plateau_detector.online_status()
             
             return {
                 'fat_loss_28d': round(fat_loss_28d, 2) if fat_loss_28d is not None else None,
@@ -75,32 +108,57 @@ class HealthAnalyticsEngine:
                 'body_temp_change': round(temp_change, 1) if temp_change is not None else None,
                 'metabolism_status': 'stopped' if is_fat_loss_stalled else 'normal',
                 'cheat_day_recommended': cheat_day_recommended,
-                'stall_days': days_stalled
+                'stall_days': days_stalled,
+                'plateau_start': plateau['plateau_start'],
+                'plateau_slope_per_day': plateau['segment_slope_per_day'],
+                'change_points': plateau['change_points'],
+                'plateau_alarm': online.get('alarm'),
+                'plateau_alarm_since': online.get('run_start')
             }
             
         except Exception as e:
             print(f"[ERROR] 代謝状況分析エラー: {e}")
             return {}
             
-    def _get_fat_loss_trend(self, df: pd.DataFrame, days: int) -> float:
-        """指定期間の脂肪減少トレンド計算（適切な移動平均使用）"""
-        # 適切な移動平均列を選択
+    def _ma_column_for_period(self, metric: str, days: int) -> str:
+        """期間に対応する移動平均列名（28日→ma28, 14日→ma14, その他→ma7）"""
         if days == 28:
-            col_name = '体脂肪量_kg_ma28'
+            return f'{metric}_ma28'
         elif days == 14:
-            col_name = '体脂肪量_kg_ma14'
+            return f'{metric}_ma14'
         else:  # 7日間
-            col_name = '体脂肪量_kg_ma7'
+            return f'{metric}_ma7'
+            
+    def _get_ma_changes(self, df: pd.DataFrame, metric: str, windows) -> dict:
+        """複数期間の移動平均変化を一括計算（列ごとのdropnaは1回のみ）
         
-        valid_data = df.dropna(subset=[col_name])
+        Returns:
+            {期間日数: 現在の移動平均値 - days日前の移動平均値（データ不足時None）}
+        """
+        valid_values = {}
+        changes = {}
         
-        if len(valid_data) < days:
-            return None
+        for days in windows:
+            col_name = self._ma_column_for_period(metric, days)
+            if col_name not in valid_values:
+                valid_values[col_name] = df[col_name].dropna().to_numpy(dtype=float)
+            values = valid_values[col_name]
             
-        # 現在の移動平均値 vs days日前の移動平均値
-        current_value = valid_data.iloc[-1][col_name]
-        past_value = valid_data.iloc[-days][col_name]
-        return current_value - past_value
+            if len(values) < days:
+                changes[days] = None
+            else:
+                # 現在の移動平均値 vs days日前の移動平均値
+                changes[days] = values[-1] - values[-days]
+                
+        return changes
+        
+    def _get_fat_loss_trends(self, df: pd.DataFrame, windows) -> dict:
+        """複数期間の脂肪減少トレンドを一括計算"""
+        return self._get_ma_changes(df, '体脂肪量_kg', windows)
+        
+    def _get_fat_loss_trend(self, df: pd.DataFrame, days: int) -> float:
+        """指定期間の脂肪減少トレンド計算（適切な移動平均使用）"""
+        return self._get_fat_loss_trends(df, [days])[days]
         
     def _get_body_temp_change(self, df: pd.DataFrame, days: int) -> float:
         """体表温変化計算（Oura Ring体表温偏差データ使用）"""
@@ -126,18 +184,8 @@ class HealthAnalyticsEngine:
             return None
         
     def _count_stall_days(self, df: pd.DataFrame) -> int:
-        """脂肪減少停滞日数カウント"""
-        # 簡易実装：過去14日で脂肪量変化がほぼ0の場合
-        valid_data = df.dropna(subset=['体脂肪量_kg_ma14'])
-        
-        if len(valid_data) < 14:
-            return 0
-            
-        # 現在の14日移動平均 vs 14日前の14日移動平均
-        current_fat = valid_data.iloc[-1]['体脂肪量_kg_ma14']
-        past_fat = valid_data.iloc[-14]['体脂肪量_kg_ma14']
-        fat_change = abs(current_fat - past_fat)
-        return 14 if fat_change < 0.1 else 0
+        """脂肪減少停滞日数カウント（最新の停滞区間の開始日からの日数）"""
+        return self.plateau_detector.detect_plateau(df)['plateau_days']
         
     def calculate_calorie_adjustment(self, current_7d_balance: float, current_14d_balance: float) -> dict:
         """カロリー調整計算と運動量換算"""
@@ -245,14 +293,18 @@ class HealthAnalyticsEngine:
             achieved_reduction = start_bf_rate - current_bf_rate  # 1.1%
             progress_rate = (achieved_reduction / total_reduction_needed) * 100 if total_reduction_needed > 0 else 0
             
-            # 週間平均減少率計算（過去4週間）
-            weeks_data = valid_data.tail(28)  # 過去28日≈4週間
-            if len(weeks_data) >= 2:
+            # 週間平均減少率計算（過去4週間の回帰トレンド）
+            trend = self.trend_engine.latest_fit(df, self.trend_column, self.trend_method)
+            if trend:
+                weekly_reduction_rate = -trend['slope_per_day'] * 7
+                weekly_reduction_ci = [round(-trend['ci_high'] * 7, 3), round(-trend['ci_low'] * 7, 3)]
+            else:
+                # 回帰に必要なデータがない場合は28日間の始点・終点から算出
+                weeks_data = valid_data.tail(28)  # 過去28日≈4週間
                 weeks_elapsed = (weeks_data.iloc[-1]['date'] - weeks_data.iloc[0]['date']).days / 7
                 total_reduction = weeks_data.iloc[0]['体脂肪率_ma7'] - weeks_data.iloc[-1]['体脂肪率_ma7']
                 weekly_reduction_rate = total_reduction / weeks_elapsed if weeks_elapsed > 0 else 0
-            else:
-                weekly_reduction_rate = 0
+                weekly_reduction_ci = None
                 
             # 到達予測日計算
             remaining_reduction = current_bf_rate - self.target_body_fat_rate
@@ -276,6 +328,8 @@ class HealthAnalyticsEngine:
                 'progress_rate': round(progress_rate, 1),
                 'progress_bar': progress_bar,
                 'weekly_reduction_rate': round(weekly_reduction_rate, 3),
+                'weekly_reduction_rate_ci': weekly_reduction_ci,
+                'trend_method': trend.get('method', 'endpoints'),
                 'target_date': target_date_str
             }
             
@@ -301,70 +355,84 @@ class HealthAnalyticsEngine:
             
     def calculate_period_performance(self, df: pd.DataFrame, days: int) -> dict:
         """期間成績計算（指定日数間）- 移動平均列使用版"""
+        return self.calculate_period_performances(df, [days]).get(days, {})
+        
+    def calculate_period_performances(self, df: pd.DataFrame, windows, index: RangeAggregateIndex = None) -> dict:
+        """複数期間の成績を一括計算（カロリー累積和を全期間で共有）
+        
+        Args:
+            df: 移動平均データ
+            windows: 期間日数のリスト（例: [28, 14, 7]）
+            index: df の範囲集計インデックス（build_range_index。省略時はここで構築）
+            
+        Returns:
+            {期間日数: calculate_period_performance と同形式のdict}
+        """
         if df.empty:
             return {}
             
         try:
-            # 移動平均列の選択
-            if days == 28:
-                fat_col = '体脂肪量_kg_ma28'
-                muscle_col = '筋肉量_kg_ma28'
-            elif days == 14:
-                fat_col = '体脂肪量_kg_ma14'
-                muscle_col = '筋肉量_kg_ma14'
-            else:  # 7日間
-                fat_col = '体脂肪量_kg_ma7'
-                muscle_col = '筋肉量_kg_ma7'
-            
-            # 有効データのみで計算
-            valid_bf_data = df.dropna(subset=[fat_col])
-            valid_muscle_data = df.dropna(subset=[muscle_col])
-            
             # 体脂肪量・筋肉量変化計算（移動平均の変化）
-            bf_mass_change = None
-            bf_reduction_rate = None
-            muscle_mass_change = None
-            muscle_rate = None
+            bf_changes = self._get_ma_changes(df, '体脂肪量_kg', windows)
+            muscle_changes = self._get_ma_changes(df, '筋肉量_kg', windows)
             
-            if len(valid_bf_data) >= days:
-                # 現在の移動平均値 vs days日前の移動平均値
-                current_bf = valid_bf_data.iloc[-1][fat_col]
-                past_bf = valid_bf_data.iloc[-days][fat_col]
-                bf_mass_change = current_bf - past_bf
-                bf_reduction_rate = bf_mass_change / days
+            # カロリー関連は範囲集計インデックス（累積和）を全期間で共有（季節調整列を含む）
+            adjusted_col = self.seasonality.column_name('カロリー収支_kcal')
+            cal_index = index if index is not None else self.build_range_index(df)
+            n = cal_index.length
+                
+            def tail_sum(col, days):
+                """直近days行の合計と有効件数"""
+                start = max(n - days, 0)
+                return (cal_index.query_positions(col, start, n - 1, 'sum'),
+                        cal_index.query_positions(col, start, n - 1, 'count'))
                 
-            if len(valid_muscle_data) >= days:
-                # 現在の移動平均値 vs days日前の移動平均値
-                current_muscle = valid_muscle_data.iloc[-1][muscle_col]
-                past_muscle = valid_muscle_data.iloc[-days][muscle_col]
-                muscle_mass_change = current_muscle - past_muscle
-                muscle_rate = muscle_mass_change / days
-            
-            # カロリー関連計算（直近days日分）
-            period_df = df.tail(days)
-            cal_balance_total = period_df['カロリー収支_kcal'].sum()
-            cal_balance_avg = period_df['カロリー収支_kcal'].mean()
-            
-            # 摂取・消費カロリー合計（新規追加）
-            total_intake = period_df['摂取カロリー_kcal'].sum()
-            total_consumed = period_df['消費カロリー_kcal'].sum()
-            
-            return {
-                'period_days': days,
-                'actual_data_days': len(period_df),
-                'body_fat_mass_change': round(bf_mass_change, 2) if bf_mass_change is not None else None,
-                'body_fat_reduction_rate_per_day': round(bf_reduction_rate, 3) if bf_reduction_rate is not None else None,
-                'muscle_mass_change': round(muscle_mass_change, 2) if muscle_mass_change is not None else None,
-                'muscle_rate_per_day': round(muscle_rate, 3) if muscle_rate is not None else None,
-                'calorie_balance_total': round(cal_balance_total, 0),
-                'calorie_balance_avg': round(cal_balance_avg, 1),
-                'total_intake_calories': round(total_intake, 0),
-                'total_consumed_calories': round(total_consumed, 0)
-            }
-            
         except Exception as e:
-            print(f"[ERROR] {days}日間成績計算エラー: {e}")
-            return {}
+            print(f"[ERROR] 期間成績一括計算エラー: {e}")
+            return {days: {} for days in windows}
+            
+        results = {}
+        for days in windows:
+            try:
+                bf_mass_change = bf_changes[days]
+                muscle_mass_change = muscle_changes[days]
+                bf_reduction_rate = bf_mass_change / days if bf_mass_change is not None else None
+                muscle_rate = muscle_mass_change / days if muscle_mass_change is not None else None
+                
+                # カロリー関連計算（直近days日分）
+                cal_balance_total, cal_balance_count = tail_sum('カロリー収支_kcal', days)
+                cal_balance_avg = cal_balance_total / cal_balance_count if cal_balance_count else np.nan
+                
+                # 曜日効果を除いた収支平均（記録日の曜日の偏りを補正）
+                if adjusted_col in cal_index.df.columns:
+                    adjusted_total, adjusted_count = tail_sum(adjusted_col, days)
+                    cal_balance_avg_adjusted = adjusted_total / adjusted_count if adjusted_count else np.nan
+                else:
+                    cal_balance_avg_adjusted = np.nan
+                
+                # 摂取・消費カロリー合計
+                total_intake, _ = tail_sum('摂取カロリー_kcal', days)
+                total_consumed, _ = tail_sum('消費カロリー_kcal', days)
+                
+                results[days] = {
+                    'period_days': days,
+                    'actual_data_days': min(n, days),
+                    'body_fat_mass_change': round(bf_mass_change, 2) if bf_mass_change is not None else None,
+                    'body_fat_reduction_rate_per_day': round(bf_reduction_rate, 3) if bf_reduction_rate is not None else None,
+                    'muscle_mass_change': round(muscle_mass_change, 2) if muscle_mass_change is not None else None,
+                    'muscle_rate_per_day': round(muscle_rate, 3) if muscle_rate is not None else None,
+                    'calorie_balance_total': round(cal_balance_total, 0),
+                    'calorie_balance_avg': round(cal_balance_avg, 1),
+                    'calorie_balance_avg_deseasonalized': round(cal_balance_avg_adjusted, 1),
+                    'total_intake_calories': round(total_intake, 0),
+                    'total_consumed_calories': round(total_consumed, 0)
+                }
+                
+            except Exception as e:
+                print(f"[ERROR] {days}日間成績計算エラー: {e}")
+                results[days] = {}
+                
+        return results
             
     def generate_analysis_report(self) -> dict:
         """ボディリコンプ特化分析レポート生成"""
@@ -375,23 +443,34 @@ class HealthAnalyticsEngine:
         if df.empty:
             return {}
             
+        # 範囲集計インデックス（期間成績で共有）
+        range_index = self.build_range_index(df)
+        
         # KGI進捗分析
         kgi_progress = self.calculate_kgi_progress(df)
         
-        # 期間別分析（既存）
-        days28_perf = self.calculate_period_performance(df, 28)
-        days14_perf = self.calculate_period_performance(df, 14)
-        days7_perf = self.calculate_period_performance(df, 7)
+        # 期間別分析（28/14/7日を一括計算）
+        period_perf = self.calculate_period_performances(df, [28, 14, 7], range_index)
+        days28_perf = period_perf.get(28, {})
+        days14_perf = period_perf.get(14, {})
+        days7_perf = period_perf.get(7, {})
         
         # 代謝状況分析
         metabolism = self.analyze_metabolism_status(df)
         
+        # トレーニング負荷（取り込み時に逐次更新した状態、未作成なら全期間から作成）
+        training_load = self.training_load.status() or \
+            self.training_load.update_online(df, self.integrator.workout_store.daily_energy())
+        
         # カロリー調整計算
         calorie_adj = self.calculate_calorie_adjustment(
             days7_perf.get('calorie_balance_total', 0),
             days14_perf.get('calorie_balance_total', 0)
         )
         
+        # エネルギー収支モデル（デバイス推定の消費カロリーとの比較）
+        energy_balance = self.tdee_estimator.summarize(df)
+        
         # レポート統合
         report = {
             'generated_at': datetime.now().isoformat(),
@@ -405,7 +484,9 @@ class HealthAnalyticsEngine:
             'last_14days': days14_perf,
             'last_7days': days7_perf,
             'metabolism_analysis': metabolism,
-            'calorie_adjustment': calorie_adj
+            'training_load': training_load,
+            'calorie_adjustment': calorie_adj,
+            'energy_balance': energy_balance
         }
         
         print("[SUCCESS] ボディリコンプ分析レポート生成完了")
@@ -419,6 +500,7 @@ class HealthAnalyticsEngine:
         try:
             # データ読み込み
             df = self.load_latest_data()
+            range_index = self.build_range_index(df) if not df.empty else None
             
             kgi = report.get('kgi_progress', {})
             days28 = report.get('last_28days', {})
@@ -436,13 +518,13 @@ class HealthAnalyticsEngine:
             today_cal_prediction = self._calculate_today_calorie_prediction(df)
             
             # PFCバランス計算
-            pfc_analysis = self._calculate_pfc_balance(df)
+            pfc_analysis = self._calculate_pfc_balance(df, range_index)
             
             # 食物繊維計算
-            fiber_analysis = self._calculate_fiber_intake(df)
+            fiber_analysis = self._calculate_fiber_intake(df, range_index)
             
-            # 目標到達予測
-            target_prediction = self._calculate_target_prediction(bf_changes)
+            # 目標到達予測（回帰トレンド使用）
+            target_prediction = self._calculate_target_prediction(bf_changes, kgi)
             
             # 新フォーマットメッセージ生成
             message = f"""🎯 体脂肪率進捗 | {timestamp}
@@ -652,16 +734,20 @@ class HealthAnalyticsEngine:
             print(f"[ERROR] カロリー収支リスト作成エラー: {e}")
             return "計算エラー"
             
-    def _calculate_pfc_balance(self, df) -> dict:
+    def _previous_7days_positions(self, df) -> tuple:
+        """df.tail(8).head(7) に相当する行位置範囲（両端含む）"""
+        start = max(len(df) - 8, 0)
+        return start, min(start + 7, len(df)) - 1
+            
+    def _calculate_pfc_balance(self, df, index: RangeAggregateIndex = None) -> dict:
         """PFCバランス計算（ケトジェニック仕様）"""
         try:
-            # 過去7日間のPFCデータ取得
-            recent_7days = df.tail(8).head(7)
-            
-            # 平均値計算
-            avg_protein = recent_7days['タンパク質_g'].mean()
-            avg_fat = recent_7days['脂質_g'].mean()
-            avg_carb = recent_7days['糖質_g'].mean()
+            # 過去7日間（当日除く）のPFC平均値
+            index = index if index is not None else RangeAggregateIndex(df)
+            lo, hi = self._previous_7days_positions(df)
+            avg_protein = index.query_positions('タンパク質_g', lo, hi, 'mean')
+            avg_fat = index.query_positions('脂質_g', lo, hi, 'mean')
+            avg_carb = index.query_positions('糖質_g', lo, hi, 'mean')
             
             # カロリー換算（P:4kcal/g, F:9kcal/g, C:4kcal/g）
             protein_kcal = avg_protein * 4
@@ -717,12 +803,13 @@ class HealthAnalyticsEngine:
                 'judgment': "計算エラー 📊"
             }
             
-    def _calculate_fiber_intake(self, df) -> dict:
+    def _calculate_fiber_intake(self, df, index: RangeAggregateIndex = None) -> dict:
         """食物繊維摂取量計算"""
         try:
-            # 過去7日間の食物繊維平均
-            recent_7days = df.tail(8).head(7)
-            avg_fiber = recent_7days['食物繊維_g'].mean()
+            # 過去7日間（当日除く）の食物繊維平均
+            index = index if index is not None else RangeAggregateIndex(df)
+            lo, hi = self._previous_7days_positions(df)
+            avg_fiber = index.query_positions('食物繊維_g', lo, hi, 'mean')
             
             if pd.isna(avg_fiber) or avg_fiber == 0:
                 return {'fiber_avg': 0, 'status': '📊'}
@@ -741,9 +828,24 @@ class HealthAnalyticsEngine:
             print(f"[ERROR] 食物繊維計算エラー: {e}")
             return {'fiber_avg': 0, 'status': '📊'}
     
-    def _calculate_target_prediction(self, bf_changes: dict) -> str:
-        """目標到達予測計算"""
+    def _calculate_target_prediction(self, bf_changes: dict, kgi: dict = None) -> str:
+        """目標到達予測計算（回帰トレンドがあれば優先）"""
         try:
+            if kgi and kgi.get('weekly_reduction_rate_ci') is not None:
+                weekly_rate = kgi.get('weekly_reduction_rate', 0)
+                remaining = kgi.get('current_bf_rate', 0) - kgi.get('target_bf_rate', self.target_body_fat_rate)
+                
+                if weekly_rate <= 0:
+                    return "現在のペースでは到達困難"
+                if weekly_rate < 0.3:  # 週0.3%未満の減少
+                    return "緩やかペース（要改善）"
+                    
+                months_needed = remaining / weekly_rate / 4.3
+                if months_needed < 12:
+                    return f"約{months_needed:.1f}ヶ月で到達"
+                else:
+                    return f"約{months_needed/12:.1f}年で到達"
+                    
             # 最近の変化ペースで判定
             recent_change_7d = bf_changes['bf_7d']
             recent_change_14d = bf_changes['bf_14d']
@@ -0,0 +1,297 @@
+"""
+Health Backtest - 分析レポートの過去時系列一括計算
+各日付時点で generate_analysis_report を実行した場合と同じ値を
+全履歴に対して1パスのベクトル演算で算出する（日付ごとの再実行 O(n²) を回避）
+"""
+
+import argparse
+import pandas as pd
+import numpy as np
+from datetime import timedelta
+from pathlib import Path
+from health_analytics_engine import HealthAnalyticsEngine
+
+
+def _valid_lag_pairs(values: np.ndarray, lag: int):
+    """各行時点での「最新の有効値」と「有効値だけ数えて lag-1 個前の値」を返す
+
+    エンジンの dropna(...).iloc[-1] / iloc[-lag] と同じ値を全行分まとめて求める。
+    有効値が lag 個に満たない行は NaN。
+    """
+    valid = ~np.isnan(values)
+    positions = np.flatnonzero(valid)
+    counts = np.cumsum(valid)  # 各行までの有効値数
+
+    current = np.full(len(values), np.nan)
+    past = np.full(len(values), np.nan)
+    enough = counts >= lag
+    if positions.size:
+        current[enough] = values[positions[counts[enough] - 1]]
+        past[enough] = values[positions[counts[enough] - lag]]
+    return current, past
+
+
+def _window_head_tail_mean(values: np.ndarray, window: int, k: int = 3):
+    """直近 window 行の有効値について、件数・先頭k件平均・末尾k件平均を返す"""
+    padded = np.concatenate([np.full(window - 1, np.nan), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window)
+    valid = ~np.isnan(windows)
+    filled = np.where(valid, windows, 0.0)
+
+    counts = valid.sum(axis=1)
+    rank_from_start = np.cumsum(valid, axis=1)
+    rank_from_end = counts[:, None] - rank_from_start + 1
+
+    head = valid & (rank_from_start <= k)
+    tail = valid & (rank_from_end <= k)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        head_mean = (filled * head).sum(axis=1) / head.sum(axis=1)
+        tail_mean = (filled * tail).sum(axis=1) / tail.sum(axis=1)
+    return counts, head_mean, tail_mean
+
+
+class HealthBacktester:
+    """分析レポート全項目の日次時系列を一括計算するバックテスター"""
+
+    PERIODS = {28: 'last_28days', 14: 'last_14days', 7: 'last_7days'}
+
+    def __init__(self, engine: HealthAnalyticsEngine = None, reports_dir: str = None):
+        self.engine = engine if engine is not None else HealthAnalyticsEngine(reports_dir)
+
+    def _column(self, df: pd.DataFrame, col: str) -> np.ndarray:
+        """列を float 配列で取得（列がなければ全て NaN）"""
+        if col not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=float)
+
+    def _kgi_columns(self, df: pd.DataFrame) -> dict:
+        """KGI進捗（calculate_kgi_progress 相当）"""
+        bf = self._column(df, '体脂肪率_ma7')
+        dates = df['date'].to_numpy(dtype='datetime64[D]')
+        valid = ~np.isnan(bf)
+        positions = np.flatnonzero(valid)
+        counts = np.cumsum(valid)
+        n = len(df)
+
+        ok = counts >= 2
+        latest_pos = np.where(ok, positions[np.maximum(counts - 1, 0)] if positions.size else 0, 0)
+        window_pos = np.where(ok, positions[np.maximum(counts - 28, 0)] if positions.size else 0, 0)
+
+        target = self.engine.target_body_fat_rate
+        start_bf = np.where(ok, bf[positions[0]] if positions.size else np.nan, np.nan)
+        current_bf = np.where(ok, bf[latest_pos], np.nan)
+
+        total_needed = start_bf - target
+        achieved = start_bf - current_bf
+        with np.errstate(invalid='ignore', divide='ignore'):
+            progress_rate = np.where(total_needed > 0, achieved / total_needed * 100, 0.0)
+
+            # 週間平均減少率: 回帰トレンド優先、なければ直近28有効行の先頭と末尾
+            weeks_elapsed = (dates[latest_pos] - dates[window_pos]).astype(float) / 7
+            total_reduction = bf[window_pos] - bf[latest_pos]
+            endpoint_rate = np.where(weeks_elapsed > 0, total_reduction / weeks_elapsed, 0.0)
+
+            fits = self.engine.trend_engine.rolling_fits(df, self.engine.trend_column, self.engine.trend_method)
+            has_trend = fits['slope_per_day'].notna().to_numpy()
+            weekly_rate = np.where(has_trend, -fits['slope_per_day'].to_numpy() * 7, endpoint_rate)
+            weeks_needed = (current_bf - target) / weekly_rate
+
+        analysis_date = pd.Series(pd.to_datetime(dates[latest_pos]), index=df.index)
+
+        # 到達予測日はバックテスト時点（その行の最新データ日）を起点に計算
+        target_dates = []
+        for i in range(n):
+            if not ok[i]:
+                target_dates.append(None)
+            elif weekly_rate[i] > 0:
+                reached = analysis_date.iloc[i] + timedelta(weeks=float(weeks_needed[i]))
+                target_dates.append(reached.strftime('%Y年%m月%d日'))
+            else:
+                target_dates.append("現在のペースでは到達困難")
+
+        progress_rate = np.where(ok, progress_rate, np.nan)
+        return {
+            'kgi_progress.analysis_date': analysis_date.dt.strftime('%Y-%m-%d').where(ok, None),
+            'kgi_progress.start_bf_rate': np.round(start_bf, 1),
+            'kgi_progress.current_bf_rate': np.round(current_bf, 1),
+            'kgi_progress.target_bf_rate': np.where(ok, target, np.nan),
+            'kgi_progress.reduction_achieved': np.round(achieved, 1),
+            'kgi_progress.total_reduction_needed': np.round(total_needed, 1),
+            'kgi_progress.progress_rate': np.round(progress_rate, 1),
+            'kgi_progress.progress_bar': [
+                self.engine._generate_progress_bar(rate) if ok[i] else None
+                for i, rate in enumerate(progress_rate)
+            ],
+            'kgi_progress.weekly_reduction_rate': np.round(np.where(ok, weekly_rate, np.nan), 3),
+            'kgi_progress.weekly_reduction_rate_ci': [
+                [round(float(-high * 7), 3), round(float(-low * 7), 3)] if ok[i] and has_trend[i] else None
+                for i, (low, high) in enumerate(zip(fits['ci_low'].to_numpy(), fits['ci_high'].to_numpy()))
+            ],
+            'kgi_progress.trend_method': np.where(ok, np.where(has_trend, self.engine.trend_method, 'endpoints'), None),
+            'kgi_progress.target_date': target_dates,
+        }
+
+    def _period_columns(self, df: pd.DataFrame, days: int) -> dict:
+        """期間成績（calculate_period_performance 相当）"""
+        prefix = self.PERIODS[days]
+        current_bf, past_bf = _valid_lag_pairs(self._column(df, self.engine._ma_column_for_period('体脂肪量_kg', days)), days)
+        current_muscle, past_muscle = _valid_lag_pairs(self._column(df, self.engine._ma_column_for_period('筋肉量_kg', days)), days)
+        bf_change = current_bf - past_bf
+        muscle_change = current_muscle - past_muscle
+
+        # 直近days行の合計・有効件数（エンジンと同じ累積和の差分で計算）
+        ends = np.arange(1, len(df) + 1)
+        starts = np.maximum(ends - days, 0)
+
+        def rolling_sum_count(col):
+            values = self._column(df, col)
+            valid = ~np.isnan(values)
+            sums = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+            counts = np.concatenate([[0], np.cumsum(valid)])
+            return sums[ends] - sums[starts], counts[ends] - counts[starts]
+
+        def rolling_sum(col):
+            return rolling_sum_count(col)[0]
+
+        balance_total, balance_count = rolling_sum_count('カロリー収支_kcal')
+        adjusted_total, adjusted_count = rolling_sum_count(self.engine.seasonality.column_name('カロリー収支_kcal'))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            balance_avg = np.where(balance_count > 0, balance_total / balance_count, np.nan)
+            adjusted_avg = np.where(adjusted_count > 0, adjusted_total / adjusted_count, np.nan)
+        return {
+            f'{prefix}.period_days': np.full(len(df), days),
+            f'{prefix}.actual_data_days': np.minimum(np.arange(1, len(df) + 1), days),
+            f'{prefix}.body_fat_mass_change': np.round(bf_change, 2),
+            f'{prefix}.body_fat_reduction_rate_per_day': np.round(bf_change / days, 3),
+            f'{prefix}.muscle_mass_change': np.round(muscle_change, 2),
+            f'{prefix}.muscle_rate_per_day': np.round(muscle_change / days, 3),
+            f'{prefix}.calorie_balance_total': np.round(balance_total, 0),
+            f'{prefix}.calorie_balance_avg': np.round(balance_avg, 1),
+            f'{prefix}.calorie_balance_avg_deseasonalized': np.round(adjusted_avg, 1),
+            f'{prefix}.total_intake_calories': np.round(rolling_sum('摂取カロリー_kcal'), 0),
+            f'{prefix}.total_consumed_calories': np.round(rolling_sum('消費カロリー_kcal'), 0),
+        }
+
+    def _metabolism_columns(self, df: pd.DataFrame) -> dict:
+        """代謝状況（analyze_metabolism_status 相当）"""
+        fat_loss = {}
+        for days in (28, 14, 7):
+            current, past = _valid_lag_pairs(self._column(df, self.engine._ma_column_for_period('体脂肪量_kg', days)), days)
+            fat_loss[days] = current - past
+
+        # 体表温変化: 偏差データ優先、なければトレンドデータ
+        dev_count, dev_head, dev_tail = _window_head_tail_mean(self._column(df, '体表温偏差_celsius'), 7)
+        trend_count, trend_head, trend_tail = _window_head_tail_mean(self._column(df, '体表温トレンド_celsius'), 7)
+        temp_change = np.where(dev_count >= 2, dev_tail - dev_head,
+                               np.where(trend_count >= 2, trend_tail - trend_head, np.nan))
+
+        # 停滞日数: 各計測日までのデータだけで判定した停滞区間（直近の計測日に合わせる）
+        history = self.engine.plateau_detector.plateau_history(df)
+        history['date'] = history['date'].astype('datetime64[ns]')
+        rows = pd.DataFrame({'date': pd.to_datetime(df['date']).astype('datetime64[ns]')})
+        stall_days = pd.merge_asof(rows, history, on='date', direction='backward')['plateau_days'].fillna(0).astype(int).to_numpy()
+        with np.errstate(invalid='ignore'):
+            is_stalled = (fat_loss[14] <= 0) & (fat_loss[7] <= 0)
+            is_temp_dropping = temp_change < -0.1
+
+        return {
+            'metabolism_analysis.fat_loss_28d': np.round(fat_loss[28], 2),
+            'metabolism_analysis.fat_loss_14d': np.round(fat_loss[14], 2),
+            'metabolism_analysis.fat_loss_7d': np.round(fat_loss[7], 2),
+            'metabolism_analysis.body_temp_change': np.round(temp_change, 1),
+            'metabolism_analysis.metabolism_status': np.where(is_stalled, 'stopped', 'normal'),
+            'metabolism_analysis.cheat_day_recommended': (stall_days >= 14) & is_temp_dropping,
+            'metabolism_analysis.stall_days': stall_days,
+        }
+
+    def _energy_balance_columns(self, df: pd.DataFrame) -> dict:
+        """エネルギー収支モデル（TDEEEstimator.summarize 相当）"""
+        estimator = self.engine.tdee_estimator
+        estimates = estimator.estimate(df)
+        columns = {'energy_balance.energy_per_kg': np.full(len(df), estimator.ENERGY_PER_KG)}
+        for window in estimator.windows:
+            tdee = estimates[window].to_numpy()
+            device = estimates[f'device_{window}'].to_numpy()
+            columns[f'energy_balance.estimated_tdee_{window}d'] = np.round(tdee, 0)
+            columns[f'energy_balance.device_tdee_{window}d'] = np.round(device, 0)
+            columns[f'energy_balance.device_bias_{window}d'] = np.round(device - tdee, 0)
+
+        intake_7d = pd.Series(self._column(df, estimator.intake_column)).rolling(7, min_periods=1).mean().to_numpy()
+        reference = columns[f'energy_balance.estimated_tdee_{max(estimator.windows)}d']
+        columns['energy_balance.model_balance_7d_avg'] = np.round(intake_7d - reference, 0)
+        return columns
+
+    def _calorie_adjustment_columns(self, columns: dict) -> dict:
+        """カロリー調整（calculate_calorie_adjustment 相当）"""
+        target_7d = self.engine.target_weekly_calorie_deficit
+        deficit_7d = columns['last_7days.calorie_balance_total'] - target_7d
+        deficit_14d = columns['last_14days.calorie_balance_total'] - target_7d * 2
+        daily = deficit_7d / 7
+        return {
+            'calorie_adjustment.deficit_7d': np.round(deficit_7d, 0),
+            'calorie_adjustment.deficit_14d': np.round(deficit_14d, 0),
+            'calorie_adjustment.daily_adjustment': np.round(daily, 0),
+            'calorie_adjustment.exercise_options.jogging_minutes': np.round(np.abs(daily) / 10, 0),
+            'calorie_adjustment.exercise_options.walking_minutes': np.round(np.abs(daily) / 5, 0),
+            'calorie_adjustment.exercise_options.strength_minutes': np.round(np.abs(daily) / 9, 0),
+        }
+
+    def run_backtest(self, df: pd.DataFrame = None) -> pd.DataFrame:
+        """全日付のレポート項目を計算
+
+        Returns:
+            1行=1日付、列=「セクション.項目」形式のレポート項目
+        """
+        if df is None:
+            df = self.engine.load_latest_data()
+        if df.empty:
+            return pd.DataFrame()
+
+        df = df.sort_values('date').reset_index(drop=True)
+        df['date'] = pd.to_datetime(df['date'])
+        if self.engine.seasonality.column_name('カロリー収支_kcal') not in df.columns:
+            df = df.join(self.engine.seasonality.deseasonalize(df))
+
+        columns = {}
+        columns.update(self._kgi_columns(df))
+        for days in self.PERIODS:
+            columns.update(self._period_columns(df, days))
+        columns.update(self._metabolism_columns(df))
+        columns.update(self._calorie_adjustment_columns(columns))
+        columns.update(self._energy_balance_columns(df))
+
+        result = pd.DataFrame(columns, index=df.index)
+        result.insert(0, 'date', df['date'].dt.strftime('%Y-%m-%d'))
+        print(f"[SUCCESS] バックテスト完了: {len(result)}日分 × {len(columns)}項目")
+        return result
+
+    def export_backtest(self, output_path: str, start_date: str = None, end_date: str = None) -> Path:
+        """バックテスト結果をCSV出力（期間指定はレポート日付でフィルタ）"""
+        result = self.run_backtest()
+        if not result.empty:
+            if start_date:
+                result = result[result['date'] >= start_date]
+            if end_date:
+                result = result[result['date'] <= end_date]
+
+        output_path = Path(output_path)
+        result.to_csv(output_path, index=False, encoding='utf-8-sig')
+        print(f"[SUCCESS] バックテスト結果保存: {output_path} ({len(result)}行)")
+        return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分析レポートの過去時系列をCSV出力')
+    parser.add_argument('--reports-dir', default=None, help='reportsディレクトリ（省略時はプロジェクト直下）')
+    parser.add_argument('--output', default=None, help='出力CSVパス（省略時は reports/backtest_report.csv）')
+    parser.add_argument('--start-date', default=None, help='出力開始日 YYYY-MM-DD')
+    parser.add_argument('--end-date', default=None, help='出力終了日 YYYY-MM-DD')
+    args = parser.parse_args()
+
+    backtester = HealthBacktester(reports_dir=args.reports_dir)
+    output = args.output or backtester.engine.reports_dir / "backtest_report.csv"
+    backtester.export_backtest(output, args.start_date, args.end_date)
+
+
+if __name__ == "__main__":
+    main()
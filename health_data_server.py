@@ -36,6 +36,18 @@ import time
 import traceback
 import logging
 import sys
+from range_aggregate_index import RangeAggregateIndex
+from kalman_smoother import KalmanSmoother
+from plateau_detector import PlateauDetector
+from outlier_detector import OutlierDetector
+from tdee_estimator import TDEEEstimator
+from seasonality import WeekdaySeasonality
+from rollup_tables import RollupTables
+from correlation_engine import LaggedCorrelationEngine
+from trajectory_simulator import TrajectorySimulator
+from hae_aggregation import bucket_metrics_by_date, find_unknown_units
+from workout_store import WorkoutStore
+from training_load import TrainingLoadModel
 
 # ===== ログ設定強化 =====
 logging.basicConfig(
@@ -93,80 +105,87 @@ class HAEDataConverter:
         'total_fat': '脂質_g'
     }
     
-    def convert_hae_to_daily_row(self, hae_data: Dict) -> Dict:
-        """HAE JSONを日次データ行に変換"""
+    def build_daily_row(self, date_value: str, values: Dict) -> Dict:
+        """1日分のメトリクス値から日次データ行を作成（計算項目を含む）"""
+        # 基本行データ
+        daily_row = {
+            'date': date_value,
+            '体重_kg': None,
+            '筋肉量_kg': None,
+            '体脂肪量_kg': None,
+            '体脂肪率': None,
+            'カロリー収支_kcal': None,
+            '摂取カロリー_kcal': None,
+            '消費カロリー_kcal': None,
+            '基礎代謝_kcal': None,
+            '活動カロリー_kcal': None,
+            '歩数': None,
+            '睡眠時間_hours': None,
+            '体表温度_celsius': None,
+            '体表温変化_celsius': None,
+            '体表温偏差_celsius': None,
+            '体表温トレンド_celsius': None,
+            'タンパク質_g': None,
+            '糖質_g': None,
+            '食物繊維_g': None,
+            '脂質_g': None,
+            'oura_total_calories': None,
+            'oura_estimated_basal': None,
+            'total_calories_updated': None,
+            'calculation_method': 'HAE_AUTO'
+        }
+        daily_row.update(values)
+        
+        # 体脂肪量計算
+        if daily_row['体重_kg'] and daily_row['体脂肪率']:
+            daily_row['体脂肪量_kg'] = daily_row['体重_kg'] * (daily_row['体脂肪率'] / 100)
+        
+        # カロリー収支計算
+        intake = daily_row['摂取カロリー_kcal'] or 0
+        basal = daily_row['基礎代謝_kcal'] or 0
+        active = daily_row['活動カロリー_kcal'] or 0
+        
+        if intake and (basal or active):
+            daily_row['消費カロリー_kcal'] = basal + active
+            daily_row['カロリー収支_kcal'] = intake - (basal + active)
+        
+        return daily_row
+    
+    def convert_hae_to_daily_rows(self, hae_data: Dict) -> List[Dict]:
+        """HAE JSONを日付ごとの日次データ行に変換（複数日にまたがるペイロード対応）
+        
+        各データポイントを自身の日付で振り分け、累積メトリクスは日ごとに合計、
+        それ以外は日ごとの最新値を使う（日付昇順）
+        """
         try:
             logger.info("🔄 HAEデータ変換開始")
             metrics = hae_data.get('data', {}).get('metrics', [])
             logger.info(f"📊 メトリクス数: {len(metrics)}")
             
-            # 基本行データ
-            daily_row = {
-                'date': datetime.now().strftime('%Y-%m-%d'),
-                '体重_kg': None,
-                '筋肉量_kg': None,
-                '体脂肪量_kg': None,
-                '体脂肪率': None,
-                'カロリー収支_kcal': None,
-                '摂取カロリー_kcal': None,
-                '消費カロリー_kcal': None,
-                '基礎代謝_kcal': None,
-                '活動カロリー_kcal': None,
-                '歩数': None,
-                '睡眠時間_hours': None,
-                '体表温度_celsius': None,
-                '体表温変化_celsius': None,
-                '体表温偏差_celsius': None,
-                '体表温トレンド_celsius': None,
-                'タンパク質_g': None,
-                '糖質_g': None,
-                '食物繊維_g': None,
-                '脂質_g': None,
-                'oura_total_calories': None,
-                'oura_estimated_basal': None,
-                'total_calories_updated': None,
-                'calculation_method': 'HAE_AUTO'
-            }
-            
-            # メトリクス変換
-            converted_count = 0
-            for metric in metrics:
-                name = metric.get('name', '')
-                if name in self.METRIC_MAPPING:
-                    csv_column = self.METRIC_MAPPING[name]
-                    data_points = metric.get('data', [])
-                    
-                    if data_points:
-                        # 最新データを使用
-                        latest_point = data_points[-1]
-                        daily_row[csv_column] = latest_point.get('qty')
-                        converted_count += 1
-                        logger.info(f"✅ {name} → {csv_column}: {latest_point.get('qty')}")
-            
-            logger.info(f"🎯 変換完了: {converted_count}個のメトリクス")
-            
-            # 体脂肪量計算
-            if daily_row['体重_kg'] and daily_row['体脂肪率']:
-                daily_row['体脂肪量_kg'] = daily_row['体重_kg'] * (daily_row['体脂肪率'] / 100)
-                logger.info(f"💡 体脂肪量計算: {daily_row['体脂肪量_kg']:.2f}kg")
-            
-            # カロリー収支計算
-            intake = daily_row['摂取カロリー_kcal'] or 0
-            basal = daily_row['基礎代謝_kcal'] or 0
-            active = daily_row['活動カロリー_kcal'] or 0
+            buckets = bucket_metrics_by_date(metrics, self.METRIC_MAPPING)
+            daily_rows = []
+            for date_value, values in buckets.items():
+                daily_row = self.build_daily_row(date_value, values)
+                daily_rows.append(daily_row)
+                logger.info(f"✅ {date_value}: {len(values)}個のメトリクス"
+                            f"（カロリー収支: {daily_row['カロリー収支_kcal']}kcal）")
             
-            if intake and (basal or active):
-                daily_row['消費カロリー_kcal'] = basal + active
-                daily_row['カロリー収支_kcal'] = intake - (basal + active)
-                logger.info(f"🔥 カロリー収支: {daily_row['カロリー収支_kcal']}kcal")
+            if not daily_rows:
+                logger.warning("⚠️ 日付付きのメトリクスデータがありません")
+                return []
             
-            logger.info("✅ HAEデータ変換完了")
-            return daily_row
+            logger.info(f"🎯 変換完了: {len(daily_rows)}日分 ({daily_rows[0]['date']} 〜 {daily_rows[-1]['date']})")
+            return daily_rows
             
         except Exception as e:
             logger.error(f"❌ HAEデータ変換エラー: {e}")
             logger.error(traceback.format_exc())
-            return None
+            return []
+    
+    def convert_hae_to_daily_row(self, hae_data: Dict) -> Dict:
+        """HAE JSONを日次データ行に変換（最新日の行）"""
+        daily_rows = self.convert_hae_to_daily_rows(hae_data)
+        return daily_rows[-1] if daily_rows else None
 
 # ===== CSV統合機能 =====
 class CSVDataIntegrator:
@@ -177,12 +196,24 @@ class CSVDataIntegrator:
         self.daily_csv = self.reports_dir / "日次データ.csv"
         self.ma7_csv = self.reports_dir / "7日移動平均データ.csv"
         self.index_csv = self.reports_dir / "インデックスデータ.csv"
+        self.smoother = KalmanSmoother(str(self.reports_dir))
+        self.plateau_detector = PlateauDetector(str(self.reports_dir))
+        self.outlier_detector = OutlierDetector(str(self.reports_dir))
+        self.tdee_estimator = TDEEEstimator()
+        self.seasonality = WeekdaySeasonality()
+        self.rollups = RollupTables(str(self.reports_dir))
+        self.workout_store = WorkoutStore(str(self.reports_dir))
+        self.training_load = TrainingLoadModel(str(self.reports_dir))
         logger.info(f"📊 CSV統合機能初期化: {self.reports_dir}")
     
     def integrate_daily_data(self, daily_row: Dict) -> bool:
         """日次データをCSVに統合"""
+        return self.integrate_daily_rows([daily_row])
+    
+    def integrate_daily_rows(self, daily_rows: List[Dict]) -> bool:
+        """複数日分の日次データをCSVに一括統合（同一日付は上書き、移動平均は1回だけ再計算）"""
         try:
-            logger.info("🔄 CSV統合開始")
+            logger.info(f"🔄 CSV統合開始: {len(daily_rows)}日分")
             
             # 既存データ読み込み
             if self.daily_csv.exists():
@@ -193,9 +224,9 @@ class CSVDataIntegrator:
                 logger.info("📝 新規データ作成")
             
             # 新データ追加（同一日付は上書き）
-            new_df = pd.DataFrame([daily_row])
+            new_df = pd.DataFrame(daily_rows).drop_duplicates('date', keep='last')
             if not df.empty:
-                df = df[df['date'] != daily_row['date']]  # 既存の同日データ削除
+                df = df[~df['date'].isin(new_df['date'])]  # 既存の同日データ削除
                 df = pd.concat([df, new_df], ignore_index=True)
             else:
                 df = new_df
@@ -225,6 +256,15 @@ class CSVDataIntegrator:
         try:
             logger.info("🔄 移動平均計算開始")
             
+            # 外れ値判定（隔離した値は移動平均・分析の入力から除外）
+            detected = self.outlier_detector.screen(df)
+            if detected:
+                logger.warning(f"⚠️ 外れ値検出: {len(detected)}件")
+            df = self.outlier_detector.apply(df)
+            
+            # 週次・月次集計（変更のあった期間のみ再集計）
+            self.rollups.update(df)
+            
             # 数値カラムの移動平均計算
             numeric_columns = ['体重_kg', '筋肉量_kg', '体脂肪量_kg', '体脂肪率', 
                              'カロリー収支_kcal', '摂取カロリー_kcal', '消費カロリー_kcal',
@@ -238,6 +278,26 @@ class CSVDataIntegrator:
                     df[f'{col}_ma28'] = df[col].rolling(window=28, min_periods=1).mean()
                     calculated_count += 1
             
+            # カルマン平滑化（体重・体脂肪率・筋肉量のレベルと傾き）
+            previous_df = pd.read_csv(self.ma7_csv, encoding='utf-8-sig') if self.ma7_csv.exists() else None
+            df = self.smoother.add_columns(df, previous_df)
+            
+            # 実消費カロリー推定（摂取量と平滑化体重の変化から逆算）
+            df = self.tdee_estimator.add_columns(df, previous_df)
+            
+            # 曜日効果の季節調整列
+            df = self.seasonality.add_columns(df, previous_df)
+            
+            # 停滞期のオンライン検出（CUSUM）
+            plateau = self.plateau_detector.update_online(df)
+            if plateau.get('alarm'):
+                logger.warning(f"⚠️ 体脂肪量の減少停滞を検出: {plateau['run_start']}〜")
+            
+            # トレーニング負荷（ATL/CTL）の逐次更新
+            load = self.training_load.update_online(df, self.workout_store.daily_energy())
+            if load.get('status') == 'overreaching':
+                logger.warning(f"⚠️ トレーニング負荷が過大です: ACWR {load['acwr']}")
+            
             # 移動平均データ保存
             df.to_csv(self.ma7_csv, index=False, encoding='utf-8-sig')
             df.to_csv(self.index_csv, index=False, encoding='utf-8-sig')
@@ -255,6 +315,7 @@ class HealthAnalyticsEngine:
     def __init__(self):
         self.reports_dir = Path(REPORTS_DIR)
         self.target_body_fat_rate = 12.0
+        self.training_load = TrainingLoadModel(str(self.reports_dir))
         logger.info(f"🧠 健康分析エンジン初期化（目標体脂肪率: {self.target_body_fat_rate}%）")
     
     def analyze_health_data(self) -> Optional[Dict]:
@@ -296,8 +357,12 @@ class HealthAnalyticsEngine:
                 'calorie_balance': {
                     'current': latest.get('カロリー収支_kcal'),
                     '7day_avg': latest.get('カロリー収支_kcal_ma7'),
-                    '14day_avg': latest.get('カロリー収支_kcal_ma14')
-                }
+                    '14day_avg': latest.get('カロリー収支_kcal_ma14'),
+                    'device_expenditure_14day_avg': latest.get('消費カロリー_kcal_ma14'),
+                    'estimated_tdee_14d': latest.get('推定消費カロリー_kcal_14d'),
+                    'estimated_tdee_28d': latest.get('推定消費カロリー_kcal_28d')
+                },
+                'training_load': self.training_load.status()
             }
             
             # 分析レポート保存
@@ -409,14 +474,14 @@ class CompleteProcessor:
             
             # 1. HAE → CSV変換
             logger.info("【STEP 1】 HAEデータ変換実行")
-            daily_row = self.converter.convert_hae_to_daily_row(hae_data)
-            if not daily_row:
+            daily_rows = self.converter.convert_hae_to_daily_rows(hae_data)
+            if not daily_rows:
                 logger.error("❌ データ変換失敗")
                 return False
             
             # 2. CSV統合・移動平均
             logger.info("【STEP 2】 CSV統合・移動平均実行")
-            if not self.integrator.integrate_daily_data(daily_row):
+            if not self.integrator.integrate_daily_rows(daily_rows):
                 logger.error("❌ CSV統合失敗")
                 return False
             
@@ -461,7 +526,13 @@ def root():
             'latest_data': '/latest-data (GET)',
             'manual_analysis': '/manual-analysis (POST)',
             'csv_content': '/csv-content (GET)',
-            'csv_dates': '/csv-dates (GET)'
+            'csv_dates': '/csv-dates (GET)',
+            'aggregate': '/aggregate?metric=&start=&end=&fn= (GET)',
+            'quarantine': '/quarantine?metric=&start=&end=&mode= (GET)',
+            'correlations': '/correlations?target=&limit= (GET)',
+            'simulate': '/simulate?daily_calorie_balance=&extra_activity_kcal=&horizon_days=&paths= (GET/POST)',
+            'rollups': '/rollups?period=week|month&metric=&start=&end= (GET)',
+            'workouts': '/workouts?start=&end=&type= (GET)'
         }
     })
 
@@ -488,15 +559,23 @@ def receive_health_data():
         
         logger.info(f"💾 HAEデータ保存: {filename}")
         
+        metrics = data.get('data', {}).get('metrics', [])
+        workouts = data.get('data', {}).get('workouts', [])
+        
+        # ワークアウト保存（再送分は重複除去、分析より先に保存）
+        workout_result = processor.integrator.workout_store.append(workouts)
+        
+        # 既定単位へ換算できないメトリクス（取り込み対象外）
+        unknown_units = find_unknown_units(metrics, HAEDataConverter.METRIC_MAPPING)
+        for unknown in unknown_units:
+            logger.warning(f"⚠️ 未対応の単位: {unknown['metric']} ({unknown['units']})")
+        
         # 【重要】即座に統合処理実行
         logger.info("🚀 統合処理開始")
         success = processor.process_hae_data_complete(data)
         
-        metrics = data.get('data', {}).get('metrics', [])
-        workouts = data.get('data', {}).get('workouts', [])
-        
         logger.info(f"📊 メトリクス: {len(metrics)}個")
-        logger.info(f"🏃 ワークアウト: {len(workouts)}個")
+        logger.info(f"🏃 ワークアウト: {len(workouts)}個（新規保存 {workout_result['added']}件）")
         logger.info(f"🎯 処理結果: {'✅成功' if success else '❌失敗'}")
         
         return jsonify({
@@ -504,6 +583,8 @@ def receive_health_data():
             'message': 'Data received and processed completely',
             'metrics_count': len(metrics),
             'workouts_count': len(workouts),
+            'workouts_stored': workout_result,
+            'unknown_units': unknown_units,
             'session_id': session_id,
             'processing_success': success,
             'features_executed': ['Data Conversion', 'CSV Integration', 'Health Analysis', 'LINE Notification'],
@@ -694,6 +775,216 @@ def get_csv_dates():
         logger.error(f"❌ 期間CSV確認エラー: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# ===== 範囲集計エンドポイント =====
+# 移動平均CSVの更新時刻が変わるまで集計インデックスを再利用
+_aggregate_index_cache = {'mtime': None, 'index': None}
+
+def get_aggregate_index() -> Optional[RangeAggregateIndex]:
+    """範囲集計インデックス取得（CSV更新時のみ再構築）"""
+    ma7_csv = Path(REPORTS_DIR) / "7日移動平均データ.csv"
+    if not ma7_csv.exists():
+        return None
+    
+    mtime = ma7_csv.stat().st_mtime
+    if _aggregate_index_cache['mtime'] != mtime:
+        _aggregate_index_cache['index'] = RangeAggregateIndex.from_csv(ma7_csv)
+        _aggregate_index_cache['mtime'] = mtime
+        logger.info(f"🗂️ 範囲集計インデックス再構築: {_aggregate_index_cache['index'].length}行")
+    return _aggregate_index_cache['index']
+
+@app.route('/aggregate', methods=['GET'])
+def get_aggregate():
+    """指標の期間集計（sum/mean/min/max/count）"""
+    try:
+        metric = request.args.get('metric')
+        start_date = request.args.get('start')
+        end_date = request.args.get('end')
+        fn = request.args.get('fn', 'sum')
+        
+        logger.info(f"🧮 範囲集計: {metric} {fn} ({start_date} - {end_date})")
+        
+        if not metric:
+            return jsonify({'error': 'metric parameter is required'}), 400
+        if fn not in RangeAggregateIndex.FUNCTIONS:
+            return jsonify({'error': f'Unsupported fn: {fn}', 'supported': list(RangeAggregateIndex.FUNCTIONS)}), 400
+        try:
+            for value in (start_date, end_date):
+                if value is not None:
+                    pd.to_datetime(value)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid date format'}), 400
+        
+        index = get_aggregate_index()
+        if index is None:
+            return jsonify({'error': 'Moving average CSV file not found'}), 404
+        if metric not in index.metrics():
+            return jsonify({'error': f'Unknown metric: {metric}', 'available_metrics': index.metrics()}), 400
+        
+        return jsonify(index.query(metric, start_date, end_date, fn))
+        
+    except Exception as e:
+        logger.error(f"❌ 範囲集計エラー: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# ===== 外れ値隔離エンドポイント =====
+@app.route('/quarantine', methods=['GET'])
+def get_quarantine():
+    """外れ値として検出・隔離された計測値の一覧"""
+    try:
+        metric = request.args.get('metric')
+        start_date = request.args.get('start')
+        end_date = request.args.get('end')
+        mode = request.args.get('mode')
+        
+        logger.info(f"🚧 外れ値一覧: {metric or '全指標'} ({start_date} - {end_date})")
+        
+        if mode is not None and mode not in ('quarantine', 'flag'):
+            return jsonify({'error': f'Unsupported mode: {mode}', 'supported': ['quarantine', 'flag']}), 400
+        
+        points = processor.integrator.outlier_detector.points(metric, start_date, end_date, mode)
+        return jsonify({
+            'status': 'success',
+            'count': len(points),
+            'points': points
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ 外れ値一覧エラー: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# ===== ラグ相関エンドポイント =====
+correlation_engine = LaggedCorrelationEngine(REPORTS_DIR)
+
+@app.route('/correlations', methods=['GET'])
+def get_correlations():
+    """指標間のラグ相関（target 指定時は先行指標の上位、未指定時は全ペア×全ラグ）"""
+    try:
+        target = request.args.get('target')
+        limit = int(request.args.get('limit', 10))
+        
+        logger.info(f"🔗 ラグ相関: {target or '全ペア'}")
+        
+        ma7_csv = Path(REPORTS_DIR) / "7日移動平均データ.csv"
+        if not ma7_csv.exists():
+            return jsonify({'error': 'Moving average CSV file not found'}), 404
+        df = pd.read_csv(ma7_csv, encoding='utf-8-sig')
+        
+        result = correlation_engine.get_correlations(df)
+        if not target:
+            return jsonify(result)
+        if target not in result.get('metrics', []):
+            return jsonify({'error': f'Unknown target: {target}', 'available_metrics': result.get('metrics', [])}), 400
+        
+        return jsonify({
+            'data_version': result['data_version'],
+            'target': target,
+            'relationships': correlation_engine.top_relationships(df, target, limit)
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ ラグ相関エラー: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# ===== 週次・月次集計エンドポイント =====
+@app.route('/rollups', methods=['GET'])
+def get_rollups():
+    """週次（ISO週）・月次の集計テーブル（日次データは走査しない）"""
+    try:
+        period = request.args.get('period', 'week')
+        metric = request.args.get('metric')
+        start_date = request.args.get('start')
+        end_date = request.args.get('end')
+        
+        logger.info(f"🗓️ 期間集計: {period} {metric or '全指標'} ({start_date} - {end_date})")
+        
+        if period not in RollupTables.PERIODS:
+            return jsonify({'error': f'Unsupported period: {period}', 'supported': list(RollupTables.PERIODS)}), 400
+        
+        rollups = processor.integrator.rollups
+        if not rollups.table_path(period).exists():
+            return jsonify({'error': 'Rollup table not found'}), 404
+        try:
+            rows = rollups.query(period, metric, start_date, end_date)
+        except KeyError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'status': 'success',
+            'period': period,
+            'metric': metric,
+            'count': len(rows),
+            'rows': rows
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ 期間集計エラー: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/workouts', methods=['GET'])
+def get_workouts():
+    """保存済みワークアウトの期間検索（日付インデックスで該当行のみ読み出し）"""
+    try:
+        start_date = request.args.get('start')
+        end_date = request.args.get('end')
+        workout_type = request.args.get('type')
+        
+        logger.info(f"🏃 ワークアウト検索: {workout_type or '全種目'} ({start_date} - {end_date})")
+        
+        try:
+            for value in (start_date, end_date):
+                if value is not None:
+                    pd.to_datetime(value)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Invalid date format'}), 400
+        
+        store = processor.integrator.workout_store
+        if not store.table_path.exists():
+            return jsonify({'error': 'Workout table not found'}), 404
+        
+        table = store.query(start_date, end_date, workout_type)
+        rows = table.astype(object).where(table.notna(), None).to_dict('records')
+        
+        return jsonify({
+            'status': 'success',
+            'count': len(rows),
+            'total_energy_kcal': round(float(pd.to_numeric(table['energy_kcal'], errors='coerce').sum()), 1),
+            'workouts': rows
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ ワークアウト検索エラー: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# ===== 体脂肪率シミュレーションエンドポイント =====
+trajectory_simulator = TrajectorySimulator(target_body_fat_rate=12.0)
+
+@app.route('/simulate', methods=['GET', 'POST'])
+def simulate_trajectory():
+    """カロリー収支・活動量シナリオでの体脂肪率予測（パーセンタイル帯、シナリオ×データ版でキャッシュ）"""
+    try:
+        params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args.to_dict()
+        scenario = {key: params.get(key) for key in TrajectorySimulator.DEFAULT_SCENARIO}
+        
+        logger.info(f"🎲 シミュレーション: {scenario}")
+        
+        ma7_csv = Path(REPORTS_DIR) / "7日移動平均データ.csv"
+        if not ma7_csv.exists():
+            return jsonify({'error': 'Moving average CSV file not found'}), 404
+        df = pd.read_csv(ma7_csv, encoding='utf-8-sig')
+        
+        try:
+            result = trajectory_simulator.simulate_cached(df, scenario)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if not result:
+            return jsonify({'error': 'Insufficient body composition data'}), 400
+        
+        return jsonify(result)
+        
+    except Exception as e:
+        logger.error(f"❌ シミュレーションエラー: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # ===== アプリケーション初期化 =====
 def initialize_app():
     """アプリケーション初期化"""
@@ -720,5 +1011,11 @@ if __name__ == '__main__':
     logger.info(f"📊 手動分析: http://localhost:{port}/manual-analysis (POST)")
     logger.info(f"📋 CSV内容確認: http://localhost:{port}/csv-content")
     logger.info(f"📅 期間データ確認: http://localhost:{port}/csv-dates?start_date=2025-08-08&end_date=2025-08-11")
+    logger.info(f"🧮 範囲集計: http://localhost:{port}/aggregate?metric=摂取カロリー_kcal&start=2025-08-01&end=2025-08-07&fn=sum")
+    logger.info(f"🚧 外れ値一覧: http://localhost:{port}/quarantine?mode=quarantine")
+    logger.info(f"🔗 ラグ相関: http://localhost:{port}/correlations?target=体脂肪量変化_kg")
+    logger.info(f"🎲 シミュレーション: http://localhost:{port}/simulate?daily_calorie_balance=-500&horizon_days=90")
+    logger.info(f"🗓️ 期間集計: http://localhost:{port}/rollups?period=week&metric=摂取カロリー_kcal")
+    logger.info(f"🏃 ワークアウト: http://localhost:{port}/workouts?start=2025-08-01&end=2025-08-31")
     
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,285 @@
+"""
+Incremental Import - Apple Health 書き出しデータの差分取り込み
+書き出しは毎回全期間のスナップショットのため、前回までの部分集計（DailyPartials）・
+type ごとの最後の記録日・(日付, 指標) ごとの記録ハッシュ要約をチェックポイントに保存し、
+次回は各 type の最後の記録日から数日さかのぼった日以降だけを集計し直す（それより前は集計せず、
+記録ハッシュの要約だけを取る）。
+
+- 同じ書き出し（export.xml の CRC・サイズが一致）は解析しない
+- 解析中は範囲ごとの進捗を保存し、中断後は同じ書き出しなら続きの範囲から再開
+- さかのぼり期間より前でも記録ハッシュの要約が前回と異なる日（遅れて同期・手入力された記録）は、
+  その日だけを2回目の解析で集計し直す
+- 記録ハッシュの要約が変わった日だけを「変更日」として返し、CSV にはその日だけを反映
+- チェックポイントは CSV の保存後に commit() で確定する（途中で失敗した場合は次回も同じ変更日を返す）
+- 対象指標・基準日・ホームタイムゾーンが変わった場合は全期間を集計し直す
+  （同じ書き出しの記録キャッシュがあれば XML は解析しない。record_cache）
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import zipfile
+import tempfile
+import datetime as dt
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+import numpy as np
+from export_xml_parser import DailyPartials, EXPORT_MEMBER, ENGINES, parse_range, record_aligned_ranges, date_key
+from record_cache import RecordCache, RecordColumns
+from day_bucketing import DEFAULT_BUCKETER
+
+
+class IncrementalImporter:
+    """チェックポイント付きの export.xml 取り込み"""
+
+    def __init__(self, reports_dir: str = "reports", lookback_days: int = 3, workers: int = None,
+                 engine: str = 'regex', progress_interval: float = 5.0):
+        """
+        Args:
+            lookback_days: 最後の記録日からさかのぼって集計し直す日数（遅れて同期された記録・編集に対応）
+            workers: 解析プロセス数（1 は単一プロセス）
+            progress_interval: 解析中の進捗を保存する間隔（秒）
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"未対応の解析方式です: {engine}")
+        self.reports_dir = Path(reports_dir)
+        self.state_file = self.reports_dir / "import_checkpoint.json"
+        self.progress_file = self.reports_dir / "import_progress.json"
+        self.lookback = dt.timedelta(days=lookback_days)
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.progress_interval = progress_interval
+        self.record_cache = RecordCache(reports_dir)
+        self._pending = None  # run() の結果（commit() でチェックポイントに保存）
+
+    # ===== チェックポイント =====
+
+    @staticmethod
+    def fingerprint(zip_path: str) -> str:
+        """書き出しの識別子（zip 内の export.xml の CRC とサイズ。展開せずに得られる）"""
+        with zipfile.ZipFile(zip_path) as zf:
+            info = zf.getinfo(EXPORT_MEMBER)
+        return f"{info.CRC:08x}-{info.file_size}"
+
+    @staticmethod
+    def _config(target_metrics: Dict[str, str], cutoff_date: dt.date) -> dict:
+        """チェックポイントを使い回せる条件（変われば全期間を解析し直す）"""
+        return {
+            'cutoff_date': cutoff_date.isoformat(),
+            'target_metrics': dict(sorted(target_metrics.items())),
+            'home_timezone': DEFAULT_BUCKETER.home_timezone,
+            'day_start_seconds': DEFAULT_BUCKETER.day_start_seconds,
+        }
+
+    def _load(self, path: Path) -> dict:
+        if not path.exists():
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[ERROR] チェックポイント読み込みエラー: {e}")
+            return {}
+
+    def _save(self, path: Path, state: dict):
+        """一時ファイルに書いてから置き換え（書き込み中の中断で壊れないように）"""
+        try:
+            self.reports_dir.mkdir(parents=True, exist_ok=True)
+            temp_path = path.with_suffix('.tmp')
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f"[ERROR] チェックポイント保存エラー: {e}")
+
+    def reopen_dates(self, watermarks: Dict[str, str], target_metrics: Dict[str, str]) -> Dict[str, dt.date]:
+        """type ごとの再解析開始日（最後の記録日 − lookback_days）。未取り込みの type は全期間"""
+        return {typ: dt.date.fromisoformat(watermarks[typ]) - self.lookback
+                for typ in target_metrics if typ in watermarks}
+
+    @staticmethod
+    def backfilled_days(old_digests: dict, seen_digests: dict, reopen_by_metric: Dict[str, dt.date]) -> Set[tuple]:
+        """再解析開始日より前で記録ハッシュの要約が前回と異なる (日付, 指標)（遅れて同期・追加・削除された記録）"""
+        keys = set(seen_digests)
+        keys.update(key for key in old_digests if key[1] in reopen_by_metric and key[0] < reopen_by_metric[key[1]])
+        return {key for key in keys if old_digests.get(key) != seen_digests.get(key)}
+
+    @staticmethod
+    def changed_dates(old_digests: dict, new_digests: dict, reopen_by_metric: Dict[str, dt.date],
+                      days: Set[tuple] = frozenset()) -> Set[dt.date]:
+        """再解析した期間（と days の (日付, 指標)）で記録ハッシュの要約が変わった日（追加・編集・削除）"""
+        keys = set(new_digests) | set(days)
+        keys.update(key for key in old_digests if key[1] in reopen_by_metric and key[0] >= reopen_by_metric[key[1]])
+        changed = set()
+        for date, metric in keys:
+            if old_digests.get((date, metric)) != new_digests.get((date, metric)):
+                changed.add(date)
+                if metric == 'sleep':
+                    changed.add(date + dt.timedelta(days=1))  # 睡眠は起床日に集計される
+        return changed
+
+    # ===== 解析（範囲ごとの進捗保存・再開） =====
+
+    def _parse(self, zip_path: str, progress_key: dict, target_metrics: Dict[str, str], cutoff_date: dt.date,
+               reopen: Optional[Dict[str, dt.date]], engine: str,
+               backfill: Optional[Dict[str, Set[dt.date]]] = None) -> DailyPartials:
+        progress = self._load(self.progress_file)
+        if progress.get('key') == progress_key:
+            # 処理済み範囲の記録は進捗に含めないため、再開した取り込みでは記録キャッシュを作らない
+            merged = DailyPartials.from_state(progress['partials'])
+            ranges, done = progress['ranges'], progress['done']
+            print(f"[INFO] 中断した取り込みを再開します: {done}/{len(ranges)} 範囲処理済み")
+        else:
+            merged, ranges, done = DailyPartials(collect_records=True), None, 0
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, 'export.xml')
+            with zipfile.ZipFile(zip_path) as zf, zf.open(EXPORT_MEMBER) as src, open(path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, length=1 << 24)
+            if ranges is None:
+                ranges = [list(r) for r in record_aligned_ranges(path, self.workers * 4)]
+
+            tasks = [(path, start, end, k, target_metrics, cutoff_date, engine, reopen, merged.collect_records, backfill)
+                     for k, (start, end) in enumerate(ranges)][done:]
+            executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+            try:
+                last_saved = time.time()
+                for partials in (executor.map(parse_range, tasks) if executor else map(parse_range, tasks)):
+                    merged.merge(partials)
+                    done += 1
+                    if done < len(ranges) and time.time() - last_saved >= self.progress_interval:
+                        self._save(self.progress_file, {'key': progress_key, 'ranges': ranges, 'done': done,
+                                                        'partials': merged.to_state()})
+                        last_saved = time.time()
+            finally:
+                if executor:
+                    executor.shutdown()
+        return merged
+
+    # ===== 記録キャッシュ =====
+
+    def _update_record_cache(self, new: DailyPartials, fingerprint: str, previous_fingerprint: Optional[str],
+                             target_metrics: Dict[str, str], cutoff_date: dt.date,
+                             reopen: Optional[Dict[str, dt.date]], backfill: Dict[str, Set[dt.date]] = None):
+        """今回の解析結果で記録キャッシュを作成（差分取り込みでは前回のキャッシュの再解析していない記録と結合）"""
+        if not new.collect_records:
+            return
+        columns = new.record_columns()
+        if reopen is not None:
+            previous = self.record_cache.load(previous_fingerprint, target_metrics, cutoff_date) \
+                if previous_fingerprint else None
+            if previous is None:
+                print("[INFO] 前回の記録キャッシュがないため、次回の全期間集計時に作成します")
+                return
+            keys, _ = previous.day_keys()
+            reopen_keys = np.array([date_key(reopen[typ]) if typ in reopen else 0 for typ in previous.types] + [0],
+                                   dtype=np.int64)
+            kept = keys < reopen_keys[previous.type_code]
+            if backfill:
+                # 集計し直した日の記録は今回の解析結果を使う
+                pairs = [k * 100000000 + date_key(date) for k, typ in enumerate(previous.types)
+                         for date in backfill.get(typ, ())]
+                kept &= ~np.isin(previous.type_code.astype(np.int64) * 100000000 + keys, pairs)
+            columns = RecordColumns.concat([previous.take(kept), columns])
+        self.record_cache.save(columns, fingerprint, target_metrics, cutoff_date)
+
+    # ===== 取り込み =====
+
+    def run(self, zip_path: str, target_metrics: Dict[str, str], cutoff_date: dt.date,
+            full: bool = False) -> Tuple[DailyPartials, Optional[Set[dt.date]]]:
+        """書き出しを取り込み、(全期間の部分集計, 変更日) を返す
+
+        変更日が None の場合は全期間を解析し直した（全日を書き直す）、空集合は変更なし。
+        チェックポイントは変更日を CSV に反映した後に commit() で保存する
+        """
+        self._pending = None
+        fingerprint = self.fingerprint(zip_path)
+        config = self._config(target_metrics, cutoff_date)
+        state = {} if full else self._load(self.state_file)
+        if state and state.get('config') != config:
+            print("[INFO] 取り込み条件が変わったため全期間を解析し直します")
+            state = {}
+
+        stored = DailyPartials.from_state(state['partials']) if state else None
+        if stored is not None and state.get('fingerprint') == fingerprint:
+            print("[INFO] 前回と同じ書き出しデータのため解析を省略します")
+            stored.count = stored.skipped = stored.already = 0
+            return stored, set()
+
+        reopen = self.reopen_dates(state.get('watermarks', {}), target_metrics) if stored is not None else None
+        cached = self.record_cache.load(fingerprint, target_metrics, cutoff_date) if stored is None else None
+        if cached is not None:
+            # 同じ書き出しの記録キャッシュから集計し直す（XML は解析しない）
+            start = time.perf_counter()
+            partials = DailyPartials.from_columns(cached, target_metrics, cutoff_date)
+            print(f"[INFO] 記録キャッシュから集計しました: {len(cached):,} 件 ({time.perf_counter() - start:.2f}秒)")
+            self._pending = (fingerprint, config, target_metrics, partials)
+            return partials, None
+
+        progress_key = {
+            'fingerprint': fingerprint,
+            'config': config,
+            'reopen': {typ: date.isoformat() for typ, date in reopen.items()} if reopen is not None else None,
+        }
+        try:
+            new = self._parse(zip_path, progress_key, target_metrics, cutoff_date, reopen, self.engine)
+        except (UnicodeDecodeError, re.error) as e:
+            if self.engine != 'regex':
+                raise
+            print(f"[WARNING] 高速スキャナで解析できないため ElementTree で再解析します: {e}")
+            if self.progress_file.exists():
+                self.progress_file.unlink()
+            new = self._parse(zip_path, progress_key, target_metrics, cutoff_date, reopen, 'etree')
+            engine = 'etree'
+        else:
+            engine = self.engine
+
+        days, backfill = set(), None
+        if stored is not None:
+            reopen_by_metric = {target_metrics[typ]: date for typ, date in reopen.items()}
+            days = self.backfilled_days(stored.digests, new.seen_digests, reopen_by_metric)
+            if days:
+                # さかのぼり期間より前に追加・削除された記録がある日だけを集計し直す
+                backfill = {typ: {date for date, metric in days if metric == target_metrics[typ]} for typ in reopen}
+                print(f"[INFO] 取り込み済みの期間に変更された記録があります: {len({date for date, _ in days})} 日分 "
+                      f"({min(date for date, _ in days)} 〜 {max(date for date, _ in days)})")
+                backfill_key = dict(progress_key, backfill={typ: sorted(date.isoformat() for date in dates)
+                                                            for typ, dates in backfill.items()})
+                new.merge(self._parse(zip_path, backfill_key, target_metrics, cutoff_date, None, engine, backfill))
+        new.seen_digests = {}
+        self._update_record_cache(new, fingerprint, state.get('fingerprint'), target_metrics, cutoff_date, reopen,
+                                  backfill)
+
+        if stored is None:
+            partials, changed = new, None
+        else:
+            changed = self.changed_dates(stored.digests, new.digests, reopen_by_metric, days)
+            partials = stored.drop_from(reopen_by_metric, days).merge(new)
+            # 件数は今回の解析分を表示
+            partials.count, partials.skipped, partials.already = new.count, new.skipped, new.already
+
+        if self.progress_file.exists():
+            self.progress_file.unlink()
+        self._pending = (fingerprint, config, target_metrics, partials)
+        return partials, changed
+
+    def commit(self):
+        """run() の結果をチェックポイントに保存（変更日を CSV に反映した後に呼ぶ）"""
+        if self._pending is not None:
+            self._save_state(*self._pending)
+            self._pending = None
+
+    def _save_state(self, fingerprint: str, config: dict, target_metrics: Dict[str, str], partials: DailyPartials):
+        last_dates = partials.last_dates()
+        watermarks = {typ: last_dates[metric].isoformat() for typ, metric in target_metrics.items()
+                      if metric in last_dates}
+        self._save(self.state_file, {
+            'fingerprint': fingerprint,
+            'config': config,
+            'imported_at': dt.datetime.now().isoformat(timespec='seconds'),
+            'watermarks': watermarks,
+            'partials': partials.to_state(),
+        })
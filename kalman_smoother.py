@@ -0,0 +1,253 @@
+"""
+Kalman Smoother - 体組成計測値の状態空間平滑化
+RENPHO の体重・体脂肪率・筋肉量に等速度モデルのカルマンフィルタを適用し、
+平滑化レベルと傾き（1日あたり変化量）を移動平均列の隣に派生列として追加する
+
+- 通常時: 保存済みフィルタ状態から新しい計測値の行だけ更新（因果フィルタ、{指標}_kf 列）
+- 振り返り用: 全履歴に RTS 平滑化を適用し、将来の値を使うため別列（{指標}_rts）に出力
+  （フィルタ状態は保存せず、_kf 列や差分更新には影響しない）
+"""
+
+import argparse
+import json
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+
+class KalmanSmoother:
+    """等速度モデル（レベル＋傾き）のカルマンフィルタ／RTS平滑化"""
+
+    # 指標ごとの雑音パラメータ
+    # measurement_std: 計測誤差の標準偏差, process_std: 傾きの1日あたり変動の標準偏差
+    METRIC_PARAMS = {
+        '体重_kg': {'measurement_std': 0.35, 'process_std': 0.01},
+        '体脂肪率': {'measurement_std': 0.6, 'process_std': 0.01},
+        '筋肉量_kg': {'measurement_std': 0.35, 'process_std': 0.01},
+    }
+
+    STATE_HISTORY_DAYS = 60  # 差分更新の起点として保持する日次状態数
+    INITIAL_SLOPE_STD = 0.1
+
+    def __init__(self, reports_dir: str = "reports"):
+        self.reports_dir = Path(reports_dir)
+        self.state_file = self.reports_dir / "kalman_state.json"
+        self.metrics = list(self.METRIC_PARAMS)
+
+        self.r = np.array([self.METRIC_PARAMS[m]['measurement_std'] ** 2 for m in self.metrics])
+        self.q = np.array([self.METRIC_PARAMS[m]['process_std'] ** 2 for m in self.metrics])
+
+    # ===== 状態保存 =====
+
+    def load_state(self) -> dict:
+        """保存済みフィルタ状態を読み込み"""
+        if not self.state_file.exists():
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('metrics') != self.metrics:
+                print("[WARNING] カルマン状態の指標構成が異なるため破棄します")
+                return {}
+            return state
+        except Exception as e:
+            print(f"[ERROR] カルマン状態読み込みエラー: {e}")
+            return {}
+
+    def save_state(self, history: list):
+        """日次フィルタ状態（直近分）を保存"""
+        state = {
+            'metrics': self.metrics,
+            'history': history[-self.STATE_HISTORY_DAYS:]
+        }
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"[ERROR] カルマン状態保存エラー: {e}")
+
+    # ===== フィルタ演算（指標方向にベクトル化: x=(m,2), P=(m,2,2)） =====
+
+    def _initial_state(self):
+        m = len(self.metrics)
+        x = np.full((m, 2), np.nan)
+        P = np.full((m, 2, 2), np.nan)
+        return x, P
+
+    def _predict(self, x, P, dt):
+        """dt日分の予測ステップ（未初期化の指標はNaNのまま）"""
+        F = np.array([[1.0, dt], [0.0, 1.0]])
+        Q = np.array([[dt ** 3 / 3, dt ** 2 / 2], [dt ** 2 / 2, dt]])[None, :, :] * self.q[:, None, None]
+        x_pred = x @ F.T
+        P_pred = F[None, :, :] @ P @ F.T[None, :, :] + Q
+        return x_pred, P_pred
+
+    def _update(self, x, P, z):
+        """観測ステップ（z が NaN の指標は予測値のまま、未初期化なら観測値で初期化）"""
+        x = x.copy()
+        P = P.copy()
+        observed = ~np.isnan(z)
+
+        new = observed & np.isnan(x[:, 0])
+        if new.any():
+            x[new, 0] = z[new]
+            x[new, 1] = 0.0
+            P[new] = 0.0
+            P[new, 0, 0] = self.r[new]
+            P[new, 1, 1] = self.INITIAL_SLOPE_STD ** 2
+
+        update = observed & ~new
+        if update.any():
+            innovation = z[update] - x[update, 0]
+            s = P[update, 0, 0] + self.r[update]
+            gain = P[update, :, 0] / s[:, None]
+            x[update] = x[update] + gain * innovation[:, None]
+            P[update] = P[update] - gain[:, :, None] * P[update, 0, :][:, None, :]
+        return x, P
+
+    def _filter(self, dates: np.ndarray, values: np.ndarray, x, P, last_date=None):
+        """前向きフィルタ（各行の予測・事後状態を返す）"""
+        n, m = values.shape
+        xs = np.full((n, m, 2), np.nan)
+        Ps = np.full((n, m, 2, 2), np.nan)
+        xs_pred = np.full((n, m, 2), np.nan)
+        Ps_pred = np.full((n, m, 2, 2), np.nan)
+        dts = np.zeros(n)
+
+        for i in range(n):
+            dt = float((dates[i] - last_date).astype(int)) if last_date is not None else 0.0
+            x, P = self._predict(x, P, dt) if dt > 0 else (x, P)
+            xs_pred[i], Ps_pred[i], dts[i] = x, P, dt
+            x, P = self._update(x, P, values[i])
+            xs[i], Ps[i] = x, P
+            last_date = dates[i]
+        return xs, Ps, xs_pred, Ps_pred, dts
+
+    def _rts_smooth(self, xs, Ps, xs_pred, Ps_pred, dts):
+        """RTS後向き平滑化"""
+        xs_smooth = xs.copy()
+        Ps_smooth = Ps.copy()
+        for i in range(len(xs) - 2, -1, -1):
+            F = np.array([[1.0, dts[i + 1]], [0.0, 1.0]])
+            P_next = Ps_pred[i + 1]
+            ready = ~np.isnan(xs[i, :, 0]) & ~np.isnan(P_next[:, 0, 0])
+            if not ready.any():
+                continue
+            gain = Ps[i, ready] @ F.T @ np.linalg.inv(P_next[ready])
+            xs_smooth[i, ready] = xs[i, ready] + (gain @ (xs_smooth[i + 1, ready] - xs_pred[i + 1, ready])[:, :, None])[:, :, 0]
+            Ps_smooth[i, ready] = Ps[i, ready] + gain @ (Ps_smooth[i + 1, ready] - P_next[ready]) @ np.transpose(gain, (0, 2, 1))
+        return xs_smooth
+
+    # ===== 公開API =====
+
+    def _inputs(self, df: pd.DataFrame):
+        dates = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[D]')
+        values = np.column_stack([
+            pd.to_numeric(df[m], errors='coerce').to_numpy(dtype=float) if m in df.columns
+            else np.full(len(df), np.nan)
+            for m in self.metrics
+        ])
+        return dates, values
+
+    def _state_record(self, date, x, P) -> dict:
+        return {'date': str(date), 'x': x.tolist(), 'P': P.tolist()}
+
+    def add_columns(self, ma_df: pd.DataFrame, previous_df: pd.DataFrame = None, mode: str = 'filter') -> pd.DataFrame:
+        """平滑化レベル（{指標}_kf）と傾き（{指標}_kf_slope）列を移動平均列の隣に追加
+
+        Args:
+            ma_df: 移動平均計算済みデータ（日付昇順）
+            previous_df: 前回保存した移動平均データ。入力が変わっていない行は
+                         その派生列を再利用し、保存済み状態から新しい行だけ更新する
+            mode: 'filter'（因果フィルタ・差分更新）または 'rts'（全履歴RTS平滑化。
+                  将来の値を使うため {指標}_rts / {指標}_rts_slope 列に出力し、フィルタ状態は保存しない）
+        """
+        if mode not in ('filter', 'rts'):
+            raise ValueError(f"未対応のモードです: {mode}")
+        ma_df = ma_df.copy()
+        if ma_df.empty:
+            return ma_df
+
+        dates, values = self._inputs(ma_df)
+        levels = np.full(values.shape, np.nan)
+        slopes = np.full(values.shape, np.nan)
+        first_row = 0
+        x, P = self._initial_state()
+        last_date = None
+
+        # 差分更新: 前回データと一致する先頭行を再利用
+        history = self.load_state().get('history', []) if mode == 'filter' else []
+        kf_columns = [f'{m}_kf' for m in self.metrics] + [f'{m}_kf_slope' for m in self.metrics]
+        if previous_df is not None and not previous_df.empty and history \
+                and all(col in previous_df.columns for col in kf_columns):
+            prev_dates, prev_values = self._inputs(previous_df)
+            common = min(len(prev_dates), len(dates))
+            same = (prev_dates[:common] == dates[:common]) & (
+                (prev_values[:common] == values[:common])
+                | (np.isnan(prev_values[:common]) & np.isnan(values[:common]))).all(axis=1)
+            first_row = common if same.all() else int(np.argmin(same))
+
+            states = {record['date']: record for record in history}
+            start_state = states.get(str(dates[first_row - 1])) if first_row > 0 else None
+            if start_state is not None:
+                x = np.array(start_state['x'], dtype=float)
+                P = np.array(start_state['P'], dtype=float)
+                last_date = dates[first_row - 1]
+                for k, m in enumerate(self.metrics):
+                    levels[:first_row, k] = previous_df[f'{m}_kf'].to_numpy(dtype=float)[:first_row]
+                    slopes[:first_row, k] = previous_df[f'{m}_kf_slope'].to_numpy(dtype=float)[:first_row]
+                history = [r for r in history if np.datetime64(r['date'], 'D') < dates[first_row]] if first_row < len(dates) else history
+            else:
+                first_row = 0
+
+        if first_row == 0:
+            history = []
+
+        xs, Ps, xs_pred, Ps_pred, dts = self._filter(dates[first_row:], values[first_row:], x, P, last_date)
+        estimates = self._rts_smooth(xs, Ps, xs_pred, Ps_pred, dts) if mode == 'rts' else xs
+        levels[first_row:] = estimates[:, :, 0]
+        slopes[first_row:] = estimates[:, :, 1]
+
+        # フィルタ状態（平滑化ではなく事後状態）を日次で保存（差分更新の起点は因果フィルタのみ）
+        if mode == 'filter':
+            for i in range(max(len(xs) - self.STATE_HISTORY_DAYS, 0), len(xs)):
+                history.append(self._state_record(dates[first_row + i], xs[i], Ps[i]))
+            self.save_state(history)
+
+        # 派生列を {指標}_ma28（RTS は {指標}_kf_slope があればその後ろ）の直後に配置
+        prefix = '_rts' if mode == 'rts' else '_kf'
+        for k, m in enumerate(self.metrics):
+            for suffix, data in ((prefix, levels[:, k]), (f'{prefix}_slope', slopes[:, k])):
+                col = f'{m}{suffix}'
+                if col in ma_df.columns:
+                    ma_df = ma_df.drop(columns=col)
+                if suffix == prefix:
+                    anchors = [f'{m}_kf_slope', f'{m}_ma28'] if mode == 'rts' else [f'{m}_ma28']
+                else:
+                    anchors = [f'{m}{prefix}']
+                anchor = next((a for a in anchors if a in ma_df.columns), None)
+                position = ma_df.columns.get_loc(anchor) + 1 if anchor is not None else len(ma_df.columns)
+                rounding = 4 if suffix.endswith('_slope') else 2
+                ma_df.insert(position, col, np.round(data, rounding))
+
+        print(f"[INFO] カルマン平滑化完了（{mode}）: {len(ma_df) - first_row}行更新")
+        return ma_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description='移動平均データにカルマン平滑化列をバックフィル')
+    parser.add_argument('--reports-dir', default=str(Path(__file__).parent / "reports"))
+    parser.add_argument('--mode', choices=['filter', 'rts'], default='filter',
+                        help="filter: 因果フィルタ（_kf 列）/ rts: 振り返り用の RTS 平滑化（_rts 列）")
+    args = parser.parse_args()
+
+    smoother = KalmanSmoother(args.reports_dir)
+    ma_csv = smoother.reports_dir / "7日移動平均データ.csv"
+    ma_df = pd.read_csv(ma_csv, encoding='utf-8-sig')
+    ma_df = smoother.add_columns(ma_df, mode=args.mode)
+    ma_df.to_csv(ma_csv, index=False, encoding='utf-8-sig')
+    print(f"[SUCCESS] カルマン平滑化列を保存: {ma_csv}")
+
+
+if __name__ == "__main__":
+    main()
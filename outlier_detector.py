@@ -0,0 +1,182 @@
+"""
+Outlier Detector - センサー異常値の検出と隔離
+- 指標ごとに直近の採用値のローリング中央値/MADで外れ度を評価
+- 取り込みごとに変更のあった日付以降だけを逐次判定（状態は JSON に保存）
+- 隔離（quarantine）した値は移動平均・インデックス・分析の入力から除外
+"""
+
+import json
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Optional
+
+
+class OutlierDetector:
+    """ローリング中央値/MADによる外れ値検出と隔離"""
+
+    # window: 参照する直近採用値の件数, threshold: 外れ度（MAD換算）の閾値,
+    # min_scale: MADの下限（値が揃いすぎた期間の過検出防止）, mode: quarantine=除外 / flag=記録のみ
+    METRIC_RULES = {
+        '体重_kg': {'window': 14, 'threshold': 5.0, 'min_scale': 0.5, 'mode': 'quarantine'},
+        '体脂肪量_kg': {'window': 14, 'threshold': 5.0, 'min_scale': 0.5, 'mode': 'quarantine'},
+        '体脂肪率': {'window': 14, 'threshold': 5.0, 'min_scale': 0.8, 'mode': 'quarantine'},
+        '筋肉量_kg': {'window': 14, 'threshold': 5.0, 'min_scale': 0.5, 'mode': 'quarantine'},
+        '活動カロリー_kcal': {'window': 28, 'threshold': 6.0, 'min_scale': 100.0, 'mode': 'quarantine'},
+        '歩数': {'window': 28, 'threshold': 6.0, 'min_scale': 1500.0, 'mode': 'quarantine'},
+        '摂取カロリー_kcal': {'window': 28, 'threshold': 6.0, 'min_scale': 200.0, 'mode': 'flag'},
+    }
+    MIN_HISTORY = 5      # 判定に必要な採用値の件数
+    SHIFT_CONFIRM = 3    # 同方向の外れ値がこの件数続いたら水準変化とみなして採用
+
+    def __init__(self, reports_dir: str = "reports", metric_rules: dict = None):
+        self.reports_dir = Path(reports_dir)
+        self.state_file = self.reports_dir / "outlier_state.json"
+        self.metric_rules = metric_rules or self.METRIC_RULES
+
+    def _load_state(self) -> dict:
+        if not self.state_file.exists():
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[ERROR] 外れ値状態読み込みエラー: {e}")
+            return {}
+
+    def _save_state(self, state: dict):
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"[ERROR] 外れ値状態保存エラー: {e}")
+
+    def _series(self, df: pd.DataFrame, metric: str):
+        """有効値のみの (日付文字列, 値)"""
+        if df.empty or metric not in df.columns:
+            return [], np.array([])
+        valid = pd.DataFrame({
+            'date': pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d'),
+            'value': pd.to_numeric(df[metric], errors='coerce')
+        }).dropna().sort_values('date')
+        return valid['date'].tolist(), valid['value'].to_numpy(dtype=float)
+
+    def _step(self, checkpoint: dict, metric: str, rule: dict, date: str, value: float) -> dict:
+        """1計測分の判定（checkpoint: last_date, accepted, pending, points）"""
+        checkpoint = {
+            'last_date': date,
+            'accepted': list(checkpoint.get('accepted', [])),
+            'pending': list(checkpoint.get('pending', [])),
+            'points': list(checkpoint.get('points', [])),
+        }
+        accepted = checkpoint['accepted']
+
+        if len(accepted) < self.MIN_HISTORY:
+            accepted.append(value)
+            del accepted[:-rule['window']]
+            return checkpoint
+
+        reference = np.asarray(accepted)
+        median = float(np.median(reference))
+        scale = max(float(np.median(np.abs(reference - median))) * 1.4826, rule['min_scale'])
+        score = (value - median) / scale
+
+        if abs(score) <= rule['threshold']:
+            accepted.append(value)
+            checkpoint['pending'] = []
+        else:
+            checkpoint['points'].append({
+                'date': date, 'metric': metric, 'value': value,
+                'median': round(median, 2), 'scale': round(scale, 2),
+                'score': round(score, 1), 'mode': rule['mode']
+            })
+            pending = checkpoint['pending']
+            if pending and np.sign(pending[-1]['score']) != np.sign(score):
+                pending.clear()
+            pending.append({'date': date, 'value': value, 'score': score})
+
+            # 同方向の外れ値が続いたら水準変化として採用し、隔離を解除
+            if len(pending) >= self.SHIFT_CONFIRM:
+                released = {p['date'] for p in pending}
+                checkpoint['points'] = [p for p in checkpoint['points'] if p['date'] not in released]
+                accepted.extend(p['value'] for p in pending)
+                checkpoint['pending'] = []
+
+        del accepted[:-rule['window']]
+        return checkpoint
+
+    def screen(self, df: pd.DataFrame) -> list:
+        """変更のあった日付以降を判定し、新たに検出した外れ値を返す
+
+        直前の判定状態（base: 最終日より前、current: 最終日まで）のうち、
+        変更日より前の状態から再開する。それより古い日付の変更時は全履歴を再判定。
+        """
+        state = self._load_state()
+        detected = []
+
+        for metric, rule in self.metric_rules.items():
+            dates, values = self._series(df, metric)
+            metric_state = state.get(metric, {})
+            seen = metric_state.get('seen', {})
+
+            # 前回判定した値との差分開始日（削除された日付も含む）
+            current_values = dict(zip(dates, values.tolist()))
+            changed = [date for date, value in current_values.items() if seen.get(date) != value]
+            changed += [date for date in seen if date not in current_values]
+            if not changed:
+                continue
+            first_date = min(changed)
+
+            # 変更日より前で終わる最新の状態から再判定
+            checkpoint = next((c for c in (metric_state.get('current'), metric_state.get('base'))
+                               if c and c['last_date'] < first_date), {})
+            start = int(np.searchsorted(dates, checkpoint['last_date'], side='right')) if checkpoint else 0
+
+            base = {}
+            for i in range(start, len(dates)):
+                if i == len(dates) - 1:
+                    base = checkpoint
+                checkpoint = self._step(checkpoint, metric, rule, dates[i], float(values[i]))
+
+            detected.extend(p for p in checkpoint.get('points', []) if p['date'] >= first_date)
+            state[metric] = {'seen': current_values, 'base': base, 'current': checkpoint}
+
+        self._save_state(state)
+        for point in detected:
+            label = '隔離' if point['mode'] == 'quarantine' else '要確認'
+            print(f"[WARNING] 外れ値検出（{label}）: {point['date']} {point['metric']}={point['value']} "
+                  f"(中央値{point['median']}, 外れ度{point['score']})")
+        return detected
+
+    def points(self, metric: Optional[str] = None, start_date=None, end_date=None,
+               mode: Optional[str] = None) -> list:
+        """検出済みの外れ値一覧（日付順）"""
+        state = self._load_state()
+        result = []
+        for name, metric_state in state.items():
+            if metric is not None and name != metric:
+                continue
+            result.extend(metric_state.get('current', {}).get('points', []))
+
+        if start_date is not None:
+            result = [p for p in result if p['date'] >= str(pd.to_datetime(start_date).date())]
+        if end_date is not None:
+            result = [p for p in result if p['date'] <= str(pd.to_datetime(end_date).date())]
+        if mode is not None:
+            result = [p for p in result if p['mode'] == mode]
+        return sorted(result, key=lambda p: (p['date'], p['metric']))
+
+    def apply(self, df: pd.DataFrame) -> pd.DataFrame:
+        """隔離中の値を欠損に置き換えたコピーを返す"""
+        df = df.copy()
+        quarantined = self.points(mode='quarantine')
+        if not quarantined or df.empty:
+            return df
+
+        dates = pd.to_datetime(df['date']).dt.strftime('%Y-%m-%d')
+        for point in quarantined:
+            if point['metric'] in df.columns:
+                df[point['metric']] = df[point['metric']].astype(float)
+                df.loc[dates == point['date'], point['metric']] = np.nan
+        print(f"[INFO] 外れ値隔離: {len(quarantined)}件を移動平均・分析入力から除外")
+        return df
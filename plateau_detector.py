@@ -0,0 +1,271 @@
+"""
+Plateau Detector - 体脂肪量の停滞（プラトー）検出
+- PELT: 線形トレンド区間のコストモデルで全履歴を区分化し、最新区間が停滞かを判定
+- CUSUM: 取り込みごとに7日移動平均の変化を逐次評価するオンライン検出（状態は JSON に保存）
+"""
+
+import json
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+
+class PlateauDetector:
+    """変化点検出による停滞期間の判定"""
+
+    def __init__(self, reports_dir: str = "reports", column: str = '体脂肪量_kg',
+                 min_segment_days: int = 7, penalty_beta: float = 2.0,
+                 min_loss_per_day: float = 0.1 / 14, cusum_column: str = '体脂肪量_kg_ma7',
+                 cusum_threshold: float = 0.1):
+        self.reports_dir = Path(reports_dir)
+        self.state_file = self.reports_dir / "plateau_cusum_state.json"
+        self.column = column
+        self.min_segment_days = min_segment_days
+        self.penalty_beta = penalty_beta
+        # 1日あたりこれ以上減っていなければ停滞（従来の「14日で0.1kg未満」と同基準）
+        self.min_loss_per_day = min_loss_per_day
+        # CUSUM: 目標ペースに対する累積不足がこの値(kg)を超えたら警報
+        self.cusum_column = cusum_column
+        self.cusum_threshold = cusum_threshold
+
+    # ===== PELT（線形トレンド区間コスト） =====
+
+    def _series(self, df: pd.DataFrame, column: str = None):
+        """有効値のみの (日付, 経過日数, 値)"""
+        column = column or self.column
+        if df.empty or column not in df.columns:
+            return np.array([], dtype='datetime64[D]'), np.array([]), np.array([])
+        valid = df[['date', column]].dropna()
+        dates = pd.to_datetime(valid['date']).to_numpy(dtype='datetime64[D]')
+        values = valid[column].to_numpy(dtype=float)
+        x = (dates - dates[0]).astype(float) if len(dates) else np.array([])
+        return dates, x, values
+
+    def _segment_fit(self, prefix, s, t):
+        """区間 [s, t) の線形回帰（s は配列可）: RSS と傾き"""
+        n = t - s
+        sx = prefix['x'][t] - prefix['x'][s]
+        sy = prefix['y'][t] - prefix['y'][s]
+        sxx = prefix['xx'][t] - prefix['xx'][s]
+        sxy = prefix['xy'][t] - prefix['xy'][s]
+        syy = prefix['yy'][t] - prefix['yy'][s]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            vxx = sxx - sx * sx / n
+            vxy = sxy - sx * sy / n
+            vyy = syy - sy * sy / n
+            slope = np.where(vxx > 0, vxy / vxx, 0.0)
+            rss = np.maximum(vyy - slope * vxy, 0.0)
+        return rss, slope
+
+    def _pelt(self, x: np.ndarray, y: np.ndarray):
+        """PELT本体: 各プレフィックス y[:t] の最適分割における最終区間の開始位置を返す"""
+        n = len(y)
+        prefix = self._prefix(x, y)
+
+        # 雑音分散（1次差分のMADから推定）とペナルティ
+        diffs = np.diff(y)
+        sigma = np.median(np.abs(diffs - np.median(diffs))) / 0.6745 / np.sqrt(2)
+        sigma2 = max(sigma ** 2, 1e-6)
+        penalty = self.penalty_beta * 2 * sigma2 * np.log(n)
+        min_size = self.min_segment_days
+
+        F = np.full(n + 1, np.inf)
+        F[0] = -penalty
+        last_break = np.zeros(n + 1, dtype=int)
+        candidates = np.array([0])
+
+        for t in range(min_size, n + 1):
+            usable = candidates[t - candidates >= min_size]
+            if usable.size:
+                rss, _ = self._segment_fit(prefix, usable, t)
+                costs = F[usable] + rss + penalty
+                best = int(np.argmin(costs))
+                F[t] = costs[best]
+                last_break[t] = usable[best]
+
+                # 剪定: 今後最適になり得ない候補を除外
+                keep = F[usable] + rss <= F[t]
+                candidates = np.concatenate([usable[keep], candidates[t - candidates < min_size]])
+            if t + min_size <= n:
+                candidates = np.append(candidates, t)
+
+        return last_break, prefix
+
+    def _segments(self, last_break: np.ndarray, prefix: dict, t: int):
+        """プレフィックス y[:t] の分割（区間開始位置と傾き）"""
+        if t < self.min_segment_days * 2:
+            breaks = [0]
+        else:
+            breaks = []
+            end = t
+            while end > 0:
+                end = int(last_break[end])
+                breaks.append(end)
+            breaks = sorted(breaks)
+        ends = breaks[1:] + [t]
+        slopes = [float(self._segment_fit(prefix, s, e)[1]) for s, e in zip(breaks, ends)]
+        return breaks, slopes
+
+    def detect_change_points(self, df: pd.DataFrame) -> dict:
+        """PELTで変化点を検出
+
+        Returns:
+            {'dates', 'values', 'breaks'（各区間の開始位置）, 'slopes'}
+        """
+        dates, x, y = self._series(df)
+        n = len(y)
+        if n < 2:
+            return {'dates': dates, 'values': y, 'breaks': [0] if n else [], 'slopes': []}
+
+        last_break, prefix = self._pelt(x, y) if n >= self.min_segment_days * 2 else (None, self._prefix(x, y))
+        breaks, slopes = self._segments(last_break, prefix, n)
+        return {'dates': dates, 'values': y, 'breaks': breaks, 'slopes': slopes}
+
+    def _plateau_from_segments(self, dates, breaks, slopes) -> tuple:
+        """最新区間が停滞なら (開始日, 日数)。連続する停滞区間は結合"""
+        flat = [slope > -self.min_loss_per_day for slope in slopes]
+        if not flat or not flat[-1]:
+            return None, 0
+        first_flat = len(flat) - 1
+        while first_flat > 0 and flat[first_flat - 1]:
+            first_flat -= 1
+        start_date = dates[breaks[first_flat]]
+        return start_date, int((dates[len(dates) - 1] - start_date).astype(int)) + 1
+
+    def plateau_history(self, df: pd.DataFrame) -> pd.DataFrame:
+        """各計測日時点の停滞判定（バックテスト用）
+
+        各日の判定はその日までの計測だけで行う。PELTの雑音分散・ペナルティも
+        その日までのプレフィックスから推定するため、その日までのデータで
+        detect_plateau を実行した結果と一致する（全履歴の雑音を使う先読みをしない）。
+        """
+        dates, x, y = self._series(df)
+        records = []
+        for t in range(2, len(y) + 1):
+            if t >= self.min_segment_days * 2:
+                last_break, prefix = self._pelt(x[:t], y[:t])
+            else:
+                last_break, prefix = None, self._prefix(x[:t], y[:t])
+            breaks, slopes = self._segments(last_break, prefix, t)
+            start_date, days = self._plateau_from_segments(dates[:t], breaks, slopes)
+            records.append({'date': pd.Timestamp(dates[t - 1]), 'plateau_start': str(start_date) if start_date is not None else None,
+                            'plateau_days': days})
+        return pd.DataFrame(records, columns=['date', 'plateau_start', 'plateau_days'])
+
+    def _prefix(self, x, y) -> dict:
+        def cumulative(v):
+            return np.concatenate([[0.0], np.cumsum(v)])
+        return {'x': cumulative(x), 'y': cumulative(y), 'xx': cumulative(x * x),
+                'xy': cumulative(x * y), 'yy': cumulative(y * y)}
+
+    def detect_plateau(self, df: pd.DataFrame) -> dict:
+        """最新区間が停滞かを判定（連続する停滞区間は結合）
+
+        Returns:
+            {'is_plateau', 'plateau_start', 'plateau_days', 'segment_slope_per_day', 'change_points'}
+        """
+        result = self.detect_change_points(df)
+        dates, breaks, slopes = result['dates'], result['breaks'], result['slopes']
+        if not breaks or not slopes:
+            return {'is_plateau': False, 'plateau_start': None, 'plateau_days': 0,
+                    'segment_slope_per_day': None, 'change_points': []}
+
+        start_date, plateau_days = self._plateau_from_segments(dates, breaks, slopes)
+        is_plateau = start_date is not None
+
+        return {
+            'is_plateau': bool(is_plateau),
+            'plateau_start': str(start_date) if is_plateau else None,
+            'plateau_days': plateau_days,
+            'segment_slope_per_day': round(slopes[-1], 4),
+            'change_points': [str(dates[b]) for b in breaks[1:]]
+        }
+
+    # ===== オンラインCUSUM =====
+
+    def _load_cusum_state(self) -> dict:
+        if not self.state_file.exists():
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[ERROR] CUSUM状態読み込みエラー: {e}")
+            return {}
+
+    def _save_cusum_state(self, state: dict):
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"[ERROR] CUSUM状態保存エラー: {e}")
+
+    def _cusum_step(self, state: dict, date: str, value: float) -> dict:
+        """1計測分のCUSUM更新（目標減少ペースに届かない分を累積し、閾値超過で警報）"""
+        state = dict(state)
+        if state.get('last_value') is None:
+            state.update({'statistic': 0.0, 'run_start': date, 'alarm': False,
+                          'last_value': value, 'last_date': date})
+            return state
+
+        days = max(int((np.datetime64(date, 'D') - np.datetime64(state['last_date'], 'D')).astype(int)), 1)
+        shortfall = (value - state['last_value']) + self.min_loss_per_day * days
+        statistic = max(0.0, state['statistic'] + shortfall)
+
+        # 累積が0から立ち上がった日を停滞開始候補として記録
+        if statistic == 0.0:
+            state['run_start'] = date
+        elif state['statistic'] == 0.0:
+            state['run_start'] = state['last_date']
+
+        state.update({'statistic': statistic, 'alarm': statistic > self.cusum_threshold,
+                      'last_value': value, 'last_date': date})
+        return state
+
+    def update_online(self, df: pd.DataFrame) -> dict:
+        """変更のあった日付以降だけでCUSUMを更新
+
+        前回反映した値（seen）との差分開始日を求め、保存済みの状態
+        （base: 最終日より前、current: 最終日まで）のうち変更日より前で終わる状態から再開する。
+        過去の移動平均が修正された場合も、それより古い状態がなければ全履歴から再計算する。
+
+        Returns:
+            {'alarm', 'run_start', 'statistic', 'last_date'}
+        """
+        dates, _, values = self._series(df, self.cusum_column)
+        if not len(values):
+            return {}
+
+        state = self._load_cusum_state()
+        seen = state.get('seen', {})
+        date_keys = [str(date) for date in dates]
+
+        # 前回反映した値との差分開始日（削除された日付も含む）
+        current_values = dict(zip(date_keys, values.tolist()))
+        changed = [date for date, value in current_values.items() if seen.get(date) != value]
+        changed += [date for date in seen if date not in current_values]
+        if not changed:
+            current = state.get('current', {})
+            return {key: current.get(key) for key in ('alarm', 'run_start', 'statistic', 'last_date')}
+        first_date = min(changed)
+
+        # 変更日より前で終わる最新の状態から再計算
+        checkpoint = next((c for c in (state.get('current'), state.get('base'))
+                           if c and c.get('last_date') and c['last_date'] < first_date), {})
+        start = int(np.searchsorted(dates, np.datetime64(checkpoint['last_date'], 'D'), side='right')) if checkpoint else 0
+
+        base = {}
+        for i in range(start, len(values)):
+            if i == len(values) - 1:
+                base = checkpoint
+            checkpoint = self._cusum_step(checkpoint, date_keys[i], float(values[i]))
+        current = checkpoint
+
+        self._save_cusum_state({'seen': current_values, 'base': base, 'current': current})
+        return {key: current.get(key) for key in ('alarm', 'run_start', 'statistic', 'last_date')}
+
+    def online_status(self) -> dict:
+        """保存済みCUSUM状態（最新）"""
+        current = self._load_cusum_state().get('current', {})
+        return {key: current.get(key) for key in ('alarm', 'run_start', 'statistic', 'last_date')}
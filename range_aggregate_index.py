@@ -0,0 +1,137 @@
+"""
+Range Aggregate Index - 日付範囲集計インデックス
+累積和＋有効件数（sum/mean/count）とスパーステーブル（min/max）を事前計算し、
+任意の日付範囲の集計を O(1) で返す
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+from typing import Optional
+
+
+class RangeAggregateIndex:
+    """指標ごとの範囲集計インデックス（指標は初回クエリ時に遅延構築）"""
+
+    FUNCTIONS = ('sum', 'mean', 'min', 'max', 'count')
+
+    def __init__(self, df: pd.DataFrame, date_col: str = 'date'):
+        df = df.copy()
+        df[date_col] = pd.to_datetime(df[date_col])
+        df = df.sort_values(date_col).reset_index(drop=True)
+
+        self.df = df
+        self.dates = df[date_col].to_numpy(dtype='datetime64[D]')
+        self.length = len(df)
+        self.date_col = date_col
+        self._tables = {}
+
+    @classmethod
+    def from_csv(cls, csv_path) -> 'RangeAggregateIndex':
+        """CSVファイルからインデックスを作成"""
+        df = pd.read_csv(Path(csv_path), encoding='utf-8-sig')
+        return cls(df)
+
+    def metrics(self) -> list:
+        """集計可能な数値指標の一覧"""
+        return [col for col in self.df.columns
+                if col != self.date_col and pd.api.types.is_numeric_dtype(self.df[col])]
+
+    def _build_sparse(self, values: np.ndarray, reducer) -> list:
+        """スパーステーブル構築（NaNは無視する fmin/fmax を使用）"""
+        levels = [values]
+        span = 1
+        while span * 2 <= len(values):
+            previous = levels[-1]
+            levels.append(reducer(previous[:-span], previous[span:]))
+            span *= 2
+        return levels
+
+    def _table(self, metric: str) -> dict:
+        """指標の集計テーブルを取得（未構築なら構築）"""
+        if metric in self._tables:
+            return self._tables[metric]
+
+        if metric not in self.df.columns or metric == self.date_col:
+            raise KeyError(f"指標が見つかりません: {metric}")
+        if not pd.api.types.is_numeric_dtype(self.df[metric]):
+            raise KeyError(f"数値指標ではありません: {metric}")
+
+        values = self.df[metric].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        table = {
+            'prefix_sum': np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))]),
+            'prefix_count': np.concatenate([[0], np.cumsum(valid)]),
+            'min': self._build_sparse(values, np.fmin),
+            'max': self._build_sparse(values, np.fmax),
+        }
+        self._tables[metric] = table
+        return table
+
+    def position_range(self, start_date=None, end_date=None) -> Optional[tuple]:
+        """日付範囲（両端含む）を行位置範囲に変換。該当行がなければNone"""
+        lo = 0
+        hi = self.length - 1
+        if start_date is not None:
+            lo = int(np.searchsorted(self.dates, np.datetime64(pd.to_datetime(start_date).date(), 'D'), side='left'))
+        if end_date is not None:
+            hi = int(np.searchsorted(self.dates, np.datetime64(pd.to_datetime(end_date).date(), 'D'), side='right')) - 1
+        if lo > hi:
+            return None
+        return lo, hi
+
+    def query_positions(self, metric: str, lo: int, hi: int, fn: str = 'sum') -> float:
+        """行位置範囲 [lo, hi]（両端含む）の集計
+
+        sum は有効値がなければ0、mean/min/max は NaN を返す。
+        """
+        if fn not in self.FUNCTIONS:
+            raise ValueError(f"未対応の集計関数です: {fn}")
+
+        table = self._table(metric)
+        lo = max(int(lo), 0)
+        hi = min(int(hi), self.length - 1)
+        if lo > hi:
+            return {'sum': 0.0, 'count': 0}.get(fn, np.nan)
+
+        total = table['prefix_sum'][hi + 1] - table['prefix_sum'][lo]
+        count = table['prefix_count'][hi + 1] - table['prefix_count'][lo]
+
+        if fn == 'sum':
+            return float(total)
+        if fn == 'count':
+            return int(count)
+        if fn == 'mean':
+            return float(total / count) if count else np.nan
+
+        # min/max: 重なる2区間の結果を合成
+        level = (hi - lo + 1).bit_length() - 1
+        levels = table[fn]
+        reducer = np.fmin if fn == 'min' else np.fmax
+        return float(reducer(levels[level][lo], levels[level][hi - (1 << level) + 1]))
+
+    def query(self, metric: str, start_date=None, end_date=None, fn: str = 'sum') -> dict:
+        """日付範囲の集計結果を返す
+
+        Returns:
+            {'metric', 'fn', 'start_date', 'end_date', 'value', 'valid_count'}
+        """
+        if fn not in self.FUNCTIONS:
+            raise ValueError(f"未対応の集計関数です: {fn}")
+
+        positions = self.position_range(start_date, end_date)
+        if positions is None:
+            value, count = self.query_positions(metric, 0, -1, fn), 0
+        else:
+            lo, hi = positions
+            value = self.query_positions(metric, lo, hi, fn)
+            count = self.query_positions(metric, lo, hi, 'count')
+
+        return {
+            'metric': metric,
+            'fn': fn,
+            'start_date': str(start_date) if start_date is not None else None,
+            'end_date': str(end_date) if end_date is not None else None,
+            'value': None if pd.isna(value) else value,
+            'valid_count': count
+        }
@@ -0,0 +1,207 @@
+"""
+Record Cache - 解析済み記録の列形式キャッシュ
+export.xml から取り出した対象記録を型付き配列（type・ソース・睡眠ステージはカテゴリ番号）で
+npz に保存し、集計ルール（ソース優先順位・睡眠の扱い等）を調整したときは XML を解析せずに
+キャッシュから集計し直す。書き出し（zip の fingerprint）・対象 type・基準日・日付の区切りが
+一致しない場合は使わない
+
+- 時刻は文字列ではなく day_bucketing.parse() の結果（記載された壁時計の秒・オフセット）で保持
+- 記録ハッシュ（export_xml_parser.record_hash）も保持し、差分検出の要約をキャッシュから再現できる
+"""
+
+import json
+import datetime as dt
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+import pandas as pd
+from day_bucketing import DEFAULT_BUCKETER
+
+
+def format_timestamps(wall: np.ndarray, offset: np.ndarray, has_offset: np.ndarray) -> List[str]:
+    """壁時計の秒・オフセット → "2025-07-31 23:30:00 +0900" 形式（書き出しと同じ書式）"""
+    if len(wall) == 0:
+        return []
+    texts = np.char.replace(np.datetime_as_string(wall.astype('datetime64[s]'), unit='s'), 'T', ' ').tolist()
+    minutes = np.abs(offset) // 60
+    suffixes = [f" {'-' if o < 0 else '+'}{m // 60:02d}{m % 60:02d}" if h else ''
+                for o, m, h in zip(offset.tolist(), minutes.tolist(), has_offset.tolist())]
+    return [text + suffix for text, suffix in zip(texts, suffixes)]
+
+
+def _to_floats(values: List[str]) -> np.ndarray:
+    """文字列 → float（解析時の float() と同じ丸め。解釈できない値は NaN）"""
+    try:
+        return np.array(values, dtype=float)
+    except ValueError:
+        numbers = np.empty(len(values), dtype=float)
+        for i, value in enumerate(values):
+            try:
+                numbers[i] = float(value)
+            except ValueError:
+                numbers[i] = np.nan
+        return numbers
+
+
+class RecordBuffer:
+    """解析中の対象記録（範囲の解析が終わったら RecordColumns に変換）"""
+
+    def __init__(self):
+        self.rows = []
+
+    def append(self, typ: str, source: str, start: str, end: Optional[str], value: Optional[str], record_hash: int):
+        self.rows.append((typ, source, start, end, value, record_hash))
+
+    def to_columns(self, sleep_type: str) -> 'RecordColumns':
+        if not self.rows:
+            return RecordColumns.empty()
+        types, sources, starts, ends, values, hashes = zip(*self.rows)
+        type_codes, type_names = pd.factorize(pd.Series(types, dtype=object))
+        source_codes, source_names = pd.factorize(pd.Series(sources, dtype=object))
+
+        # 睡眠はステージ名をカテゴリ番号、それ以外は数値（解釈できない値は NaN）
+        is_sleep = np.asarray(type_names == sleep_type)[type_codes] if len(type_names) else np.zeros(0, dtype=bool)
+        raw_values = pd.Series(values, dtype=object)
+        stage_codes, stage_names = pd.factorize(raw_values.fillna('').where(is_sleep))
+        numbers = _to_floats(raw_values.where(~is_sleep).fillna('0').tolist())
+
+        start_wall, start_offset, start_has_offset, start_valid = DEFAULT_BUCKETER.parse(starts)
+        # 終了時刻のない記録は開始時刻で埋めて一括解釈し（空文字は低速な個別解釈になるため）、無効にする
+        has_end = np.array([bool(end) for end in ends], dtype=bool)
+        end_wall, end_offset, end_has_offset, end_valid = DEFAULT_BUCKETER.parse(
+            [end if end else start for start, end in zip(starts, ends)])
+        end_valid = end_valid & has_end
+        return RecordColumns(
+            types=list(type_names), sources=list(source_names), stages=list(stage_names),
+            type_code=type_codes.astype(np.int16),
+            source_code=source_codes.astype(np.int16),
+            stage_code=stage_codes.astype(np.int16),
+            value=np.where(is_sleep, np.nan, numbers),
+            start_wall=start_wall, start_offset=start_offset.astype(np.int32),
+            start_has_offset=start_has_offset, start_valid=start_valid,
+            end_wall=end_wall, end_offset=end_offset.astype(np.int32),
+            end_has_offset=end_has_offset, end_valid=end_valid,
+            record_hash=np.array(hashes, dtype=np.uint32),
+        )
+
+
+class RecordColumns:
+    """対象記録の列形式（ファイル順）。カテゴリ列は番号と名前の一覧で持つ"""
+
+    CATEGORIES = {'type_code': 'types', 'source_code': 'sources', 'stage_code': 'stages'}
+    ARRAYS = {
+        'type_code': np.int16, 'source_code': np.int16, 'stage_code': np.int16, 'value': np.float64,
+        'start_wall': np.int64, 'start_offset': np.int32, 'start_has_offset': bool, 'start_valid': bool,
+        'end_wall': np.int64, 'end_offset': np.int32, 'end_has_offset': bool, 'end_valid': bool,
+        'record_hash': np.uint32,
+    }
+
+    def __init__(self, types: List[str], sources: List[str], stages: List[str], **arrays):
+        self.types = list(types)
+        self.sources = list(sources)
+        self.stages = list(stages)
+        self.arrays = {name: np.asarray(arrays[name], dtype=dtype) for name, dtype in self.ARRAYS.items()}
+
+    def __len__(self) -> int:
+        return len(self.arrays['type_code'])
+
+    def __getattr__(self, name):
+        arrays = self.__dict__.get('arrays', {})
+        if name in arrays:
+            return arrays[name]
+        raise AttributeError(name)
+
+    @classmethod
+    def empty(cls) -> 'RecordColumns':
+        return cls([], [], [], **{name: np.zeros(0, dtype=dtype) for name, dtype in cls.ARRAYS.items()})
+
+    @classmethod
+    def concat(cls, parts: List['RecordColumns']) -> 'RecordColumns':
+        """ファイル順に連結（カテゴリは名前の和集合に番号を振り直す）"""
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty()
+        names = {}
+        arrays = {name: [] for name in cls.ARRAYS}
+        for code_name, category in cls.CATEGORIES.items():
+            merged = {}
+            for part in parts:
+                for label in getattr(part, category):
+                    merged.setdefault(label, len(merged))
+            names[category] = list(merged)
+            for part in parts:
+                lookup = np.array([merged[label] for label in getattr(part, category)] + [-1], dtype=np.int16)
+                arrays[code_name].append(lookup[part.arrays[code_name]])  # -1（カテゴリなし）は末尾の -1 を参照
+        for name in cls.ARRAYS:
+            if name not in cls.CATEGORIES:
+                arrays[name] = [part.arrays[name] for part in parts]
+        return cls(**names, **{name: np.concatenate(values) for name, values in arrays.items()})
+
+    def take(self, mask: np.ndarray) -> 'RecordColumns':
+        return RecordColumns(self.types, self.sources, self.stages,
+                             **{name: values[mask] for name, values in self.arrays.items()})
+
+    def day_keys(self) -> tuple:
+        """開始時刻のホームタイムゾーンでの日付キー（YYYYMMDD）と有効フラグ"""
+        local, valid = DEFAULT_BUCKETER.localize(self.start_wall, self.start_offset.astype(np.int64),
+                                                 self.start_has_offset, self.start_valid)
+        return DEFAULT_BUCKETER.keys_from_local(local, valid)
+
+    def start_strings(self, rows: np.ndarray) -> List[str]:
+        return format_timestamps(self.start_wall[rows], self.start_offset[rows], self.start_has_offset[rows])
+
+    def end_strings(self, rows: np.ndarray) -> List[str]:
+        return format_timestamps(self.end_wall[rows], self.end_offset[rows], self.end_has_offset[rows])
+
+
+class RecordCache:
+    """書き出しごとの記録キャッシュ（reports/record_cache.npz）"""
+
+    def __init__(self, reports_dir: str = "reports"):
+        self.reports_dir = Path(reports_dir)
+        self.cache_file = self.reports_dir / "record_cache.npz"
+
+    @staticmethod
+    def _meta(fingerprint: str, target_metrics: Dict[str, str], cutoff_date: dt.date) -> dict:
+        return {
+            'fingerprint': fingerprint,
+            'types': sorted(target_metrics),
+            'cutoff_date': cutoff_date.isoformat(),
+            'home_timezone': DEFAULT_BUCKETER.home_timezone,
+            'day_start_seconds': DEFAULT_BUCKETER.day_start_seconds,
+        }
+
+    def load(self, fingerprint: str, target_metrics: Dict[str, str], cutoff_date: dt.date) -> Optional[RecordColumns]:
+        """条件を満たすキャッシュ（同じ書き出し・対象 type を含む・基準日が同じか前・同じ日付の区切り）"""
+        if not self.cache_file.exists():
+            return None
+        try:
+            with np.load(self.cache_file, allow_pickle=False) as data:
+                meta = json.loads(str(data['meta']))
+                if meta.get('fingerprint') != fingerprint \
+                        or not set(target_metrics) <= set(meta.get('types', [])) \
+                        or meta.get('cutoff_date', '9999-12-31') > cutoff_date.isoformat() \
+                        or meta.get('home_timezone') != DEFAULT_BUCKETER.home_timezone \
+                        or meta.get('day_start_seconds') != DEFAULT_BUCKETER.day_start_seconds:
+                    return None
+                return RecordColumns(**{category: data[category].tolist() for category in RecordColumns.CATEGORIES.values()},
+                                     **{name: data[name] for name in RecordColumns.ARRAYS})
+        except Exception as e:
+            print(f"[ERROR] 記録キャッシュ読み込みエラー: {e}")
+            return None
+
+    def save(self, columns: RecordColumns, fingerprint: str, target_metrics: Dict[str, str], cutoff_date: dt.date):
+        try:
+            self.reports_dir.mkdir(parents=True, exist_ok=True)
+            temp_path = self.cache_file.with_name('record_cache.tmp.npz')
+            np.savez_compressed(
+                temp_path,
+                meta=np.array(json.dumps(self._meta(fingerprint, target_metrics, cutoff_date))),
+                **{category: np.array(getattr(columns, category), dtype=str)
+                   for category in RecordColumns.CATEGORIES.values()},
+                **columns.arrays,
+            )
+            temp_path.replace(self.cache_file)
+            print(f"[INFO] 記録キャッシュ保存: {len(columns):,} 件 ({self.cache_file})")
+        except Exception as e:
+            print(f"[ERROR] 記録キャッシュ保存エラー: {e}")
@@ -0,0 +1,142 @@
+"""
+Rollup Tables - 週次（ISO週）・月次の集計テーブル
+全指標の sum / mean / count / min / max を期間ごとに保持する集計CSVを、
+日次データの取り込みごとに変更のあった期間だけ再集計して更新する。
+集計ビューはこのテーブルを参照するため、日次データを走査しない
+"""
+
+import pandas as pd
+import numpy as np
+from pathlib import Path
+
+
+class RollupTables:
+    """週次・月次ロールアップの差分更新と参照"""
+
+    PERIODS = {
+        'week': '週次集計データ.csv',
+        'month': '月次集計データ.csv',
+    }
+    STATS = ('sum', 'mean', 'count', 'min', 'max')
+    KEY_COLUMNS = ['period', 'start_date', 'end_date', 'days', 'source_hash']
+
+    def __init__(self, reports_dir: str = "reports"):
+        self.reports_dir = Path(reports_dir)
+
+    def table_path(self, period: str) -> Path:
+        if period not in self.PERIODS:
+            raise ValueError(f"未対応の集計期間です: {period}")
+        return self.reports_dir / self.PERIODS[period]
+
+    def _labels(self, dates: pd.Series, period: str) -> tuple:
+        """日付 → (期間ラベル, 期間開始日, 期間終了日)"""
+        if period == 'week':
+            iso = dates.dt.isocalendar()
+            labels = iso['year'].astype(str) + '-W' + iso['week'].astype(str).str.zfill(2)
+            starts = dates - pd.to_timedelta(dates.dt.dayofweek, unit='D')
+            ends = starts + pd.Timedelta(days=6)
+        else:
+            labels = dates.dt.strftime('%Y-%m')
+            starts = dates.dt.to_period('M').dt.start_time
+            ends = dates.dt.to_period('M').dt.end_time.dt.normalize()
+        return labels, starts, ends
+
+    def _metrics(self, df: pd.DataFrame) -> list:
+        return [col for col in df.columns if col != 'date' and df[col].dtype in ['float64', 'int64']]
+
+    def _period_hashes(self, df: pd.DataFrame, metrics: list, labels: pd.Series) -> pd.Series:
+        """期間ごとの入力ハッシュ（行ハッシュの XOR。日付を含むため順序非依存で衝突しにくい）"""
+        row_hashes = pd.util.hash_pandas_object(df[['date'] + metrics], index=False).to_numpy()
+        order = np.argsort(labels.to_numpy(), kind='stable')
+        sorted_labels = labels.to_numpy()[order]
+        boundaries = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        combined = np.bitwise_xor.reduceat(row_hashes[order], boundaries)
+        return pd.Series([format(int(h), '016x') for h in combined], index=sorted_labels[boundaries])
+
+    def _aggregate(self, df: pd.DataFrame, metrics: list, labels: pd.Series,
+                   starts: pd.Series, ends: pd.Series) -> pd.DataFrame:
+        """期間ごとの全指標集計（1回の group-by）"""
+        grouped = df[metrics].groupby(labels.to_numpy())
+        stats = grouped.agg(list(self.STATS))
+        stats.columns = [f'{metric}_{stat}' for metric, stat in stats.columns]
+        stats = stats.round(2)
+
+        bounds = pd.DataFrame({'start_date': starts.dt.strftime('%Y-%m-%d').to_numpy(),
+                               'end_date': ends.dt.strftime('%Y-%m-%d').to_numpy(),
+                               'label': labels.to_numpy()}).groupby('label').first()
+        result = bounds.join(grouped.size().rename('days')).join(stats)
+        result.index.name = 'period'
+        return result.reset_index()
+
+    def load(self, period: str) -> pd.DataFrame:
+        path = self.table_path(period)
+        if not path.exists():
+            return pd.DataFrame(columns=self.KEY_COLUMNS)
+        return pd.read_csv(path, encoding='utf-8-sig', dtype={'source_hash': str})
+
+    def update(self, daily_df: pd.DataFrame) -> dict:
+        """入力が変わった期間だけ再集計してテーブルを保存
+
+        Returns:
+            {期間種別: 更新した期間数}
+        """
+        if daily_df.empty:
+            return {}
+
+        df = daily_df.copy()
+        df['date'] = pd.to_datetime(df['date'])
+        df = df.sort_values('date').reset_index(drop=True)
+        metrics = self._metrics(df)
+        updated = {}
+
+        for period in self.PERIODS:
+            labels, starts, ends = self._labels(df['date'], period)
+            hashes = self._period_hashes(df, metrics, labels)
+
+            existing = self.load(period)
+            expected_columns = [f'{m}_{stat}' for m in metrics for stat in self.STATS]
+            if not existing.empty and all(col in existing.columns for col in expected_columns):
+                previous = existing.set_index('period')['source_hash']
+                changed = hashes[hashes != previous.reindex(hashes.index)].index
+                kept = existing[existing['period'].isin(hashes.index) & ~existing['period'].isin(changed)]
+            else:
+                changed = hashes.index
+                kept = pd.DataFrame(columns=existing.columns)
+
+            if len(changed) == 0 and len(kept) == len(existing):
+                updated[period] = 0
+                continue
+
+            mask = labels.isin(changed).to_numpy()
+            fresh = self._aggregate(df[mask], metrics, labels[mask], starts[mask], ends[mask])
+            fresh.insert(4, 'source_hash', hashes.reindex(fresh['period']).to_numpy())
+
+            table = pd.concat([kept, fresh], ignore_index=True) if not kept.empty else fresh
+            table = table.sort_values('start_date').reset_index(drop=True)
+            table.to_csv(self.table_path(period), index=False, encoding='utf-8-sig')
+            updated[period] = len(changed)
+
+        print(f"[INFO] 週次・月次集計更新: 週{updated.get('week', 0)}件 / 月{updated.get('month', 0)}件")
+        return updated
+
+    def query(self, period: str, metric: str = None, start_date=None, end_date=None) -> list:
+        """集計行の一覧（metric 指定時はその指標の統計のみ、期間は開始日で絞り込み）"""
+        table = self.load(period)
+        if table.empty:
+            return []
+
+        if start_date is not None:
+            table = table[table['end_date'] >= str(pd.to_datetime(start_date).date())]
+        if end_date is not None:
+            table = table[table['start_date'] <= str(pd.to_datetime(end_date).date())]
+
+        columns = ['period', 'start_date', 'end_date', 'days']
+        if metric is not None:
+            stat_columns = [f'{metric}_{stat}' for stat in self.STATS]
+            if not all(col in table.columns for col in stat_columns):
+                raise KeyError(f"指標が見つかりません: {metric}")
+            table = table[columns + stat_columns].rename(columns=dict(zip(stat_columns, self.STATS)))
+        else:
+            table = table.drop(columns=['source_hash'])
+
+        return table.astype(object).where(table.notna(), None).to_dict('records')
@@ -0,0 +1,139 @@
+"""
+Weekday Seasonality - 曜日効果の分解と季節調整系列
+各指標を「7日トレンド＋曜日効果＋残差」に分解し、曜日効果を除いた系列（{指標}_deseason）を
+移動平均データに追加する。曜日効果は各日より前の直近8週の同曜日残差の中央値（頑健推定）で、
+全指標・全曜日を1回の処理で計算する。因果的な推定のため、入力が変わった行以降のみ再計算する
+"""
+
+import pandas as pd
+import numpy as np
+
+
+class WeekdaySeasonality:
+    """頑健な曜日平均モデルによる季節調整"""
+
+    DEFAULT_METRICS = [
+        '摂取カロリー_kcal', '消費カロリー_kcal', 'カロリー収支_kcal', '活動カロリー_kcal',
+        '歩数', '体重_kg', '体脂肪量_kg',
+    ]
+    WEEKDAY_LABELS = ['月', '火', '水', '木', '金', '土', '日']
+
+    def __init__(self, metrics: list = None, weeks: int = 8, min_weeks: int = 3, trend_min_days: int = 5):
+        self.metrics = metrics or self.DEFAULT_METRICS
+        self.weeks = weeks
+        self.min_weeks = min_weeks
+        self.trend_min_days = trend_min_days
+
+    def column_name(self, metric: str) -> str:
+        return f'{metric}_deseason'
+
+    @property
+    def lookback_days(self) -> int:
+        """1日分の推定に必要な過去日数（トレンド7日＋同曜日weeks週＋1週）"""
+        return (self.weeks + 2) * 7
+
+    def _calendar(self, df: pd.DataFrame, metrics: list) -> pd.DataFrame:
+        """暦日で連続化した指標フレーム"""
+        frame = df[['date'] + metrics].copy()
+        frame['date'] = pd.to_datetime(frame['date'])
+        frame = frame.drop_duplicates('date', keep='last').set_index('date').sort_index()
+        frame = frame.apply(pd.to_numeric, errors='coerce')
+        return frame.reindex(pd.date_range(frame.index.min(), frame.index.max(), freq='D'))
+
+    def weekday_effects(self, df: pd.DataFrame) -> tuple:
+        """各日時点の曜日効果（合計0に正規化）
+
+        Returns:
+            (暦日フレーム T×M, 効果配列 7×T×M)。効果が推定できない箇所は NaN
+        """
+        metrics = [m for m in self.metrics if m in df.columns]
+        calendar = self._calendar(df, metrics)
+        values = calendar.to_numpy(dtype=float)
+
+        # トレンド（直近7日平均）からの残差
+        trend = calendar.rolling(7, min_periods=self.trend_min_days).mean()
+        residuals = calendar - trend
+
+        # 曜日ごとに、当日より前の直近weeks週の残差中央値を日付方向へ前方補完
+        weekdays = calendar.index.dayofweek
+        effects = np.full((7,) + values.shape, np.nan)
+        for day in range(7):
+            same_day = residuals[weekdays == day]
+            estimate = same_day.rolling(self.weeks, min_periods=self.min_weeks).median().shift(1)
+            effects[day] = estimate.reindex(calendar.index).ffill().to_numpy(dtype=float)
+
+        # 7曜日すべて推定できた日のみ、平均0に正規化
+        complete = ~np.isnan(effects).any(axis=0)
+        effects = np.where(complete[None], effects - effects.mean(axis=0, keepdims=True), np.nan)
+        return calendar, effects
+
+    def deseasonalize(self, df: pd.DataFrame) -> pd.DataFrame:
+        """曜日効果を除いた系列（元の行順・行数。効果未推定の日は元の値）"""
+        metrics = [m for m in self.metrics if m in df.columns]
+        if df.empty or not metrics:
+            return pd.DataFrame(index=df.index)
+
+        calendar, effects = self.weekday_effects(df)
+        rows = np.arange(len(calendar))
+        today_effect = effects[calendar.index.dayofweek, rows]
+        adjusted = calendar - np.nan_to_num(today_effect, nan=0.0)
+
+        dates = pd.to_datetime(df['date'])
+        result = adjusted.reindex(dates).set_axis(df.index)
+        return result.rename(columns=self.column_name)
+
+    def add_columns(self, ma_df: pd.DataFrame, previous_df: pd.DataFrame = None) -> pd.DataFrame:
+        """季節調整列（{指標}_deseason）を追加
+
+        Args:
+            ma_df: 移動平均計算済みデータ（日付昇順）
+            previous_df: 前回保存した移動平均データ。入力が変わっていない先頭行は
+                         保存済みの値を再利用し、変更行以降のみ必要な過去分と合わせて再計算する
+        """
+        ma_df = ma_df.copy()
+        metrics = [m for m in self.metrics if m in ma_df.columns]
+        if ma_df.empty or not metrics:
+            return ma_df
+
+        columns = [self.column_name(m) for m in metrics]
+        dates = pd.to_datetime(ma_df['date']).to_numpy(dtype='datetime64[D]')
+        inputs = ma_df[metrics].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        first_row = 0
+
+        # 差分更新: 入力が前回と一致する先頭行を特定
+        if previous_df is not None and not previous_df.empty \
+                and all(col in previous_df.columns for col in columns + metrics):
+            prev_dates = pd.to_datetime(previous_df['date']).to_numpy(dtype='datetime64[D]')
+            prev_inputs = previous_df[metrics].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+            common = min(len(prev_dates), len(dates))
+            same = (prev_dates[:common] == dates[:common]) & (
+                (prev_inputs[:common] == inputs[:common])
+                | (np.isnan(prev_inputs[:common]) & np.isnan(inputs[:common]))).all(axis=1)
+            first_row = common if same.all() else int(np.argmin(same))
+
+        result = np.full((len(ma_df), len(metrics)), np.nan)
+        if first_row > 0:
+            result[:first_row] = previous_df[columns].to_numpy(dtype=float)[:first_row]
+        if first_row < len(ma_df):
+            # 変更行の推定に必要な過去分だけを入力として再計算
+            context_start = np.searchsorted(dates, dates[first_row] - np.timedelta64(self.lookback_days, 'D'))
+            adjusted = self.deseasonalize(ma_df.iloc[context_start:])
+            result[first_row:] = adjusted[columns].to_numpy(dtype=float)[first_row - context_start:]
+
+        for k, col in enumerate(columns):
+            ma_df[col] = np.round(result[:, k], 2)
+
+        print(f"[INFO] 曜日効果の季節調整完了: {len(ma_df) - first_row}行更新")
+        return ma_df
+
+    def latest_effects(self, df: pd.DataFrame) -> dict:
+        """最新日時点の曜日効果 {指標: {曜日: 効果}}"""
+        if df.empty:
+            return {}
+        calendar, effects = self.weekday_effects(df)
+        latest = effects[:, -1, :]
+        return {
+            metric: {label: (None if np.isnan(latest[d, k]) else round(float(latest[d, k]), 2))
+                     for d, label in enumerate(self.WEEKDAY_LABELS)}
+            for k, metric in enumerate(calendar.columns)
+        }
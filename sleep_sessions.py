@@ -0,0 +1,202 @@
+"""
+Sleep Sessions - 睡眠区間の統合と睡眠セッション再構成（XML・HAE共通）
+複数ソース（Oura・Apple Watch・iPhone）の睡眠ステージ記録は時間が重なるため、
+単純合計では二重計上になる。全記録の境界で時間軸を区切り、各区間を
+最優先ステージ（深い > レム > コア > 睡眠(詳細なし) > 覚醒 > ベッド内）に割り当てたうえで、
+短い中断をはさむ区間を1つのセッションにまとめ、起床日に帰属させる。
+境界の整列が O(n log n)、以降は配列演算のみで複数年分の記録もまとめて処理する
+"""
+
+from typing import Dict, List, Any
+import numpy as np
+import pandas as pd
+from day_bucketing import DayBucketer, DEFAULT_BUCKETER
+
+
+class SleepSessionEngine:
+    """睡眠ステージ記録 → 睡眠セッション・日別集計"""
+
+    # 優先順（重なった区間は先頭のステージとして扱う）
+    STAGES = ['deep', 'rem', 'core', 'unspecified', 'awake', 'inbed']
+    ASLEEP_STAGES = ['deep', 'rem', 'core', 'unspecified']
+    # ステージ名の判定順（"AsleepREM" のように複数語を含むため、具体的なステージから照合）
+    STAGE_PATTERNS = [('deep', 'deep'), ('rem', 'rem'), ('core', 'core'), ('awake', 'awake'),
+                      ('inbed', 'inbed'), ('asleep', 'unspecified'), ('unspecified', 'unspecified')]
+    MAX_RECORD_HOURS = 24.0
+
+    # HAE集計済み形式（1晩1点）の項目名
+    SUMMARY_FIELDS = {'deep': 'deep', 'rem': 'rem', 'core': 'core', 'awake': 'awake', 'inbed': 'inBed'}
+    SOURCE_PRIORITY = ['Oura', 'Apple Watch', 'iPhone']
+
+    def __init__(self, session_gap_minutes: int = 60, attribution: str = 'wake', evening_cutoff_hour: int = 18,
+                 day_bucketer: DayBucketer = None):
+        """
+        Args:
+            session_gap_minutes: この長さ以下の中断は同じセッションとして結合
+            attribution: 'wake' = 起床（セッション終了）日に帰属 /
+                         'evening' = 開始日に帰属し、evening_cutoff_hour 以降の開始は翌日扱い
+            evening_cutoff_hour: attribution='evening' の翌日扱いの境界時刻
+            day_bucketer: 時刻をホームタイムゾーンの現地時刻に直す変換（既定は環境変数の設定）
+        """
+        if attribution not in ('wake', 'evening'):
+            raise ValueError(f"未対応の帰属方法です: {attribution}")
+        self.session_gap = np.int64(session_gap_minutes * 60)
+        self.attribution = attribution
+        self.evening_cutoff_hour = evening_cutoff_hour
+        self.day_bucketer = day_bucketer or DEFAULT_BUCKETER
+
+    # ===== 入力の正規化 =====
+
+    def stage_codes(self, values) -> np.ndarray:
+        """ステージ名（XML: HKCategoryValueSleepAnalysisAsleepREM / HAE: "REM", "In Bed" 等）→ コード（不明は-1）"""
+        inverse, unique_values = pd.factorize(pd.Series(values, dtype=object).fillna(''))
+        codes = []
+        for value in unique_values:
+            normalized = str(value).lower().replace(' ', '').replace('_', '')
+            stage = next((stage for pattern, stage in self.STAGE_PATTERNS if pattern in normalized), None)
+            codes.append(self.STAGES.index(stage) if stage else -1)
+        return np.array(codes, dtype=np.int64)[inverse]
+
+    def to_seconds(self, timestamps) -> np.ndarray:
+        """"YYYY-MM-DD HH:MM:SS +0900" 形式の配列 → ホームタイムゾーンの現地時刻の秒（解釈できなければ NaT 相当の最小値）"""
+        seconds, valid = self.day_bucketer.local_seconds(timestamps)
+        return np.where(valid, seconds, np.iinfo(np.int64).min)
+
+    def intervals(self, starts, ends, stages) -> tuple:
+        """開始・終了・ステージ名の配列を検証済みの (開始秒, 終了秒, ステージコード) に変換"""
+        start = self.to_seconds(starts)
+        end = self.to_seconds(ends)
+        code = self.stage_codes(stages)
+        invalid = np.iinfo(np.int64).min
+        keep = (start != invalid) & (end != invalid) & (code >= 0) \
+            & (end > start) & (end - start <= self.MAX_RECORD_HOURS * 3600)
+        return start[keep], end[keep], code[keep]
+
+    # ===== セッション再構成 =====
+
+    def sessions(self, starts, ends, stages) -> pd.DataFrame:
+        """睡眠セッション一覧（1行1セッション、ステージ別時間つき）
+
+        Returns:
+            start, end, date（帰属日）, asleep_hours, {stage}_hours の DataFrame
+        """
+        start, end, code = self.intervals(starts, ends, stages)
+        columns = ['start', 'end', 'date', 'asleep_hours'] + [f'{stage}_hours' for stage in self.STAGES]
+        if len(start) == 0:
+            return pd.DataFrame(columns=columns)
+
+        # 全記録の境界で時間軸を区切る（1回の整列 O(n log n)、各記録の境界番号は順位から求める）
+        edges = np.concatenate([start, end])
+        order = np.argsort(edges, kind='stable')
+        sorted_edges = edges[order]
+        distinct = np.r_[True, sorted_edges[1:] != sorted_edges[:-1]]
+        bounds = sorted_edges[distinct]
+        rank = np.empty(len(edges), dtype=np.int64)
+        rank[order] = np.cumsum(distinct) - 1
+        first, last = rank[:len(start)], rank[len(start):]
+        n_segments = len(bounds) - 1
+
+        # ステージごとの被覆数（開始+1・終了-1 の累積和）から、各区間の最優先ステージを決定
+        n_stages = len(self.STAGES)
+        events = np.zeros((n_stages, len(bounds) + 1), dtype=np.int64)
+        np.add.at(events, (code, first), 1)
+        np.add.at(events, (code, last), -1)
+        covered = np.cumsum(events, axis=1)[:, :n_segments] > 0
+        has_stage = covered.any(axis=0)
+        segment_stage = np.where(has_stage, np.argmax(covered, axis=0), -1)
+
+        # 被覆のある区間をつなぎ、中断が session_gap を超えたら新しいセッション
+        idx = np.flatnonzero(has_stage)
+        seg_start, seg_end = bounds[idx], bounds[idx + 1]
+        seg_stage = segment_stage[idx]
+        new_session = np.r_[True, seg_start[1:] - seg_end[:-1] > self.session_gap]
+        session = np.cumsum(new_session) - 1
+        n_sessions = int(session[-1]) + 1
+
+        lengths = (seg_end - seg_start).astype(float)
+        totals = np.bincount(session * n_stages + seg_stage, weights=lengths,
+                             minlength=n_sessions * n_stages).reshape(n_sessions, n_stages) / 3600
+        session_start = seg_start[new_session]
+        session_end = np.maximum.reduceat(seg_end, np.flatnonzero(new_session))
+
+        result = pd.DataFrame({
+            'start': session_start.astype('datetime64[s]'),
+            'end': session_end.astype('datetime64[s]'),
+        })
+        result['date'] = self._attribute(result['start'], result['end'])
+        asleep_index = [self.STAGES.index(stage) for stage in self.ASLEEP_STAGES]
+        result['asleep_hours'] = totals[:, asleep_index].sum(axis=1)
+        for k, stage in enumerate(self.STAGES):
+            result[f'{stage}_hours'] = totals[:, k]
+
+        # 覚醒・ベッド内のみのセッションは除外
+        result = result[result['asleep_hours'] > 0].reset_index(drop=True)
+        return result[columns].round({col: 3 for col in columns[3:]})
+
+    def _attribute(self, start: pd.Series, end: pd.Series) -> pd.Series:
+        """セッションの帰属日"""
+        if self.attribution == 'wake':
+            return end.dt.normalize()
+        shifted = start.dt.hour >= self.evening_cutoff_hour
+        return start.dt.normalize() + pd.to_timedelta(shifted.astype(int), unit='D')
+
+    def daily_summary(self, sessions: pd.DataFrame) -> pd.DataFrame:
+        """帰属日ごとの睡眠時間・ステージ別時間・セッション数"""
+        if sessions.empty:
+            return pd.DataFrame(columns=['date', 'sessions', 'asleep_hours'] + [f'{s}_hours' for s in self.STAGES])
+        hours = [col for col in sessions.columns if col.endswith('_hours')]
+        grouped = sessions.groupby('date')
+        summary = grouped[hours].sum().round(3)
+        summary.insert(0, 'sessions', grouped.size())
+        return summary.reset_index()
+
+    # ===== 入力形式別 =====
+
+    def from_records(self, records: List[Dict[str, Any]]) -> pd.DataFrame:
+        """{'start', 'end', 'stage'} 形式の記録リスト（XMLの SleepAnalysis Record 等）からセッション一覧"""
+        if not records:
+            return self.sessions([], [], [])
+        return self.sessions([r['start'] for r in records], [r['end'] for r in records],
+                             [r['stage'] for r in records])
+
+    def daily_hours_from_hae(self, points: List[Dict[str, Any]], summary_factor: float = 1.0) -> Dict[str, float]:
+        """HAE sleep_analysis のデータポイント → {帰属日: 睡眠時間(h)}
+
+        ステージ別の区間形式（startDate/endDate/value）はセッション再構成、
+        1晩1点の集計済み形式（asleep/totalSleep・core・deep・rem）は日ごとに優先ソースの1点を採用
+        （summary_factor: 集計済み形式の値を時間に換算する係数。分単位なら 1/60）
+        """
+        is_interval = [bool(p.get('startDate') and p.get('endDate') and p.get('value')) for p in points]
+        intervals = [p for p, flag in zip(points, is_interval) if flag]
+        summaries = [p for p, flag in zip(points, is_interval) if not flag and p.get('date')]
+
+        result = {}
+        if summaries:
+            summary = self.hae_summary_daily(summaries)
+            result.update(zip(summary['date'].dt.strftime('%Y-%m-%d'),
+                              (summary['asleep_hours'] * summary_factor).tolist()))
+        if intervals:
+            sessions = self.sessions([p['startDate'] for p in intervals], [p['endDate'] for p in intervals],
+                                     [p['value'] for p in intervals])
+            daily = self.daily_summary(sessions)
+            result.update(zip(pd.to_datetime(daily['date']).dt.strftime('%Y-%m-%d'), daily['asleep_hours'].tolist()))
+        return dict(sorted(result.items()))
+
+    def hae_summary_daily(self, points: List[Dict[str, Any]]) -> pd.DataFrame:
+        """HAE集計済み形式（1晩1点）を日ごとに1点へ（Oura > Apple Watch > iPhone > その他）"""
+        frame = pd.DataFrame({
+            'date': pd.to_datetime(pd.Series([str(p.get('date'))[:10] for p in points]), errors='coerce'),
+            'source': [p.get('source') or '' for p in points],
+        })
+        for stage, field in self.SUMMARY_FIELDS.items():
+            frame[f'{stage}_hours'] = pd.to_numeric(pd.Series([p.get(field) for p in points]), errors='coerce')
+        asleep = pd.to_numeric(pd.Series([p.get('asleep', p.get('totalSleep', p.get('qty'))) for p in points]),
+                               errors='coerce')
+        staged = frame[['deep_hours', 'rem_hours', 'core_hours']].sum(axis=1, min_count=1)
+        frame['asleep_hours'] = asleep.fillna(staged)
+
+        frame['tier'] = [next((k for k, name in enumerate(self.SOURCE_PRIORITY) if name in source),
+                              len(self.SOURCE_PRIORITY)) for source in frame['source']]
+        frame = frame.dropna(subset=['date', 'asleep_hours'])
+        frame = frame.sort_values(['date', 'tier'], kind='stable').drop_duplicates('date', keep='first')
+        return frame.drop(columns=['tier']).reset_index(drop=True)
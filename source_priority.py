@@ -0,0 +1,136 @@
+"""
+Source Priority - データソース優先順位による重複除去（XML・HAE共通）
+同じ指標を複数デバイスが記録すると単純合計では二重計上になるため、
+日ごとに最優先のソース群のみを採用する。ルールは宣言的に定義し、
+(日付, ソース階層) の group-by を1回の bincount で計算する
+
+既定ルール（unified_processor の従来ロジックと同一）:
+- 歩数・活動カロリー: Oura > Apple Watch > iPhone の最優先ソースを合計、いずれもなければ最初の記録
+- 基礎代謝: RENPHO の最初の値、なければ iPhone の合計、いずれもなければ 0
+
+HAE用ルール（HAE_RULES）: HAEのデータポイントは分単位・記録単位の値のため、
+どの階層にも該当しないソース（Garmin 等）は合計し、基礎代謝は Apple Watch の合計も採用する
+"""
+
+from typing import Dict, List, Any
+import numpy as np
+
+
+class SourcePriority:
+    """(日付, ソース) 単位の優先順位選択"""
+
+    # tiers: (ソース名に含まれる文字列, 集計方法) の優先順リスト
+    # fallback: どの階層にも該当しない日の扱い（'first': 最初の記録 / 'sum': 合計 / 'zero': 0）
+    DEFAULT_RULES = {
+        '歩数': {
+            'tiers': [('Oura', 'sum'), ('Apple Watch', 'sum'), ('iPhone', 'sum')],
+            'fallback': 'first',
+        },
+        '活動カロリー_kcal': {
+            'tiers': [('Oura', 'sum'), ('Apple Watch', 'sum'), ('iPhone', 'sum')],
+            'fallback': 'first',
+        },
+        '基礎代謝_kcal': {
+            'tiers': [('RENPHO', 'first'), ('iPhone', 'sum')],
+            'fallback': 'zero',
+        },
+    }
+    HAE_RULES = {
+        '歩数': {
+            'tiers': [('Oura', 'sum'), ('Apple Watch', 'sum'), ('iPhone', 'sum')],
+            'fallback': 'sum',
+        },
+        '活動カロリー_kcal': {
+            'tiers': [('Oura', 'sum'), ('Apple Watch', 'sum'), ('iPhone', 'sum')],
+            'fallback': 'sum',
+        },
+        '基礎代謝_kcal': {
+            'tiers': [('RENPHO', 'first'), ('Apple Watch', 'sum'), ('iPhone', 'sum')],
+            'fallback': 'sum',
+        },
+    }
+    AGGREGATIONS = ('sum', 'first')
+    FALLBACKS = ('first', 'sum', 'zero')
+
+    def __init__(self, rules: Dict[str, Dict[str, Any]] = None):
+        self.rules = rules if rules is not None else self.DEFAULT_RULES
+        for column, rule in self.rules.items():
+            if any(agg not in self.AGGREGATIONS for _, agg in rule['tiers']) \
+                    or rule.get('fallback', 'first') not in self.FALLBACKS:
+                raise ValueError(f"優先順位ルールの集計方法が不正です: {column}")
+
+    def has_rule(self, column: str) -> bool:
+        return column in self.rules
+
+    def source_tiers(self, sources, column: str) -> np.ndarray:
+        """各記録のソース階層（0が最優先、該当なしは階層数）。ソース名の照合はユニーク値のみ"""
+        tiers = self.rules[column]['tiers']
+        unique_sources, inverse = np.unique(np.asarray(sources, dtype=str), return_inverse=True)
+        unique_tiers = np.array([
+            next((k for k, (pattern, _) in enumerate(tiers) if pattern in source), len(tiers))
+            for source in unique_sources
+        ], dtype=np.int64)
+        return unique_tiers[inverse]
+
+    def select(self, keys, sources, values, column: str, first_values=None) -> tuple:
+        """日付ごとに最優先ソースの値を集計
+
+        Args:
+            keys: 各記録の日付キー（日付型・整数など並べ替え可能な値）
+            sources: 各記録のソース名
+            values: 各記録の値
+            column: ルール名（CSVカラム名）
+            first_values: 入力が記録ではなく (日付, ソース) ごとの部分集計の場合、各行の最初の記録の値
+                          （values は行ごとの合計、行は最初の記録の出現順）
+
+        Returns:
+            (昇順のユニーク日付キー, 日別の値, 日別の採用階層名)
+        """
+        rule = self.rules[column]
+        tiers = rule['tiers']
+        fallback = rule.get('fallback', 'first')
+        values = np.asarray(values, dtype=float)
+        if len(values) == 0:
+            return np.asarray(keys), values, []
+
+        unique_keys, day = np.unique(np.asarray(keys), return_inverse=True)
+        tier = self.source_tiers(sources, column)
+
+        # (日付, 階層) の group-by: 合計・件数・最初の記録位置
+        n_days, n_tiers = len(unique_keys), len(tiers) + 1
+        group = day * n_tiers + tier
+        sums = np.bincount(group, weights=values, minlength=n_days * n_tiers).reshape(n_days, n_tiers)
+        counts = np.bincount(group, minlength=n_days * n_tiers).reshape(n_days, n_tiers)
+        first = np.full(n_days * n_tiers, len(values))
+        np.minimum.at(first, group, np.arange(len(values)))
+        first = first.reshape(n_days, n_tiers)
+
+        # 日ごとに記録のある最優先階層を採用
+        best = np.argmax(counts > 0, axis=1)
+        rows = np.arange(n_days)
+        aggregations = [agg for _, agg in tiers] + [fallback]
+        use_sum = np.array([agg == 'sum' for agg in aggregations])[best]
+        use_zero = np.array([agg == 'zero' for agg in aggregations])[best]
+        firsts = values if first_values is None else np.asarray(first_values, dtype=float)
+        first_selected = firsts[np.minimum(first[rows, best], len(values) - 1)]
+        selected = np.where(use_sum, sums[rows, best], first_selected)
+        selected = np.where(use_zero, 0.0, selected)
+
+        labels = [pattern for pattern, _ in tiers] + ['その他']
+        return unique_keys, selected, [labels[b] for b in best]
+
+    def select_by_date(self, keys, sources, values, column: str, first_values=None) -> Dict[Any, float]:
+        """select の結果を {日付キー: 値} で返す"""
+        unique_keys, selected, _ = self.select(keys, sources, values, column, first_values)
+        return dict(zip(np.asarray(unique_keys).tolist(), selected.tolist()))
+
+    def select_records(self, records: List[Dict[str, Any]], column: str) -> Dict[Any, float]:
+        """{'date', 'source', 'value'} 形式の記録リストから日別の値を選択"""
+        if not records:
+            return {}
+        return self.select_by_date(
+            [record['date'] for record in records],
+            [record.get('source') or '' for record in records],
+            [record['value'] for record in records],
+            column,
+        )
@@ -0,0 +1,148 @@
+"""
+TDEE Estimator - エネルギー収支モデルによる実消費カロリー推定
+摂取カロリーと平滑化体重の変化から、各日を末尾とする期間の実消費カロリーを逆算する
+
+    推定消費 = 期間平均摂取 - 体重変化(kg) × 7200kcal / 期間日数
+
+デバイス推定の消費カロリー（基礎代謝＋活動）と並べて比較できるよう、
+期間ごとの推定列を移動平均データに追加する（入力が変わった行以降のみ再計算）
+"""
+
+import pandas as pd
+import numpy as np
+
+
+class TDEEEstimator:
+    """摂取量と体重トレンドからの消費カロリー逆算"""
+
+    ENERGY_PER_KG = 7200  # 体組織1kgあたりのエネルギー（脂肪1kg = 7200kcal と同基準）
+
+    def __init__(self, windows: tuple = (14, 28), min_intake_ratio: float = 0.7,
+                 mass_column: str = '体重_kg_kf', fallback_mass_column: str = '体重_kg_ma7',
+                 intake_column: str = '摂取カロリー_kcal', device_column: str = '消費カロリー_kcal'):
+        self.windows = tuple(windows)
+        # 期間内の摂取記録がこの割合未満なら推定しない（記録漏れによる過小評価を防止）
+        self.min_intake_ratio = min_intake_ratio
+        self.mass_column = mass_column
+        self.fallback_mass_column = fallback_mass_column
+        self.intake_column = intake_column
+        self.device_column = device_column
+
+    def column_name(self, window: int) -> str:
+        return f'推定消費カロリー_kcal_{window}d'
+
+    def _inputs(self, df: pd.DataFrame):
+        """(日付, 平滑化体重, 摂取カロリー, デバイス消費カロリー)"""
+        dates = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[D]')
+        mass_column = self.mass_column if self.mass_column in df.columns else self.fallback_mass_column
+
+        def column(name):
+            if name not in df.columns:
+                return np.full(len(df), np.nan)
+            return pd.to_numeric(df[name], errors='coerce').to_numpy(dtype=float)
+
+        return dates, column(mass_column), column(self.intake_column), column(self.device_column)
+
+    def _window_means(self, dates, values, lag_rows, rows):
+        """行 (lag_rows, rows] の有効値平均と件数（累積和で一括計算）"""
+        valid = ~np.isnan(values)
+        prefix_sum = np.concatenate([[0.0], np.cumsum(np.where(valid, values, 0.0))])
+        prefix_count = np.concatenate([[0], np.cumsum(valid)])
+        total = prefix_sum[rows + 1] - prefix_sum[lag_rows + 1]
+        count = prefix_count[rows + 1] - prefix_count[lag_rows + 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(count > 0, total / count, np.nan), count
+
+    def estimate(self, df: pd.DataFrame, first_row: int = 0) -> pd.DataFrame:
+        """first_row 以降の各行について期間別の推定消費カロリーを計算
+
+        Returns:
+            行ごとの {window}: 推定消費カロリー, device_{window}: デバイス消費カロリー平均
+        """
+        dates, mass, intake, device = self._inputs(df)
+        rows = np.arange(first_row, len(df))
+        result = {}
+
+        for window in self.windows:
+            # 期間開始時点（window日前以前で最新の行）
+            lag_rows = np.searchsorted(dates, dates[rows] - np.timedelta64(window, 'D'), side='right') - 1
+            has_lag = lag_rows >= 0
+            lag_rows = np.maximum(lag_rows, 0)
+            days = (dates[rows] - dates[lag_rows]).astype(float)
+
+            intake_mean, intake_count = self._window_means(dates, intake, lag_rows, rows)
+            device_mean, _ = self._window_means(dates, device, lag_rows, rows)
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                stored_per_day = (mass[rows] - mass[lag_rows]) * self.ENERGY_PER_KG / days
+                tdee = intake_mean - stored_per_day
+            enough = has_lag & (days > 0) & (intake_count >= self.min_intake_ratio * days)
+
+            result[window] = np.where(enough, tdee, np.nan)
+            result[f'device_{window}'] = np.where(has_lag, device_mean, np.nan)
+
+        return pd.DataFrame(result, index=rows)
+
+    def add_columns(self, ma_df: pd.DataFrame, previous_df: pd.DataFrame = None) -> pd.DataFrame:
+        """推定消費カロリー列（推定消費カロリー_kcal_{期間}d）を追加
+
+        Args:
+            ma_df: 移動平均・平滑化計算済みデータ（日付昇順）
+            previous_df: 前回保存した移動平均データ。入力が変わっていない先頭行は
+                         保存済みの推定値を再利用する
+        """
+        ma_df = ma_df.copy()
+        if ma_df.empty:
+            return ma_df
+
+        dates, mass, intake, device = self._inputs(ma_df)
+        inputs = np.column_stack([mass, intake, device])
+        columns = [self.column_name(w) for w in self.windows]
+        first_row = 0
+
+        # 差分更新: 入力が前回と一致する先頭行の推定値を再利用（各行は過去側にのみ依存）
+        if previous_df is not None and not previous_df.empty \
+                and all(col in previous_df.columns for col in columns):
+            prev_dates, prev_mass, prev_intake, prev_device = self._inputs(previous_df)
+            prev_inputs = np.column_stack([prev_mass, prev_intake, prev_device])
+            common = min(len(prev_dates), len(dates))
+            same = (prev_dates[:common] == dates[:common]) & (
+                (prev_inputs[:common] == inputs[:common])
+                | (np.isnan(prev_inputs[:common]) & np.isnan(inputs[:common]))).all(axis=1)
+            first_row = common if same.all() else int(np.argmin(same))
+
+        estimates = self.estimate(ma_df, first_row)
+        for window, col in zip(self.windows, columns):
+            values = np.full(len(ma_df), np.nan)
+            if first_row > 0:
+                values[:first_row] = previous_df[col].to_numpy(dtype=float)[:first_row]
+            values[first_row:] = np.round(estimates[window].to_numpy(), 0)
+            ma_df[col] = values
+
+        print(f"[INFO] 推定消費カロリー更新完了: {len(ma_df) - first_row}行更新")
+        return ma_df
+
+    def summarize(self, df: pd.DataFrame) -> dict:
+        """最新日時点のモデル推定とデバイス推定の比較"""
+        if df.empty:
+            return {}
+
+        latest = self.estimate(df, len(df) - 1).iloc[-1]
+        _, _, intake, _ = self._inputs(df)
+        recent_intake = intake[-7:]
+        intake_7d = float(np.nanmean(recent_intake)) if (~np.isnan(recent_intake)).any() else None
+
+        summary = {'energy_per_kg': self.ENERGY_PER_KG}
+        for window in self.windows:
+            tdee = latest[window]
+            device = latest[f'device_{window}']
+            summary[f'estimated_tdee_{window}d'] = None if pd.isna(tdee) else round(float(tdee), 0)
+            summary[f'device_tdee_{window}d'] = None if pd.isna(device) else round(float(device), 0)
+            summary[f'device_bias_{window}d'] = (round(float(device - tdee), 0)
+                                                 if not pd.isna(tdee) and not pd.isna(device) else None)
+
+        # 直近7日の摂取平均とモデル推定（最長期間）から見た1日あたり収支
+        reference = summary.get(f'estimated_tdee_{max(self.windows)}d')
+        summary['model_balance_7d_avg'] = (round(intake_7d - reference, 0)
+                                           if intake_7d is not None and reference is not None else None)
+        return summary
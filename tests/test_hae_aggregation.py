@@ -0,0 +1,81 @@
+import pytest
+
+from hae_aggregation import aggregate_metric_by_date, bucket_metrics_by_date
+from hae_data_converter import HAEDataConverter
+from source_priority import SourcePriority
+
+MAPPING = HAEDataConverter.METRIC_MAPPING
+
+
+def _points(day: str, values, source: str, hour: int = 8):
+    return [{'date': f'{day} {hour:02d}:{minute:02d}:00 +0900', 'qty': value, 'source': source}
+            for minute, value in enumerate(values)]
+
+
+def test_multi_day_payload_is_bucketed_per_date():
+    metrics = [
+        {'name': 'step_count', 'units': 'count',
+         'data': _points('2025-09-01', [100, 200], 'iPhone') + _points('2025-09-02', [300], 'iPhone')},
+        {'name': 'weight_body_mass', 'units': 'kg',
+         'data': [{'date': '2025-09-01 07:00:00 +0900', 'qty': 70.2},
+                  {'date': '2025-09-02 07:00:00 +0900', 'qty': 70.0},
+                  {'date': '2025-09-02 21:00:00 +0900', 'qty': 70.6}]},
+        {'name': 'dietary_energy', 'units': 'kJ',
+         'data': [{'date': '2025-09-02 12:00:00 +0900', 'qty': 4184.0}]},
+    ]
+    buckets = bucket_metrics_by_date(metrics, MAPPING)
+
+    assert list(buckets) == ['2025-09-01', '2025-09-02']
+    assert buckets['2025-09-01'] == {'歩数': 300.0, '体重_kg': 70.2}
+    assert buckets['2025-09-02']['歩数'] == 300.0
+    assert buckets['2025-09-02']['体重_kg'] == 70.6  # 非累積は最後の値
+    assert buckets['2025-09-02']['摂取カロリー_kcal'] == pytest.approx(1000.0)
+
+
+def test_utc_offsets_are_bucketed_by_home_day():
+    metric = {'name': 'step_count', 'units': 'count',
+              'data': [{'date': '2025-09-01 16:00:00 +0000', 'qty': 50, 'source': 'iPhone'}]}
+    assert aggregate_metric_by_date(metric, '歩数') == {'2025-09-02': 50.0}
+
+
+def test_steps_prefer_watch_over_phone_per_day():
+    metric = {'name': 'step_count', 'units': 'count',
+              'data': _points('2025-09-01', [1000, 2000], 'Apple Watch') + _points('2025-09-01', [2500], 'iPhone', 9)
+              + _points('2025-09-02', [700], 'iPhone')}
+    assert aggregate_metric_by_date(metric, '歩数') == {'2025-09-01': 3000.0, '2025-09-02': 700.0}
+
+
+def test_unmatched_source_minute_steps_are_summed():
+    metric = {'name': 'step_count', 'units': 'count', 'data': _points('2025-09-01', [500] * 10, 'Garmin Forerunner')}
+    assert aggregate_metric_by_date(metric, '歩数') == {'2025-09-01': 5000.0}
+
+
+def test_apple_watch_only_basal_energy_is_summed():
+    metric = {'name': 'basal_energy_burned', 'units': 'kcal', 'data': _points('2025-09-01', [800, 900], 'Apple Watch')}
+    assert aggregate_metric_by_date(metric, '基礎代謝_kcal') == {'2025-09-01': 1700.0}
+
+
+def test_renpho_basal_energy_takes_precedence():
+    metric = {'name': 'basal_energy_burned', 'units': 'kcal',
+              'data': _points('2025-09-01', [800, 900], 'Apple Watch') + _points('2025-09-01', [1550], 'RENPHO Health', 7)}
+    assert aggregate_metric_by_date(metric, '基礎代謝_kcal') == {'2025-09-01': 1550.0}
+
+
+def test_points_without_source_use_plain_daily_sum():
+    metric = {'name': 'active_energy', 'units': 'kcal',
+              'data': [{'date': '2025-09-01 08:00:00 +0900', 'qty': 10.5},
+                       {'date': '2025-09-01 09:00:00 +0900', 'qty': 4.5}]}
+    assert aggregate_metric_by_date(metric, '活動カロリー_kcal') == {'2025-09-01': 15.0}
+
+
+def test_xml_rules_are_unchanged():
+    rules = SourcePriority()
+    records = [{'date': '2025-09-01', 'source': 'Garmin', 'value': 500.0},
+               {'date': '2025-09-01', 'source': 'Garmin', 'value': 600.0}]
+    assert rules.select_records(records, '歩数') == {'2025-09-01': 500.0}
+    assert rules.select_records(records, '基礎代謝_kcal') == {'2025-09-01': 0.0}
+
+
+def test_unknown_units_are_skipped():
+    metric = {'name': 'weight_body_mass', 'units': 'stone', 'data': [{'date': '2025-09-01 07:00:00 +0900', 'qty': 11}]}
+    assert bucket_metrics_by_date([metric], MAPPING) == {}
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from health_analytics_engine import HealthAnalyticsEngine
+from health_backtest import HealthBacktester
+
+
+def _history(days: int = 70) -> pd.DataFrame:
+    """減量 → 停滞 の体組成データ（移動平均列つき）"""
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2025-06-01', periods=days, freq='D')
+    fat = np.concatenate([np.linspace(15.0, 13.0, 40), np.full(days - 40, 13.0)]) + rng.normal(0, 0.05, days)
+    rate = fat / 70 * 100
+    df = pd.DataFrame({'date': dates, '体脂肪量_kg': fat, '体脂肪率': rate, '筋肉量_kg': 55.0,
+                       'カロリー収支_kcal': rng.normal(-300, 100, days),
+                       '体表温偏差_celsius': rng.normal(0, 0.2, days), '体表温トレンド_celsius': np.nan})
+    for window in (7, 14, 28):
+        for col in ('体脂肪量_kg', '筋肉量_kg'):
+            df[f'{col}_ma{window}'] = df[col].rolling(window, min_periods=1).mean()
+    df['体脂肪率_ma7'] = df['体脂肪率'].rolling(7, min_periods=1).mean()
+    return df
+
+
+def test_stall_days_match_engine_at_each_row(tmp_path):
+    engine = HealthAnalyticsEngine(str(tmp_path))
+    df = _history()
+    result = HealthBacktester(engine).run_backtest(df.copy())
+
+    for i in (20, 45, 60, len(df) - 1):
+        expected = HealthAnalyticsEngine(str(tmp_path)).analyze_metabolism_status(df.iloc[:i + 1])['stall_days']
+        assert result['metabolism_analysis.stall_days'].iloc[i] == expected
+
+
+def test_weekly_reduction_ci_uses_report_field(tmp_path):
+    engine = HealthAnalyticsEngine(str(tmp_path))
+    df = _history()
+    result = HealthBacktester(engine).run_backtest(df.copy())
+
+    assert 'kgi_progress.weekly_reduction_rate_ci' in result.columns
+    assert 'kgi_progress.weekly_reduction_rate_ci_low' not in result.columns
+    for i in (10, 40, len(df) - 1):
+        expected = HealthAnalyticsEngine(str(tmp_path)).calculate_kgi_progress(df.iloc[:i + 1])['weekly_reduction_rate_ci']
+        assert result['kgi_progress.weekly_reduction_rate_ci'].iloc[i] == expected
@@ -0,0 +1,124 @@
+import datetime as dt
+import zipfile
+
+import pandas as pd
+import pytest
+
+from export_xml_parser import EXPORT_MEMBER
+from incremental_import import IncrementalImporter
+from source_priority import SourcePriority
+
+CUTOFF = dt.date(2025, 6, 1)
+TARGET_METRICS = {
+    'HKQuantityTypeIdentifierBodyMass': 'weight',
+    'HKQuantityTypeIdentifierDietaryEnergyConsumed': 'intake_cal',
+    'HKQuantityTypeIdentifierStepCount': 'steps',
+    'HKQuantityTypeIdentifierBasalEnergyBurned': 'basal_cal',
+    'HKCategoryTypeIdentifierSleepAnalysis': 'sleep',
+}
+
+
+def _records(first_day: int, last_day: int) -> list:
+    """(type, source, 開始, 終了, 値) の記録（日付は 2025-08-DD）"""
+    records = []
+    for day in range(first_day, last_day + 1):
+        date = f'2025-08-{day:02d}'
+        records += [
+            ('HKQuantityTypeIdentifierBodyMass', 'RENPHO', f'{date} 07:00:00', f'{date} 07:00:00', f'{70 - day * 0.1:.1f}'),
+            ('HKQuantityTypeIdentifierDietaryEnergyConsumed', 'あすけん', f'{date} 12:00:00', f'{date} 12:00:00', '650'),
+            ('HKQuantityTypeIdentifierDietaryEnergyConsumed', 'あすけん', f'{date} 19:00:00', f'{date} 19:00:00', '800'),
+            ('HKQuantityTypeIdentifierStepCount', 'Apple Watch', f'{date} 10:00:00', f'{date} 10:30:00', str(3000 + day)),
+            ('HKQuantityTypeIdentifierStepCount', 'iPhone', f'{date} 10:00:00', f'{date} 10:30:00', '2500'),
+            ('HKQuantityTypeIdentifierBasalEnergyBurned', 'RENPHO', f'{date} 07:00:00', f'{date} 07:00:00', '1500'),
+            ('HKCategoryTypeIdentifierSleepAnalysis', 'Oura', f'{date} 00:30:00', f'{date} 03:30:00',
+             'HKCategoryValueSleepAnalysisAsleepCore'),
+            ('HKCategoryTypeIdentifierSleepAnalysis', 'Oura', f'{date} 03:30:00', f'{date} 06:30:00',
+             'HKCategoryValueSleepAnalysisAsleepDeep'),
+        ]
+    return records
+
+
+def _write_export(path, records) -> str:
+    """書き出しと同じく type ごと・開始時刻順に並べた export.xml を zip に格納"""
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>', '<HealthData locale="ja_JP">',
+             ' <ExportDate value="2025-08-31 00:00:00 +0900"/>']
+    for typ, source, start, end, value in sorted(records, key=lambda r: (r[0], r[2])):
+        lines.append(f' <Record type="{typ}" sourceName="{source}" unit="count" creationDate="{start} +0900" '
+                     f'startDate="{start} +0900" endDate="{end} +0900" value="{value}"/>')
+    lines.append('</HealthData>')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr(EXPORT_MEMBER, '\n'.join(lines) + '\n')
+    return str(path)
+
+
+def _daily(partials) -> pd.DataFrame:
+    return partials.daily_frame(SourcePriority(), metrics=list(TARGET_METRICS.values()))
+
+
+def _assert_same(a, b):
+    pd.testing.assert_frame_equal(_daily(a).reset_index(drop=True), _daily(b).reset_index(drop=True))
+    key = lambda record: (record['start'], record['end'], record['stage'], record['source'])
+    assert sorted(a.sleep_records, key=key) == sorted(b.sleep_records, key=key)
+    assert a.digests == b.digests
+
+
+@pytest.fixture
+def exports(tmp_path):
+    first = _records(1, 14)
+    second = _records(1, 18)
+    # 取り込み済みの期間（さかのぼり期間より前）に遅れて同期・削除された記録と、さかのぼり期間内の編集
+    second.append(('HKQuantityTypeIdentifierStepCount', 'Apple Watch', '2025-08-02 18:00:00', '2025-08-02 18:20:00', '1200'))
+    second.remove(('HKQuantityTypeIdentifierDietaryEnergyConsumed', 'あすけん', '2025-08-03 19:00:00',
+                   '2025-08-03 19:00:00', '800'))
+    second = [r[:4] + ('68.0',) if r[0].endswith('BodyMass') and r[2].startswith('2025-08-13') else r for r in second]
+    return (_write_export(tmp_path / 'export1.zip', first), _write_export(tmp_path / 'export2.zip', second))
+
+
+def test_incremental_import_matches_full_import(tmp_path, exports):
+    first, second = exports
+    importer = IncrementalImporter(str(tmp_path / 'inc'), workers=1)
+    _, changed = importer.run(first, TARGET_METRICS, CUTOFF)
+    assert changed is None
+    importer.commit()
+
+    incremental, changed = importer.run(second, TARGET_METRICS, CUTOFF)
+    importer.commit()
+    full, _ = IncrementalImporter(str(tmp_path / 'full'), workers=1).run(second, TARGET_METRICS, CUTOFF, full=True)
+
+    _assert_same(incremental, full)
+    expected = {dt.date(2025, 8, 2), dt.date(2025, 8, 3), dt.date(2025, 8, 13)} \
+        | {dt.date(2025, 8, day) for day in range(15, 20)}  # 睡眠は起床日の翌日も変更日
+    assert changed == expected
+
+
+def test_changed_dates_are_kept_until_commit(tmp_path, exports):
+    first, second = exports
+    importer = IncrementalImporter(str(tmp_path), workers=1)
+    importer.run(first, TARGET_METRICS, CUTOFF)
+    importer.commit()
+
+    _, changed = importer.run(second, TARGET_METRICS, CUTOFF)
+    # CSV 保存前に失敗した（commit していない）場合は次回も同じ変更日を返す
+    _, retried = importer.run(second, TARGET_METRICS, CUTOFF)
+    assert retried == changed
+    importer.commit()
+    _, unchanged = importer.run(second, TARGET_METRICS, CUTOFF)
+    assert unchanged == set()
+
+
+def test_record_cache_rebuild_matches_parsed_import(tmp_path, exports):
+    first, second = exports
+    importer = IncrementalImporter(str(tmp_path / 'inc'), workers=1)
+    importer.run(first, TARGET_METRICS, CUTOFF)
+    importer.commit()
+    importer.run(second, TARGET_METRICS, CUTOFF)
+    importer.commit()
+
+    full, _ = IncrementalImporter(str(tmp_path / 'full'), workers=1).run(second, TARGET_METRICS, CUTOFF, full=True)
+    # 差分取り込みで更新した記録キャッシュと、全期間解析で作成した記録キャッシュのどちらから集計しても一致
+    for directory in ('inc', 'full'):
+        cache_importer = IncrementalImporter(str(tmp_path / directory), workers=1)
+        assert cache_importer.record_cache.load(IncrementalImporter.fingerprint(second), TARGET_METRICS, CUTOFF) is not None
+        rebuilt, changed = cache_importer.run(second, TARGET_METRICS, CUTOFF, full=True)
+        assert changed is None
+        _assert_same(rebuilt, full)
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from plateau_detector import PlateauDetector
+from training_load import TrainingLoadModel
+
+
+def _body(days: int = 60) -> pd.DataFrame:
+    rng = np.random.default_rng(2)
+    fat = np.concatenate([np.linspace(15.0, 14.0, 30), np.full(days - 30, 14.0)]) + rng.normal(0, 0.03, days)
+    df = pd.DataFrame({'date': pd.date_range('2025-06-01', periods=days, freq='D'), '体脂肪量_kg': fat,
+                       '活動カロリー_kcal': rng.normal(500, 80, days)})
+    df['体脂肪量_kg_ma7'] = df['体脂肪量_kg'].rolling(7, min_periods=1).mean()
+    return df
+
+
+def _workouts(df: pd.DataFrame, days) -> pd.Series:
+    return pd.Series(300.0, index=pd.to_datetime(df['date'].iloc[list(days)]).dt.strftime('%Y-%m-%d'))
+
+
+def test_plateau_online_restarts_before_corrected_dates(tmp_path):
+    df = _body()
+    detector = PlateauDetector(str(tmp_path))
+    for end in (20, 40, 50):
+        detector.update_online(df.iloc[:end])
+
+    # 過去の移動平均が修正され、最終日も再送された取り込み
+    corrected = df.copy()
+    corrected.loc[15:45, '体脂肪量_kg_ma7'] += 0.2
+    corrected = corrected.drop(index=[25])
+    result = detector.update_online(corrected)
+
+    fresh = tmp_path / 'fresh'
+    fresh.mkdir()
+    expected = PlateauDetector(str(fresh)).update_online(corrected)
+    assert result == expected
+    assert detector.online_status() == expected
+
+
+def test_plateau_online_same_day_resend_matches_full(tmp_path):
+    df = _body()
+    detector = PlateauDetector(str(tmp_path))
+    detector.update_online(df)
+    resent = df.copy()
+    resent.loc[len(df) - 1, '体脂肪量_kg_ma7'] += 0.5
+    result = detector.update_online(resent)
+
+    fresh = tmp_path / 'fresh'
+    fresh.mkdir()
+    assert result == PlateauDetector(str(fresh)).update_online(resent)
+
+
+def test_training_load_online_picks_up_rewritten_days_and_late_workouts(tmp_path):
+    df = _body()
+    model = TrainingLoadModel(str(tmp_path))
+    model.update_online(df.iloc[:40], _workouts(df, [5, 12]))
+    model.update_online(df.iloc[:50], _workouts(df, [5, 12, 45]))
+
+    # 複数日分の再送で過去の活動カロリーが変わり、過去日のワークアウトが遅れて同期された
+    rewritten = df.copy()
+    rewritten.loc[20:24, '活動カロリー_kcal'] += 150
+    workouts = _workouts(df, [5, 12, 30, 45])
+    result = model.update_online(rewritten, workouts)
+
+    series = model.series(rewritten, workouts).iloc[-1]
+    assert result['atl_kcal'] == round(series['atl'], 0)
+    assert result['ctl_kcal'] == round(series['ctl'], 0)
+    assert result['tsb_kcal'] == round(series['tsb'], 0)
+    assert result['days'] == len(rewritten)
+
+    fresh = tmp_path / 'fresh'
+    fresh.mkdir()
+    assert result == TrainingLoadModel(str(fresh)).update_online(rewritten, workouts)
+    assert model.status() == result
+
+
+def test_training_load_online_unchanged_input_keeps_state(tmp_path):
+    df = _body()
+    model = TrainingLoadModel(str(tmp_path))
+    first = model.update_online(df)
+    assert model.update_online(df) == first
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import health_data_server
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """一時 reports ディレクトリの移動平均CSVを読むテストクライアント"""
+    rng = np.random.default_rng(3)
+    days = 60
+    df = pd.DataFrame({
+        'date': pd.date_range('2025-06-01', periods=days, freq='D').strftime('%Y-%m-%d'),
+        '体重_kg': 70 - 0.02 * np.arange(days) + rng.normal(0, 0.2, days),
+        '体脂肪率': 20 - 0.02 * np.arange(days) + rng.normal(0, 0.2, days),
+        '摂取カロリー_kcal': rng.normal(2000, 150, days),
+        '消費カロリー_kcal': rng.normal(2400, 150, days),
+    })
+    for col in ('体重_kg', '体脂肪率'):
+        df[f'{col}_ma7'] = df[col].rolling(7, min_periods=1).mean()
+    df['体脂肪量_kg_ma7'] = df['体重_kg_ma7'] * df['体脂肪率_ma7'] / 100
+    df.to_csv(tmp_path / '7日移動平均データ.csv', index=False, encoding='utf-8-sig')
+
+    monkeypatch.setattr(health_data_server, 'REPORTS_DIR', str(tmp_path))
+    return health_data_server.app.test_client()
+
+
+def test_simulate_accepts_default_scenario(client):
+    response = client.get('/simulate?horizon_days=30&paths=200&seed=1')
+    assert response.status_code == 200
+    assert len(response.get_json()['dates']) == 30
+
+
+@pytest.mark.parametrize('query', [
+    'horizon_days=730',
+    'paths=50000',
+    'paths=10000&horizon_days=365',
+    'paths=0',
+    'horizon_days=abc',
+    'seed=x',
+    'balance_basis=unknown',
+])
+def test_simulate_rejects_invalid_or_oversized_requests(client, query):
+    response = client.get(f'/simulate?{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_simulate_post_rejects_oversized_request(client):
+    response = client.post('/simulate', json={'paths': 10000, 'horizon_days': 200})
+    assert response.status_code == 400
+
+
+def test_aggregate_returns_values_for_valid_range(client):
+    response = client.get('/aggregate?metric=摂取カロリー_kcal&start=2025-06-01&end=2025-06-07&fn=count')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('query', [
+    'metric=摂取カロリー_kcal&start=not-a-date',
+    'metric=摂取カロリー_kcal&end=2025-13-40',
+    'metric=摂取カロリー_kcal&fn=median',
+    'metric=unknown_metric',
+    'start=2025-06-01',
+])
+def test_aggregate_rejects_invalid_parameters(client, query):
+    response = client.get(f'/aggregate?{query}')
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
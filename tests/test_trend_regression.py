@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from trend_regression import TrendRegressionEngine
+
+
+def _frame(days: int = 60) -> pd.DataFrame:
+    rng = np.random.default_rng(1)
+    values = 20.0 - 0.03 * np.arange(days) + rng.normal(0, 0.1, days)
+    values[[5, 17, 33]] = np.nan
+    return pd.DataFrame({'date': pd.date_range('2025-06-01', periods=days, freq='D'), '体脂肪率': values})
+
+
+def _fresh(df, method):
+    return TrendRegressionEngine(window=28).rolling_fits(df, '体脂肪率', method)
+
+
+@pytest.mark.parametrize('method', TrendRegressionEngine.METHODS)
+def test_shrinking_frame_reuses_cached_prefix(method):
+    engine = TrendRegressionEngine(window=28)
+    df = _frame()
+    engine.latest_fit(df, '体脂肪率', method)
+
+    for length in (len(df) - 1, 40, 2):
+        shorter = df.iloc[:length]
+        pd.testing.assert_frame_equal(engine.rolling_fits(shorter, '体脂肪率', method), _fresh(shorter, method))
+    assert engine.latest_fit(df.iloc[:-1], '体脂肪率', method) == \
+        TrendRegressionEngine(window=28).latest_fit(df.iloc[:-1], '体脂肪率', method)
+
+    # 縮めた後に元の長さへ戻しても全行一致
+    pd.testing.assert_frame_equal(engine.rolling_fits(df, '体脂肪率', method), _fresh(df, method))
+
+
+@pytest.mark.parametrize('method', TrendRegressionEngine.METHODS)
+def test_edited_and_extended_frames_match_full_refit(method):
+    engine = TrendRegressionEngine(window=28)
+    df = _frame()
+    engine.rolling_fits(df.iloc[:45], '体脂肪率', method)
+
+    edited = df.copy()
+    edited.loc[30, '体脂肪率'] += 0.5
+    edited.loc[40, '体脂肪率'] = np.nan
+    pd.testing.assert_frame_equal(engine.rolling_fits(edited, '体脂肪率', method), _fresh(edited, method))
+
+    # 編集後に短くした入力（編集行より前で切る）
+    pd.testing.assert_frame_equal(engine.rolling_fits(edited.iloc[:25], '体脂肪率', method),
+                                  _fresh(edited.iloc[:25], method))
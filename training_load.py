@@ -0,0 +1,163 @@
+"""
+Training Load - 急性・慢性トレーニング負荷（ATL / CTL / TSB）
+日々の負荷（活動カロリー＋ワークアウト消費カロリー）の指数加重平均で、
+急性負荷 ATL（7日）・慢性負荷 CTL（42日）・コンディション TSB（前日の CTL − ATL）を求める。
+取り込みごとに負荷が変わった日以降だけを1日 O(1) で逐次更新し、状態は JSON に保存する
+"""
+
+import json
+from pathlib import Path
+import pandas as pd
+import numpy as np
+
+
+class TrainingLoadModel:
+    """ATL/CTL/TSB の逐次更新と負荷判定"""
+
+    # 急性/慢性負荷比（ACWR）の判定帯
+    ACWR_BANDS = [(0.8, 'low', '低負荷'), (1.3, 'optimal', '適正'), (1.5, 'high', '高負荷'),
+                  (float('inf'), 'overreaching', '過負荷')]
+
+    def __init__(self, reports_dir: str = "reports", atl_days: int = 7, ctl_days: int = 42,
+                 activity_column: str = '活動カロリー_kcal', workout_weight: float = 1.0):
+        """
+        Args:
+            atl_days: 急性負荷の時定数（日）
+            ctl_days: 慢性負荷の時定数（日）
+            activity_column: 日々の活動カロリー列
+            workout_weight: ワークアウト消費カロリーの上乗せ係数（構造化トレーニングの負荷を重く見る）
+        """
+        self.reports_dir = Path(reports_dir)
+        self.state_file = self.reports_dir / "training_load_state.json"
+        self.atl_days = atl_days
+        self.ctl_days = ctl_days
+        self.activity_column = activity_column
+        self.workout_weight = workout_weight
+
+    # ===== 日々の負荷 =====
+
+    def daily_load(self, df: pd.DataFrame, workout_energy: pd.Series = None) -> pd.Series:
+        """日付ごとの負荷（kcal）。活動カロリーもワークアウトもない日は含めない"""
+        activity = pd.Series(dtype=float)
+        if not df.empty and self.activity_column in df.columns:
+            activity = pd.to_numeric(df[self.activity_column], errors='coerce')
+            activity.index = pd.to_datetime(df['date'])
+            activity = activity.groupby(level=0).last().dropna()
+
+        workouts = workout_energy if workout_energy is not None else pd.Series(dtype=float)
+        workouts = workouts.copy()
+        workouts.index = pd.to_datetime(workouts.index)
+        if not activity.empty:
+            # 日次データの最終日より先のワークアウトは次回の取り込みで反映
+            workouts = workouts[workouts.index <= activity.index.max()]
+
+        dates = activity.index.union(workouts.index)
+        load = activity.reindex(dates).fillna(0.0) + self.workout_weight * workouts.reindex(dates).fillna(0.0)
+        return load.sort_index()
+
+    # ===== 逐次更新（1日 O(1)） =====
+
+    def _step(self, state: dict, date: str, load: float) -> dict:
+        """1日分の更新（初日は負荷そのものを初期値とする）"""
+        if state.get('last_date') is None:
+            return {'last_date': date, 'atl': load, 'ctl': load, 'tsb': 0.0, 'load': load, 'days': 1}
+        atl, ctl = state['atl'], state['ctl']
+        return {
+            'last_date': date,
+            'atl': atl + (load - atl) / self.atl_days,
+            'ctl': ctl + (load - ctl) / self.ctl_days,
+            'tsb': ctl - atl,  # 当日の負荷を受ける前のコンディション
+            'load': load,
+            'days': state['days'] + 1,
+        }
+
+    def _load_state(self) -> dict:
+        if not self.state_file.exists():
+            return {}
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[ERROR] トレーニング負荷状態読み込みエラー: {e}")
+            return {}
+
+    def _save_state(self, state: dict):
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"[ERROR] トレーニング負荷状態保存エラー: {e}")
+
+    def update_online(self, df: pd.DataFrame, workout_energy: pd.Series = None) -> dict:
+        """負荷が変わった日以降だけ ATL/CTL を更新
+
+        前回反映した日々の負荷（seen）との差分開始日を求め、保存済みの状態
+        （base: 最終日より前、current: 最終日まで）のうち変更日より前で終わる状態から再開する。
+        複数日分の再送や後から同期されたワークアウトで過去の負荷が変わった場合も、
+        それより古い状態がなければ全期間から再計算する。
+        """
+        load = self.daily_load(df, workout_energy)
+        if load.empty:
+            return {}
+        dates = load.index.strftime('%Y-%m-%d').tolist()
+        values = load.to_numpy(dtype=float)
+        state = self._load_state()
+        seen = state.get('seen', {})
+
+        # 前回反映した負荷との差分開始日（削除された日付も含む）
+        current_values = dict(zip(dates, values.tolist()))
+        changed = [date for date, value in current_values.items() if seen.get(date) != value]
+        changed += [date for date in seen if date not in current_values]
+        if not changed:
+            return self._summarize(state['current'])
+        first_date = min(changed)
+
+        # 変更日より前で終わる最新の状態から再計算
+        checkpoint = next((c for c in (state.get('current'), state.get('base'))
+                           if c and c.get('last_date') and c['last_date'] < first_date), {})
+        start = int(np.searchsorted(np.array(dates), checkpoint['last_date'], side='right')) if checkpoint else 0
+
+        base = {}
+        for i in range(start, len(values)):
+            if i == len(values) - 1:
+                base = checkpoint
+            checkpoint = self._step(checkpoint, dates[i], float(values[i]))
+        current = checkpoint
+
+        self._save_state({'seen': current_values, 'base': base, 'current': current})
+        return self._summarize(current)
+
+    def status(self) -> dict:
+        """保存済みの最新状態"""
+        current = self._load_state().get('current')
+        return self._summarize(current) if current else {}
+
+    # ===== 全期間計算 =====
+
+    def series(self, df: pd.DataFrame, workout_energy: pd.Series = None) -> pd.DataFrame:
+        """全期間の ATL/CTL/TSB（逐次更新と同じ漸化式をベクトル計算）"""
+        load = self.daily_load(df, workout_energy)
+        if load.empty:
+            return pd.DataFrame(columns=['load', 'atl', 'ctl', 'tsb'])
+        atl = load.ewm(alpha=1 / self.atl_days, adjust=False).mean()
+        ctl = load.ewm(alpha=1 / self.ctl_days, adjust=False).mean()
+        tsb = (ctl - atl).shift(1).fillna(0.0)
+        return pd.DataFrame({'load': load, 'atl': atl, 'ctl': ctl, 'tsb': tsb})
+
+    def _summarize(self, state: dict) -> dict:
+        """状態 → レポート用の値と判定"""
+        acwr = state['atl'] / state['ctl'] if state['ctl'] > 0 else None
+        status, label = 'insufficient_data', 'データ不足'
+        if acwr is not None and state['days'] >= self.atl_days:
+            status, label = next((s, l) for upper, s, l in self.ACWR_BANDS if acwr < upper)
+        return {
+            'last_date': state['last_date'],
+            'daily_load_kcal': round(state['load'], 0),
+            'atl_kcal': round(state['atl'], 0),
+            'ctl_kcal': round(state['ctl'], 0),
+            'tsb_kcal': round(state['tsb'], 0),
+            'acwr': round(acwr, 2) if acwr is not None else None,
+            'status': status,
+            'status_label': label,
+            'days': state['days'],
+        }
@@ -0,0 +1,182 @@
+"""
+Trajectory Simulator - 体脂肪率のモンテカルロ予測（what-if シナリオ）
+カロリー収支・追加活動量のシナリオごとに、履歴から推定した変動を再標本化して
+数千本の経路を NumPy 配列で一括生成し、日ごとのパーセンタイル帯と目標到達確率を返す
+"""
+
+import hashlib
+import json
+from collections import OrderedDict
+import pandas as pd
+import numpy as np
+from tdee_estimator import TDEEEstimator
+
+
+class TrajectorySimulator:
+    """体脂肪量のランダムウォーク（ドリフト＝シナリオ収支 / 7200kcal）による体脂肪率予測"""
+
+    DEFAULT_SCENARIO = {
+        'daily_calorie_balance': -500.0,   # 1日あたりカロリー収支（kcal、負が赤字）
+        'extra_activity_kcal': 0.0,        # 追加の活動消費（kcal/日）
+        'balance_basis': 'device',         # 'device': アプリ表示の収支 / 'model': 推定消費基準
+        'lean_change_per_week': 0.0,       # 除脂肪量の週あたり変化（kg）
+        'horizon_days': 90,
+        'paths': 5000,
+        'seed': None,
+    }
+    PERCENTILES = (5, 25, 50, 75, 95)
+    CACHE_SIZE = 32
+    # 公開エンドポイントから呼ばれるため、経路数×日数（生成する配列の大きさ）を制限する
+    MAX_HORIZON_DAYS = 365
+    MAX_PATHS = 10000
+    MAX_PATH_DAYS = 1_000_000
+
+    def __init__(self, target_body_fat_rate: float = 12.0, tdee_estimator: TDEEEstimator = None):
+        self.target_body_fat_rate = target_body_fat_rate
+        self.energy_per_kg = TDEEEstimator.ENERGY_PER_KG
+        self.tdee_estimator = tdee_estimator or TDEEEstimator()
+        self._cache = OrderedDict()
+
+    # ===== 履歴からの初期状態・変動推定 =====
+
+    def _latest(self, df: pd.DataFrame, columns: list) -> float:
+        """候補列のうち最初に見つかった列の最新有効値"""
+        for col in columns:
+            if col in df.columns:
+                valid = pd.to_numeric(df[col], errors='coerce').dropna()
+                if not valid.empty:
+                    return float(valid.iloc[-1])
+        return None
+
+    def fit_history(self, df: pd.DataFrame) -> dict:
+        """初期状態（体重・体脂肪量）と変動パラメータを履歴から推定"""
+        weight = self._latest(df, ['体重_kg_kf', '体重_kg_ma7', '体重_kg'])
+        rate = self._latest(df, ['体脂肪率_kf', '体脂肪率_ma7', '体脂肪率'])
+        if weight is None or rate is None:
+            return {}
+        fat_mass = weight * rate / 100
+
+        # 週間体脂肪量変化の、直近28日平均トレンドからの残差（日次換算）
+        fat = pd.to_numeric(df.get('体脂肪量_kg_ma7', pd.Series(dtype=float)), errors='coerce').reset_index(drop=True)
+        weekly = fat.diff(7)
+        residuals = (weekly - weekly.rolling(28, min_periods=7).mean()).dropna().to_numpy() / np.sqrt(7)
+        if len(residuals) < 5:
+            residuals = np.array([0.0])
+        residuals = residuals - residuals.mean()  # ドリフトはシナリオ収支のみで与える
+
+        # 推定消費カロリーの不確かさ（直近28日の推定値のばらつき）とデバイス誤差
+        estimates = self.tdee_estimator.estimate(df)
+        recent_tdee = estimates[max(self.tdee_estimator.windows)].dropna().tail(28)
+        tdee_std = max(float(recent_tdee.std()), 50.0) if len(recent_tdee) >= 2 else 150.0
+        summary = self.tdee_estimator.summarize(df)
+        device_bias = summary.get(f'device_bias_{max(self.tdee_estimator.windows)}d') or 0.0
+
+        return {
+            'weight': weight,
+            'fat_mass': fat_mass,
+            'lean_mass': weight - fat_mass,
+            'body_fat_rate': rate,
+            'residuals': residuals,
+            'tdee_std': tdee_std,
+            'device_bias': float(device_bias),
+        }
+
+    def data_version(self, df: pd.DataFrame) -> str:
+        """シミュレーション入力列のハッシュ"""
+        columns = [c for c in ['date', '体重_kg_kf', '体重_kg_ma7', '体重_kg', '体脂肪率_kf', '体脂肪率_ma7',
+                               '体脂肪率', '体脂肪量_kg_ma7', '摂取カロリー_kcal', '消費カロリー_kcal']
+                   if c in df.columns]
+        return hashlib.sha1(pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes()).hexdigest()
+
+    # ===== シミュレーション =====
+
+    def _scenario(self, scenario: dict = None) -> dict:
+        merged = dict(self.DEFAULT_SCENARIO)
+        merged.update({k: v for k, v in (scenario or {}).items() if v is not None})
+        if merged['balance_basis'] not in ('device', 'model'):
+            raise ValueError(f"未対応の収支基準です: {merged['balance_basis']}")
+        for key in ('daily_calorie_balance', 'extra_activity_kcal', 'lean_change_per_week'):
+            merged[key] = float(merged[key])
+        for key in ('horizon_days', 'paths'):
+            merged[key] = int(merged[key])
+        merged['seed'] = int(merged['seed']) if merged['seed'] is not None else None
+        if not 1 <= merged['horizon_days'] <= self.MAX_HORIZON_DAYS or not 1 <= merged['paths'] <= self.MAX_PATHS:
+            raise ValueError(f"horizon_days は1〜{self.MAX_HORIZON_DAYS}、paths は1〜{self.MAX_PATHS}で指定してください")
+        if merged['horizon_days'] * merged['paths'] > self.MAX_PATH_DAYS:
+            raise ValueError(f"paths × horizon_days は{self.MAX_PATH_DAYS:,}以下で指定してください")
+        return merged
+
+    def simulate(self, df: pd.DataFrame, scenario: dict = None) -> dict:
+        """経路を一括生成してパーセンタイル帯を返す
+
+        Returns:
+            {'scenario', 'start', 'dates', 'percentiles': {p: [...]}, 'target_probability', 'target_date_percentiles'}
+        """
+        scenario = self._scenario(scenario)
+        history = self.fit_history(df)
+        if not history:
+            return {}
+
+        rng = np.random.default_rng(scenario['seed'])
+        n_paths, horizon = scenario['paths'], scenario['horizon_days']
+
+        # 実際の収支: デバイス基準の収支はデバイスの消費過大評価分だけ上振れさせる
+        balance = scenario['daily_calorie_balance'] - scenario['extra_activity_kcal']
+        if scenario['balance_basis'] == 'device':
+            balance += history['device_bias']
+
+        # 経路ごとの消費推定誤差（定数）＋日次の残差再標本化
+        path_bias = rng.normal(0.0, history['tdee_std'], size=(n_paths, 1))
+        drift = (balance - path_bias) / self.energy_per_kg
+        noise = rng.choice(history['residuals'], size=(n_paths, horizon))
+        fat = history['fat_mass'] + np.cumsum(drift + noise, axis=1)
+        fat = np.maximum(fat, 0.0)
+
+        lean = history['lean_mass'] + scenario['lean_change_per_week'] / 7 * np.arange(1, horizon + 1)
+        rate = fat / (fat + lean[None, :]) * 100
+
+        bands = np.percentile(rate, self.PERCENTILES, axis=0)
+
+        # 目標到達日（到達しない経路は除外）
+        reached = rate <= self.target_body_fat_rate
+        hit = reached.any(axis=1)
+        first_day = np.argmax(reached, axis=1) + 1
+        last_date = pd.to_datetime(df['date']).max()
+        target_dates = {}
+        if hit.any():
+            for p, day in zip(self.PERCENTILES, np.percentile(first_day[hit], self.PERCENTILES)):
+                target_dates[str(p)] = (last_date + pd.Timedelta(days=int(np.ceil(day)))).strftime('%Y-%m-%d')
+
+        dates = pd.date_range(last_date + pd.Timedelta(days=1), periods=horizon, freq='D')
+        return {
+            'scenario': scenario,
+            'start': {
+                'date': last_date.strftime('%Y-%m-%d'),
+                'body_fat_rate': round(history['body_fat_rate'], 2),
+                'fat_mass_kg': round(history['fat_mass'], 2),
+                'effective_daily_balance': round(balance, 0),
+                'tdee_uncertainty_kcal': round(history['tdee_std'], 0),
+            },
+            'target_body_fat_rate': self.target_body_fat_rate,
+            'dates': dates.strftime('%Y-%m-%d').tolist(),
+            'percentiles': {str(p): np.round(band, 2).tolist() for p, band in zip(self.PERCENTILES, bands)},
+            'target_probability': round(float(hit.mean()), 3),
+            'target_date_percentiles': target_dates,
+        }
+
+    def simulate_cached(self, df: pd.DataFrame, scenario: dict = None) -> dict:
+        """シナリオとデータバージョンが同じ結果を再利用（乱数シード未指定時は固定シードで再現性を確保）"""
+        scenario = self._scenario(scenario)
+        if scenario['seed'] is None:
+            scenario['seed'] = 0
+        key = (self.data_version(df), json.dumps(scenario, sort_keys=True))
+
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        result = self.simulate(df, scenario)
+        self._cache[key] = result
+        if len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return result
@@ -0,0 +1,193 @@
+"""
+Trend Regression Engine - 体組成トレンドの頑健回帰
+OLS / Theil–Sen / Huber の移動窓回帰を全履歴に対して NumPy で一括計算し、
+信頼区間付きの傾き（1日あたり変化量）を返す。結果は入力が変化した行以降のみ再計算する
+"""
+
+import warnings
+import pandas as pd
+import numpy as np
+from statistics import NormalDist
+
+
+def _t_critical(dof: np.ndarray, confidence: float) -> np.ndarray:
+    """t分布の両側臨界値（Cornish-Fisher展開による近似・scipy不要）"""
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    dof = np.asarray(dof, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (z
+             + (z ** 3 + z) / (4 * dof)
+             + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2)
+             + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * dof ** 3))
+    return np.where(dof > 0, t, np.nan)
+
+
+class TrendRegressionEngine:
+    """移動窓トレンド回帰エンジン"""
+
+    METHODS = ('ols', 'theil_sen', 'huber')
+    FIT_COLUMNS = ['slope_per_day', 'level', 'ci_low', 'ci_high', 'n_points']
+
+    def __init__(self, window: int = 28, confidence: float = 0.95, min_points: int = 3,
+                 huber_k: float = 1.345, huber_iterations: int = 20):
+        self.window = window
+        self.confidence = confidence
+        self.min_points = min_points
+        self.huber_k = huber_k
+        self.huber_iterations = huber_iterations
+
+        # (列名, 手法) → {'dates', 'values', 'fits'}
+        self._cache = {}
+
+    # ===== 窓ごとの回帰（n窓 × window点の2次元配列で一括計算） =====
+
+    def _windows(self, x: np.ndarray, y: np.ndarray, first_row: int):
+        """first_row 以降の各行を末尾とする窓を作成（x は窓末尾からの相対日数）"""
+        start = max(first_row - self.window + 1, 0)
+        pad = self.window - 1 - (first_row - start)
+        x_pad = np.concatenate([np.full(pad, np.nan), x[start:]])
+        y_pad = np.concatenate([np.full(pad, np.nan), y[start:]])
+
+        xw = np.lib.stride_tricks.sliding_window_view(x_pad, self.window)
+        yw = np.lib.stride_tricks.sliding_window_view(y_pad, self.window)
+        xw = xw - xw[:, -1:]
+        valid = ~np.isnan(xw) & ~np.isnan(yw)
+        return np.where(valid, xw, 0.0), np.where(valid, yw, 0.0), valid
+
+    def _weighted_fit(self, xw, yw, weights):
+        """重み付き最小二乗（行ごと）: 傾き・切片・傾きの標準誤差"""
+        w_sum = weights.sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_mean = (weights * xw).sum(axis=1) / w_sum
+            y_mean = (weights * yw).sum(axis=1) / w_sum
+            dx = xw - x_mean[:, None]
+            sxx = (weights * dx ** 2).sum(axis=1)
+            slope = (weights * dx * (yw - y_mean[:, None])).sum(axis=1) / sxx
+            intercept = y_mean - slope * x_mean
+            residuals = yw - (intercept[:, None] + slope[:, None] * xw)
+            sigma2 = (weights * residuals ** 2).sum(axis=1) / (w_sum - 2)
+            stderr = np.sqrt(sigma2 / sxx)
+        return slope, intercept, stderr, residuals
+
+    def _fit_ols(self, xw, yw, valid):
+        weights = valid.astype(float)
+        slope, intercept, stderr, _ = self._weighted_fit(xw, yw, weights)
+        margin = _t_critical(valid.sum(axis=1) - 2, self.confidence) * stderr
+        return slope, intercept, slope - margin, slope + margin
+
+    def _fit_huber(self, xw, yw, valid):
+        """Huber回帰（IRLS）。スケールはMADで推定"""
+        weights = valid.astype(float)
+        for _ in range(self.huber_iterations):
+            slope, intercept, _, residuals = self._weighted_fit(xw, yw, weights)
+            abs_res = np.where(valid, np.abs(residuals), np.nan)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                scale = np.nanmedian(abs_res, axis=1) / 0.6745
+            with np.errstate(divide='ignore', invalid='ignore'):
+                u = abs_res / (self.huber_k * scale[:, None])
+                new_weights = np.where(u > 1, 1 / u, 1.0)
+            new_weights = np.where(valid & ~np.isnan(new_weights), new_weights, valid.astype(float))
+            if np.allclose(new_weights, weights, atol=1e-6):
+                break
+            weights = new_weights
+
+        slope, intercept, stderr, _ = self._weighted_fit(xw, yw, weights)
+        margin = _t_critical(valid.sum(axis=1) - 2, self.confidence) * stderr
+        return slope, intercept, slope - margin, slope + margin
+
+    def _fit_theil_sen(self, xw, yw, valid):
+        """Theil–Sen推定（全ペア傾きの中央値）とSenの順位ベース信頼区間"""
+        i, j = np.triu_indices(self.window, 1)
+        pair_valid = valid[:, i] & valid[:, j] & (xw[:, j] != xw[:, i])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = np.where(pair_valid, (yw[:, j] - yw[:, i]) / (xw[:, j] - xw[:, i]), np.nan)
+
+        slopes = np.sort(slopes, axis=1)  # NaNは末尾
+        n_pairs = pair_valid.sum(axis=1)
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            slope = np.nanmedian(slopes, axis=1)
+            intercept = np.nanmedian(np.where(valid, yw - slope[:, None] * xw, np.nan), axis=1)
+
+        m = valid.sum(axis=1)
+        z = NormalDist().inv_cdf(0.5 + self.confidence / 2)
+        c = z * np.sqrt(m * (m - 1) * (2 * m + 5) / 18)
+        lower = np.clip(np.floor((n_pairs - c) / 2).astype(int) - 1, 0, None)
+        upper = np.clip(np.ceil((n_pairs + c) / 2).astype(int), 0, np.maximum(n_pairs - 1, 0))
+        rows = np.arange(len(slopes))
+        return slope, intercept, slopes[rows, lower], slopes[rows, upper]
+
+    def _fit_range(self, x: np.ndarray, y: np.ndarray, method: str, first_row: int) -> pd.DataFrame:
+        """first_row 以降の各行を末尾とする窓の回帰結果"""
+        xw, yw, valid = self._windows(x, y, first_row)
+        fit = {'ols': self._fit_ols, 'theil_sen': self._fit_theil_sen, 'huber': self._fit_huber}[method]
+        slope, level, ci_low, ci_high = fit(xw, yw, valid)
+
+        n_points = valid.sum(axis=1)
+        enough = n_points >= self.min_points
+        return pd.DataFrame({
+            'slope_per_day': np.where(enough, slope, np.nan),
+            'level': np.where(enough, level, np.nan),
+            'ci_low': np.where(enough, ci_low, np.nan),
+            'ci_high': np.where(enough, ci_high, np.nan),
+            'n_points': n_points,
+        })
+
+    # ===== 公開API =====
+
+    def rolling_fits(self, df: pd.DataFrame, column: str, method: str = 'theil_sen') -> pd.DataFrame:
+        """全行の移動窓回帰結果（前回から入力が変わっていない行はキャッシュを再利用）
+
+        Returns:
+            date, slope_per_day, level, ci_low, ci_high, n_points
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"未対応の回帰手法です: {method}")
+        if df.empty or column not in df.columns:
+            return pd.DataFrame(columns=['date'] + self.FIT_COLUMNS)
+
+        dates = pd.to_datetime(df['date']).to_numpy(dtype='datetime64[D]')
+        values = pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float)
+        x = dates.astype(float)
+
+        # 前回入力との差分開始行を特定
+        cached = self._cache.get((column, method))
+        first_row = 0
+        if cached is not None:
+            common = min(len(cached['values']), len(values))
+            same = ((cached['dates'][:common] == dates[:common])
+                    & ((cached['values'][:common] == values[:common])
+                       | (np.isnan(cached['values'][:common]) & np.isnan(values[:common]))))
+            first_row = common if same.all() else int(np.argmin(same))
+
+        if cached is not None and first_row == len(values):
+            # 前回入力と同じか、その先頭部分（末尾行を除いた再計算等）。キャッシュは長い方を残す
+            fits = cached['fits'].iloc[:len(values)]
+        else:
+            new_fits = self._fit_range(x, values, method, first_row)
+            if cached is not None and first_row > 0:
+                fits = pd.concat([cached['fits'].iloc[:first_row], new_fits], ignore_index=True)
+            else:
+                fits = new_fits
+            self._cache[(column, method)] = {'dates': dates, 'values': values, 'fits': fits}
+
+        result = fits.copy()
+        result.insert(0, 'date', pd.to_datetime(dates))
+        return result
+
+    def latest_fit(self, df: pd.DataFrame, column: str, method: str = 'theil_sen') -> dict:
+        """最新行の回帰結果（データ不足時は空dict）"""
+        fits = self.rolling_fits(df, column, method)
+        if fits.empty or pd.isna(fits['slope_per_day'].iloc[-1]):
+            return {}
+        latest = fits.iloc[-1]
+        return {
+            'method': method,
+            'window_days': self.window,
+            'slope_per_day': float(latest['slope_per_day']),
+            'level': float(latest['level']),
+            'ci_low': float(latest['ci_low']),
+            'ci_high': float(latest['ci_high']),
+            'n_points': int(latest['n_points'])
+        }
@@ -5,14 +5,16 @@
 - 既存ロジックを最小限修正のみ
 """
 
-import zipfile
-import xml.etree.ElementTree as ET
 import pandas as pd
 import datetime as dt
 import os
+import sys
 import time
 import requests
 from typing import Dict, List, Optional
+from source_priority import SourcePriority
+from sleep_sessions import SleepSessionEngine
+from incremental_import import IncrementalImporter
 
 def get_oura_temperature_data(start_date_str: str, end_date_str: str) -> pd.DataFrame:
     """
@@ -87,13 +89,11 @@ def get_oura_temperature_data(start_date_str: str, end_date_str: str) -> pd.Data
         return pd.DataFrame()
 
 def wait_for_file_access(filepath, max_wait=30):
-    """ファイルが閉じられるまで待機"""
+    """ファイルが閉じられるまで待機（追記モードで開けるか確認。差分取り込みで使うため内容は消さない）"""
     for i in range(max_wait):
         try:
-            with open(filepath, 'w', encoding='utf-8'):
+            with open(filepath, 'a', encoding='utf-8'):
                 pass
-            if os.path.exists(filepath):
-                os.remove(filepath)
             return True
         except (PermissionError, IOError):
             if i == 0:
@@ -104,8 +104,13 @@ def wait_for_file_access(filepath, max_wait=30):
     print(f"警告: {max_wait}秒待機しましたが、ファイルにアクセスできません")
     return False
 
-def process_health_data():
-    """データ処理（基礎代謝修正 + Oura体表温統合）"""
+def process_health_data(full_rebuild: bool = False):
+    """データ処理（基礎代謝修正 + Oura体表温統合）
+
+    Args:
+        full_rebuild: True の場合はチェックポイントを使わず全期間を集計し直す
+                      （集計ルールの調整後など。同じ書き出しなら記録キャッシュから集計し XML は解析しない）
+    """
     
     os.chdir(r'C:\Users\terada\Desktop\apps\体組成管理app')
     
@@ -115,13 +120,6 @@ def process_health_data():
     cutoff_date = dt.date(2025, 6, 1)
     end_date = dt.date.today()
     
-    # Oura体表温データを最初に取得
-    print("\n=== Oura体表温データ取得 ===")
-    oura_temp_df = get_oura_temperature_data(
-        cutoff_date.strftime("%Y-%m-%d"),
-        end_date.strftime("%Y-%m-%d")
-    )
-    
     # 既存ファイルを上書き
     reports_dir = 'reports'
     if not os.path.exists(reports_dir):
@@ -159,173 +157,49 @@ def process_health_data():
     # 基準日付（2025年6月1日）
     print(f"処理対象: {cutoff_date} 以降のデータのみ")
     
-    # 日付別にデータを蓄積
-    daily_metrics = {}
+    # export.xml を差分解析（前回の取り込み以降のみ）し、(日付, 指標, ソース) ごとの部分集計を取得
+    print("XMLファイル解析中...")
+    daily_file = os.path.join(reports_dir, '日次データ.csv')
+    importer = IncrementalImporter(reports_dir)
+    partials, changed_dates = importer.run("書き出したデータ.zip", target_metrics, cutoff_date, full=full_rebuild)
+    if changed_dates is not None and not os.path.exists(daily_file):
+        changed_dates = None  # 日次データがなければ全日を書き出す
+    if changed_dates is not None and not changed_dates:
+        print("新しいデータはありません（CSVは更新しません）")
+        importer.commit()
+        return
+    # 日付 × 指標の日次の値（最後の値・合計・ソース優先順位を group-by で一括適用）
+    daily_frame = partials.daily_frame(SourcePriority(), metrics=list(target_metrics.values()))
+    sleep_records = partials.sleep_records
+    print(f"XMLファイル処理完了: {partials.count:,} レコード処理, {partials.skipped:,} レコードスキップ, "
+          f"{partials.already:,} レコード取り込み済み")
+    if changed_dates is not None:
+        print(f"更新対象: {len(changed_dates)} 日分 ({min(changed_dates)} 〜 {max(changed_dates)})")
+    
+    # Oura体表温データを取得（差分取り込みでは更新対象の期間のみ）
+    print("\n=== Oura体表温データ取得 ===")
+    oura_start = min(changed_dates) if changed_dates is not None else cutoff_date
+    oura_temp_df = get_oura_temperature_data(
+        oura_start.strftime("%Y-%m-%d"),
+        end_date.strftime("%Y-%m-%d")
+    )
     
-    with zipfile.ZipFile("書き出したデータ.zip") as zf:
-        with zf.open("apple_health_export/export.xml") as xml_file:
-            print("XMLファイル解析中...")
-            
-            count = 0
-            skipped = 0
-            
-            parser = ET.iterparse(xml_file, events=('start', 'end'))
-            
-            for event, elem in parser:
-                if event == 'end' and elem.tag == "Record":
-                    typ = elem.attrib.get("type")
-                    
-                    if typ not in target_metrics:
-                        elem.clear()
-                        continue
-                    
-                    start_date_str = elem.attrib.get("startDate")
-                    if not start_date_str:
-                        elem.clear()
-                        continue
-                    
-                    try:
-                        date_part = start_date_str.split(' ')[0]
-                        year, month, day = map(int, date_part.split('-'))
-                        date = dt.date(year, month, day)
-                        
-                        if date < cutoff_date:
-                            skipped += 1
-                            elem.clear()
-                            continue
-                        
-                        if typ == 'HKCategoryTypeIdentifierSleepAnalysis':
-                            # 睡眠データの処理
-                            start_time = pd.to_datetime(elem.attrib['startDate'])
-                            end_time = pd.to_datetime(elem.attrib['endDate'])
-                            duration_hours = (end_time - start_time).total_seconds() / 3600
-                            sleep_stage = elem.attrib.get("value", "")
-                            source = elem.attrib.get("sourceName", "Unknown")
-                            
-                            if 'Oura' in source:
-                                if ('AsleepCore' in sleep_stage or 
-                                    'AsleepDeep' in sleep_stage or 
-                                    'AsleepREM' in sleep_stage):
-                                    
-                                    sleep_date = date
-                                    if start_time.hour >= 18:
-                                        sleep_date = date + dt.timedelta(days=1)
-                                    
-                                    if 0.001 <= duration_hours <= 12.0:
-                                        value = duration_hours
-                                        metric = target_metrics[typ]
-                                        
-                                        if sleep_date not in daily_metrics:
-                                            daily_metrics[sleep_date] = {}
-                                        if metric not in daily_metrics[sleep_date]:
-                                            daily_metrics[sleep_date][metric] = []
-                                        
-                                        daily_metrics[sleep_date][metric].append({
-                                            'value': value,
-                                            'source': source,
-                                            'stage': sleep_stage
-                                        })
-                                        
-                                        count += 1
-                        else:
-                            # 通常の数値データ処理
-                            value = float(elem.attrib.get("value", 0))
-                            source = elem.attrib.get("sourceName", "Unknown")
-                            metric = target_metrics[typ]
-                            
-                            if date not in daily_metrics:
-                                daily_metrics[date] = {}
-                            if metric not in daily_metrics[date]:
-                                daily_metrics[date][metric] = []
-                            
-                            daily_metrics[date][metric].append({
-                                'value': value,
-                                'source': source
-                            })
-                            
-                            count += 1
-                        
-                    except (ValueError, IndexError):
-                        elem.clear()
-                        continue
-                    
-                    elem.clear()
-            
-            print(f"XMLファイル処理完了: {count:,} レコード処理, {skipped:,} レコードスキップ")
+    # 睡眠: 重なるステージ記録（Oura・Apple Watch等）を統合したセッションを起床日に集計
+    sleep_engine = SleepSessionEngine()
+    sleep_sessions = sleep_engine.from_records(sleep_records)
+    sleep_daily = sleep_engine.daily_summary(sleep_sessions)
+    sleep_by_date = dict(zip(pd.to_datetime(sleep_daily['date']).dt.date, sleep_daily['asleep_hours']))
+    print(f"睡眠セッション: {len(sleep_sessions):,} 件 ({len(sleep_records):,} ステージ記録)")
     
-    # 日次データの集計
+    # 日次データの集計（睡眠だけの日も含める）
     print("\n=== 日次データ集計中 ===")
-    daily_data = []
-    
-    for date in sorted(daily_metrics.keys()):
-        row = {'date': date}
-        
-        # 基本指標の集計
-        for original_key, metric in target_metrics.items():
-            if original_key == 'HKCategoryTypeIdentifierSleepAnalysis':
-                continue
-            
-            if metric in daily_metrics[date]:
-                values = [item['value'] for item in daily_metrics[date][metric]]
-                
-                if metric in ['weight', 'bf_rate', 'muscle', 'body_temp']:
-                    row[metric] = values[-1] if values else None
-                elif metric == 'basal_cal':
-                    # 基礎代謝のシンプルな修正ロジック
-                    sources = daily_metrics[date][metric]
-                    
-                    # RENPHO Healthがあれば優先
-                    renpho_values = [item['value'] for item in sources if 'RENPHO' in item['source']]
-                    if renpho_values:
-                        row[metric] = renpho_values[0]  # RENPHO最初の値のみ
-                    else:
-                        # RENPHO がなければiPhone積算
-                        iphone_values = [item['value'] for item in sources if 'iPhone' in item['source']]
-                        row[metric] = sum(iphone_values) if iphone_values else 0
-                elif metric in ['steps', 'active_cal']:
-                    # 歩数と活動カロリーの重複除去ロジック
-                    sources = daily_metrics[date][metric]
-                    
-                    # データソース優先順位: Oura > Apple Watch > iPhone > その他
-                    priority_order = ['Oura', 'Apple Watch', 'iPhone']
-                    
-                    # 優先順位に基づいて最優先ソースのデータのみを使用
-                    selected_values = None
-                    selected_source = None
-                    
-                    for priority_source in priority_order:
-                        matching_values = [item['value'] for item in sources if priority_source in item['source']]
-                        if matching_values:
-                            selected_values = matching_values
-                            selected_source = priority_source
-                            break
-                    
-                    # 優先ソースが見つからない場合は、その他のソースから最初の値を使用
-                    if selected_values is None:
-                        if sources:
-                            selected_values = [sources[0]['value']]
-                            selected_source = sources[0]['source']
-                    
-                    if selected_values:
-                        # 最優先ソースのデータを積算（同一ソース内での小刻みな計測値の合計）
-                        row[metric] = sum(selected_values)
-                    else:
-                        row[metric] = 0
-                else:
-                    row[metric] = sum(values) if values else 0
-        
-        # 睡眠時間の処理
-        if 'sleep' in daily_metrics[date]:
-            sleep_entries = daily_metrics[date]['sleep']
-            total_sleep_hours = sum(entry['value'] for entry in sleep_entries)
-            row['sleep'] = total_sleep_hours
-        else:
-            row['sleep'] = 0
-        
-        daily_data.append(row)
+    sleep_dates = [date for date in sleep_by_date if date >= cutoff_date and date not in daily_frame.index]
+    df = daily_frame.drop(columns='sleep', errors='ignore')
+    df = df.reindex(df.index.append(pd.Index(sleep_dates, dtype=object))).sort_index()
+    df = df.rename_axis('date').reset_index()
     
-    # DataFrameに変換
-    df = pd.DataFrame(daily_data)
+    # 睡眠時間の処理（セッション統合済み）
+    df['sleep'] = [sleep_by_date.get(date, 0) for date in df['date']]
     
     if df.empty:
         print("データがありません。")
@@ -383,6 +257,19 @@ def process_health_data():
     final_df['食物繊維_g'] = df['fiber'].round(1)
     final_df['脂質_g'] = df['fat'].round(1)
     
+    # 差分取り込み: 更新対象の日だけ既存の日次データに反映
+    if changed_dates is not None:
+        existing_df = pd.read_csv(daily_file, encoding='utf-8-sig')
+        existing_df['date'] = pd.to_datetime(existing_df['date']).dt.date
+        kept_df = existing_df[~existing_df['date'].isin(changed_dates)].copy()
+        # 睡眠セッションは日をまたぐため、変更日以外の日も睡眠時間だけは今回の集計を使う
+        sleep_hours = dict(zip(final_df['date'], final_df['睡眠時間_hours']))
+        kept_df['睡眠時間_hours'] = [sleep_hours.get(date, hours)
+                                 for date, hours in zip(kept_df['date'], kept_df['睡眠時間_hours'])]
+        updated_df = final_df[final_df['date'].isin(changed_dates)]
+        final_df = pd.concat([kept_df, updated_df], ignore_index=True).sort_values('date').reset_index(drop=True)
+        print(f"日次データ統合: {len(updated_df)} 日更新, {len(kept_df)} 日は既存データを使用")
+    
     # 7日移動平均の計算
     print("\n=== 7日移動平均計算中 ===")
     ma_df = final_df.copy()
@@ -392,7 +279,6 @@ def process_health_data():
         ma_df[f'{col}_ma7'] = ma_df[col].rolling(window=7, min_periods=1).mean().round(2)
     
     # ファイル保存
-    daily_file = os.path.join(reports_dir, '日次データ.csv')
     final_df.to_csv(daily_file, index=False, encoding='utf-8-sig')
     print(f"日次データ保存: {daily_file}")
     
@@ -404,6 +290,9 @@ def process_health_data():
     print("\n=== インデックス処理中 ===")
     create_index_data(ma_df)
     
+    # CSV に反映できたので取り込み結果を確定（途中で失敗した場合は次回も同じ変更日を書き直す）
+    importer.commit()
+    
     # 修正結果の確認
     print(f"\n=== 基礎代謝修正結果確認 ===")
     problem_dates = [dt.date(2025, 8, 1), dt.date(2025, 7, 29)]
@@ -503,4 +392,4 @@ def create_index_data(ma_df):
     print(f"インデックスデータ保存: {index_file}")
 
 if __name__ == "__main__":
-    process_health_data()
+    process_health_data(full_rebuild='--full' in sys.argv)
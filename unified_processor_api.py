@@ -14,6 +14,11 @@ import requests
 from typing import Dict, List, Optional
 import glob
 from pathlib import Path
+from sleep_sessions import SleepSessionEngine
+from unit_registry import UnitRegistry
+from day_bucketing import DEFAULT_BUCKETER
+
+UNIT_REGISTRY = UnitRegistry()
 
 def load_health_api_data(data_dir: str = "health_api_data") -> pd.DataFrame:
     """
@@ -82,15 +87,32 @@ def process_health_api_data(api_data: Dict) -> pd.DataFrame:
         
         column_name = metric_mapping[name]
         
+        # 値は units で既定単位（kg・kcal・時間・g）へ換算し、換算できない単位のメトリクスはスキップ
+        units = metric.get('units')
+        factor = UNIT_REGISTRY.factor(column_name, units)
+        if factor is None:
+            print(f"⚠️ 未対応の単位のためスキップ: {name} ({units})")
+            continue
+        
+        if name == 'sleep_analysis':
+            # 睡眠時間は重なるステージ記録を統合したセッション単位で起床日に集計（時間単位）
+            # 集計済み形式の値は units がなければ従来どおり分として扱う
+            summary_factor = factor if units else 1 / 60
+            for date_str, hours in SleepSessionEngine().daily_hours_from_hae(data_points, summary_factor).items():
+                date_obj = dt.date.fromisoformat(date_str)
+                if date_obj not in daily_data:
+                    daily_data[date_obj] = {'date': date_obj}
+                daily_data[date_obj][column_name] = hours
+            continue
+        
         for point in data_points:
             date_str = point.get('date', '')
             if not date_str:
                 continue
             
-            # 日付解析
-            try:
-                date_obj = pd.to_datetime(date_str).date()
-            except:
+            # 日付解析（ホームタイムゾーンの日付）
+            date_obj = DEFAULT_BUCKETER.local_date(date_str)
+            if date_obj is None:
                 continue
             
             # 日付別データ初期化
@@ -98,13 +120,8 @@ def process_health_api_data(api_data: Dict) -> pd.DataFrame:
                 daily_data[date_obj] = {'date': date_obj}
             
             # 値の処理
-            if name == 'sleep_analysis':
-                # 睡眠時間は特別処理（時間単位に変換）
-                asleep_minutes = point.get('asleep', 0)
-                daily_data[date_obj][column_name] = asleep_minutes / 60.0 if asleep_minutes else 0
-            else:
-                qty = point.get('qty', 0)
-                daily_data[date_obj][column_name] = qty
+            qty = point.get('qty', 0)
+            daily_data[date_obj][column_name] = qty * factor if qty is not None and factor != 1.0 else qty
     
     # DataFrameに変換
     df = pd.DataFrame(list(daily_data.values()))
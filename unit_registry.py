@@ -0,0 +1,83 @@
+"""
+Unit Registry - 受信メトリクスの単位正規化
+HAEはデバイス設定により体重を lb、エネルギーを kJ、睡眠を分で送ることがあるため、
+(CSVカラム, 単位) → 換算係数 の表で既定単位（kg・kcal・時間・g・km）に揃える。
+単位はメトリクス単位で指定されるため、換算は値配列への係数1回の乗算で行う
+"""
+
+from typing import Dict, List, Any, Optional
+import numpy as np
+
+
+class UnitRegistry:
+    """(カラム, 単位) → 既定単位への換算"""
+
+    # 単位系ごとの換算係数（既定単位 = 1.0）
+    FAMILIES = {
+        'mass_kg': {'kg': 1.0, 'g': 0.001, 'lb': 0.45359237, 'lbs': 0.45359237, 'st': 6.35029318},
+        'energy_kcal': {'kcal': 1.0, 'Cal': 1.0, 'kJ': 1 / 4.184, 'kj': 1 / 4.184, 'J': 1 / 4184},
+        'duration_hours': {'hr': 1.0, 'h': 1.0, 'hours': 1.0, 'min': 1 / 60, 'minutes': 1 / 60,
+                           's': 1 / 3600, 'sec': 1 / 3600},
+        'mass_g': {'g': 1.0, 'mg': 0.001, 'mcg': 1e-6, 'kg': 1000.0, 'oz': 28.349523125},
+        'distance_km': {'km': 1.0, 'm': 0.001, 'mi': 1.609344, 'yd': 0.0009144, 'ft': 0.0003048},
+        'count': {'count': 1.0, 'steps': 1.0},
+        'percent': {'%': 1.0},
+    }
+
+    COLUMN_FAMILIES = {
+        '体重_kg': 'mass_kg',
+        '筋肉量_kg': 'mass_kg',
+        '体脂肪率': 'percent',
+        '摂取カロリー_kcal': 'energy_kcal',
+        '基礎代謝_kcal': 'energy_kcal',
+        '活動カロリー_kcal': 'energy_kcal',
+        '歩数': 'count',
+        '睡眠時間_hours': 'duration_hours',
+        'タンパク質_g': 'mass_g',
+        '糖質_g': 'mass_g',
+        '食物繊維_g': 'mass_g',
+        '脂質_g': 'mass_g',
+        'energy_kcal': 'energy_kcal',
+        'distance_km': 'distance_km',
+    }
+
+    def __init__(self, families: Dict[str, Dict[str, float]] = None, column_families: Dict[str, str] = None):
+        self.families = families or self.FAMILIES
+        self.column_families = column_families or self.COLUMN_FAMILIES
+        # 大文字小文字違い（"KG", "Lb" 等）の照合用。"Cal"（=kcal）と "cal" は区別するため完全一致を優先
+        self._lowered = {family: {unit.lower(): factor for unit, factor in table.items()}
+                         for family, table in self.families.items()}
+
+    def factor(self, column: str, units: Optional[str]) -> Optional[float]:
+        """換算係数（単位未指定・単位系未登録のカラムは 1.0、未知の単位は None）"""
+        family = self.column_families.get(column)
+        if family is None or units is None or str(units).strip() == '':
+            return 1.0
+        units = str(units).strip()
+        table = self.families[family]
+        if units in table:
+            return table[units]
+        return self._lowered[family].get(units.lower())
+
+    def convert(self, values: np.ndarray, column: str, units: Optional[str]) -> Optional[np.ndarray]:
+        """値配列を既定単位へ換算（未知の単位は None）"""
+        factor = self.factor(column, units)
+        if factor is None:
+            return None
+        return values if factor == 1.0 else np.asarray(values, dtype=float) * factor
+
+    def convert_value(self, value: Optional[float], column: str, units: Optional[str]) -> Optional[float]:
+        """単一値の換算（未知の単位・欠損は None）"""
+        factor = self.factor(column, units)
+        if value is None or factor is None:
+            return None
+        return value * factor
+
+    def unknown_units(self, metrics: List[Dict[str, Any]], metric_mapping: Dict[str, str]) -> List[Dict[str, str]]:
+        """換算できない単位のメトリクス一覧 [{'metric', 'column', 'units'}]"""
+        unknown = []
+        for metric in metrics:
+            column = metric_mapping.get(metric.get('name', ''))
+            if column is not None and self.factor(column, metric.get('units')) is None:
+                unknown.append({'metric': metric.get('name', ''), 'column': column, 'units': metric.get('units')})
+        return unknown
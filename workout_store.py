@@ -0,0 +1,195 @@
+"""
+Workout Store - HAEワークアウトの追記型保存と日付インデックス
+受信ペイロードのワークアウトを開始・終了・種目・消費カロリー・距離・平均心拍の
+コンパクトな表に変換し、CSVへ追記のみで保存する。再送ペイロードはワークアウトIDで重複除去し、
+日付インデックス（日付 → 行番号）で期間指定の読み出しを行う（生JSONの再読込は不要）
+"""
+
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+import pandas as pd
+from unit_registry import UnitRegistry
+from day_bucketing import DayBucketer, DEFAULT_BUCKETER
+
+
+class WorkoutStore:
+    """ワークアウト表の追記・重複除去・期間検索"""
+
+    COLUMNS = ['workout_id', 'date', 'start', 'end', 'type', 'duration_min',
+               'energy_kcal', 'distance_km', 'avg_heart_rate', 'source']
+
+    # HAEのバージョン・設定で項目名が異なるため、候補を順に参照
+    ENERGY_FIELDS = ['activeEnergyBurned', 'activeEnergy', 'totalEnergy']
+    DISTANCE_FIELDS = ['distance']
+    HEART_RATE_FIELDS = ['avgHeartRate', 'heartRate']
+
+    def __init__(self, reports_dir: str = "reports", unit_registry: UnitRegistry = None,
+                 day_bucketer: DayBucketer = None):
+        self.reports_dir = Path(reports_dir)
+        self.units = unit_registry or UnitRegistry()
+        self.day_bucketer = day_bucketer or DEFAULT_BUCKETER
+        self.table_path = self.reports_dir / "ワークアウトデータ.csv"
+        self.index_path = self.reports_dir / "workout_index.json"
+
+    # ===== 変換 =====
+
+    def _quantity(self, workout: Dict[str, Any], fields: List[str], column: str = None) -> Optional[float]:
+        """{"qty": 値} 形式・数値・{"avg": {"qty": 値}} 形式のいずれかから数値を取り出す
+
+        column を指定すると {"units": ...} に従って既定単位へ換算する（kJ → kcal、mi → km 等）
+        """
+        for field in fields:
+            value = workout.get(field)
+            units = None
+            if isinstance(value, dict):
+                units = value.get('units')
+                if 'qty' in value:
+                    value = value['qty']
+                elif isinstance(value.get('avg'), dict):
+                    units = value['avg'].get('units', units)
+                    value = value['avg'].get('qty')
+                else:
+                    value = value.get('avg')
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return self.units.convert_value(float(value), column, units) if column else float(value)
+        return None
+
+    def workout_id(self, workout: Dict[str, Any]) -> str:
+        """HAEのワークアウトID（なければ種目・開始・終了のハッシュ）"""
+        if workout.get('id'):
+            return str(workout['id'])
+        key = f"{workout.get('name', '')}|{workout.get('start', '')}|{workout.get('end', '')}"
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+    def to_rows(self, workouts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """HAEワークアウト → 保存用の行（開始時刻のないものは除外）
+
+        開始・終了はホームタイムゾーンの現地時刻、日付は開始時刻の日（1日の開始時刻を反映）
+        """
+        if not workouts:
+            return []
+        start_strs = [str(w.get('start', '')) for w in workouts]
+        starts = self.day_bucketer.local_timestamps(start_strs)
+        ends = self.day_bucketer.local_timestamps([str(w.get('end', '')) for w in workouts])
+        days = self.day_bucketer.day_keys(start_strs)[0]
+
+        rows = []
+        for workout, start, end, day in zip(workouts, starts, ends, days.tolist()):
+            if pd.isna(start):
+                continue
+
+            duration = workout.get('duration')
+            if isinstance(duration, (int, float)):
+                duration_min = duration / 60
+            elif pd.notna(end):
+                duration_min = (end - start).total_seconds() / 60
+            else:
+                duration_min = None
+
+            rows.append({
+                'workout_id': self.workout_id(workout),
+                'date': f"{day // 10000:04d}-{day // 100 % 100:02d}-{day % 100:02d}",
+                'start': start.strftime('%Y-%m-%d %H:%M:%S'),
+                'end': end.strftime('%Y-%m-%d %H:%M:%S') if pd.notna(end) else None,
+                'type': workout.get('name', 'Unknown'),
+                'duration_min': round(duration_min, 1) if duration_min is not None else None,
+                'energy_kcal': self._quantity(workout, self.ENERGY_FIELDS, 'energy_kcal'),
+                'distance_km': self._quantity(workout, self.DISTANCE_FIELDS, 'distance_km'),
+                'avg_heart_rate': self._quantity(workout, self.HEART_RATE_FIELDS),
+                'source': workout.get('source') or 'HAE',
+            })
+        return rows
+
+    # ===== インデックス =====
+
+    def load_index(self) -> dict:
+        """{'rows': 保存行数, 'ids': [ワークアウトID], 'dates': {日付: [行番号]}}"""
+        if self.index_path.exists():
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        if self.table_path.exists():
+            return self.rebuild_index()
+        return {'rows': 0, 'ids': [], 'dates': {}}
+
+    def rebuild_index(self) -> dict:
+        """保存済みの表からインデックスを作り直す"""
+        table = pd.read_csv(self.table_path, encoding='utf-8-sig', dtype={'workout_id': str})
+        index = {'rows': len(table), 'ids': table['workout_id'].tolist(), 'dates': {}}
+        for row_number, date_value in enumerate(table['date']):
+            index['dates'].setdefault(date_value, []).append(row_number)
+        self._save_index(index)
+        return index
+
+    def _save_index(self, index: dict):
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False)
+
+    # ===== 追記・検索 =====
+
+    def append(self, workouts: List[Dict[str, Any]]) -> dict:
+        """未保存のワークアウトのみ表に追記
+
+        Returns:
+            {'received': 受信数, 'added': 追記数, 'duplicates': 重複数}
+        """
+        rows = self.to_rows(workouts or [])
+        index = self.load_index()
+        known = set(index['ids'])
+
+        new_rows = []
+        for row in rows:
+            if row['workout_id'] in known:
+                continue
+            known.add(row['workout_id'])
+            new_rows.append(row)
+
+        if new_rows:
+            self.reports_dir.mkdir(parents=True, exist_ok=True)
+            frame = pd.DataFrame(new_rows, columns=self.COLUMNS)
+            write_header = not self.table_path.exists()
+            frame.to_csv(self.table_path, mode='a', header=write_header, index=False,
+                         encoding='utf-8-sig' if write_header else 'utf-8')
+
+            for offset, row in enumerate(new_rows):
+                index['dates'].setdefault(row['date'], []).append(index['rows'] + offset)
+                index['ids'].append(row['workout_id'])
+            index['rows'] += len(new_rows)
+            self._save_index(index)
+
+        result = {'received': len(workouts or []), 'added': len(new_rows), 'duplicates': len(rows) - len(new_rows)}
+        if workouts:
+            print(f"[INFO] ワークアウト保存: {result['added']}件追加 / {result['duplicates']}件重複")
+        return result
+
+    def query(self, start_date=None, end_date=None, workout_type: str = None) -> pd.DataFrame:
+        """期間内のワークアウト（開始日で判定、開始時刻順）。インデックスで該当行のみ読み出す"""
+        if not self.table_path.exists():
+            return pd.DataFrame(columns=self.COLUMNS)
+
+        index = self.load_index()
+        start = str(pd.to_datetime(start_date).date()) if start_date is not None else None
+        end = str(pd.to_datetime(end_date).date()) if end_date is not None else None
+        wanted = sorted(
+            row for date_value, row_numbers in index['dates'].items()
+            if (start is None or date_value >= start) and (end is None or date_value <= end)
+            for row in row_numbers
+        )
+        if not wanted:
+            return pd.DataFrame(columns=self.COLUMNS)
+
+        wanted_lines = {row + 1 for row in wanted}  # 先頭行はヘッダー
+        table = pd.read_csv(self.table_path, encoding='utf-8-sig', dtype={'workout_id': str},
+                            skiprows=lambda line: line != 0 and line not in wanted_lines)
+        if workout_type is not None:
+            table = table[table['type'] == workout_type]
+        return table.sort_values('start').reset_index(drop=True)
+
+    def daily_energy(self, start_date=None, end_date=None) -> pd.Series:
+        """日ごとのワークアウト消費カロリー合計（日付インデックスの Series）"""
+        table = self.query(start_date, end_date)
+        if table.empty:
+            return pd.Series(dtype=float)
+        energy = pd.to_numeric(table['energy_kcal'], errors='coerce').fillna(0.0)
+        return energy.groupby(pd.to_datetime(table['date'])).sum()